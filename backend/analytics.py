@@ -0,0 +1,327 @@
+"""Hourly and daily activity rollups per hospital.
+
+`analytics_hourly` and `analytics_daily` hold, per hospital and bucket,
+appointments booked, bed reservations made, lab orders placed and reports
+completed (with the summed order-to-report turnaround), plus the peak and
+closing bed occupancy. The triggers below keep them current inside the same
+transaction as every write to appointments, bed_reservations, reports and
+bed_summary, so the analytics endpoint reads a few hundred bucket rows
+instead of scanning the raw tables.
+
+Raw timestamps are UTC (CURRENT_TIMESTAMP); buckets are in the server's
+local time, like the dates the app writes. Appointments booked before
+`appointments.created_at` existed only have a date, so they count in the
+daily buckets only. Occupancy has no history in the raw tables: it is
+recorded as beds change from now on.
+
+Run as a script to backfill the rollups from the raw tables, or to report
+drift without rewriting anything:
+
+    python backend/analytics.py [--dry-run]
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from database import connect
+
+COUNTERS = ('appointments', 'reservations', 'lab_orders', 'lab_reports', 'turnaround_hours', 'turnaround_count')
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+PEAK_WINDOW_HOURS = 4
+
+# Bucket expression per rollup table, for a UTC timestamp.
+GRAINS = {
+    'analytics_hourly': ("hour", "strftime('%Y-%m-%d %H:00', {ts}, 'localtime')"),
+    'analytics_daily': ("day", "date({ts}, 'localtime')"),
+}
+
+_TABLE = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    hospital_id INTEGER NOT NULL,
+    {bucket} TEXT NOT NULL,
+    appointments INTEGER NOT NULL DEFAULT 0,
+    reservations INTEGER NOT NULL DEFAULT 0,
+    lab_orders INTEGER NOT NULL DEFAULT 0,
+    lab_reports INTEGER NOT NULL DEFAULT 0,
+    turnaround_hours REAL NOT NULL DEFAULT 0,
+    turnaround_count INTEGER NOT NULL DEFAULT 0,
+    occupied_max INTEGER,
+    occupied_last INTEGER,
+    beds_total INTEGER,
+    PRIMARY KEY (hospital_id, {bucket})
+) WITHOUT ROWID;
+'''
+
+SCHEMA = ''.join(_TABLE.format(table=table, bucket=bucket) for table, (bucket, _) in GRAINS.items())
+
+# What each source row contributes: (UTC timestamp, or a bucket expression per
+# rollup table, {counter: value}). `{r}` is the row (NEW, OLD or a table alias).
+_SOURCES = {
+    'appointments': [
+        ({'analytics_hourly': "strftime('%Y-%m-%d %H:00', {r}.created_at, 'localtime')",
+          'analytics_daily': "COALESCE(date({r}.created_at, 'localtime'), date({r}.date))"},
+         {'appointments': '1'}),
+    ],
+    'bed_reservations': [
+        ("{r}.timestamp", {'reservations': '1'}),
+    ],
+    'reports': [
+        ("{r}.ordered_at", {'lab_orders': '1'}),
+        ("{r}.completed_at", {
+            'lab_reports': '1',
+            'turnaround_hours': "COALESCE((julianday({r}.completed_at) - julianday({r}.ordered_at)) * 24, 0)",
+            'turnaround_count': "({r}.ordered_at IS NOT NULL)",
+        }),
+    ],
+}
+
+# Columns whose change moves a row's contribution to another bucket.
+_WATCHED = {
+    'appointments': 'hospital_id, created_at, date',
+    'bed_reservations': 'hospital_id, timestamp',
+    'reports': 'hospital_id, ordered_at, completed_at',
+}
+
+
+def _bucket_sql(table, ts, row):
+    expr = ts[table] if isinstance(ts, dict) else GRAINS[table][1].format(ts=ts)
+    return expr.format(r=row)
+
+
+def _add(source, row='NEW'):
+    statements = []
+    for table, (bucket, _) in GRAINS.items():
+        for ts, values in _SOURCES[source]:
+            columns = ', '.join(values)
+            select = ', '.join(v.format(r=row) for v in values.values())
+            updates = ', '.join(f'{c} = {c} + excluded.{c}' for c in values)
+            statements.append(f'''
+    INSERT INTO {table} (hospital_id, {bucket}, {columns})
+    SELECT {row}.hospital_id, b, {select} FROM (SELECT {_bucket_sql(table, ts, row)} AS b)
+    WHERE {row}.hospital_id IS NOT NULL AND b IS NOT NULL
+    ON CONFLICT (hospital_id, {bucket}) DO UPDATE SET {updates};''')
+    return ''.join(statements)
+
+
+def _subtract(source, row='OLD'):
+    statements = []
+    for table, (bucket, _) in GRAINS.items():
+        for ts, values in _SOURCES[source]:
+            updates = ', '.join(f'{c} = {c} - {v.format(r=row)}' for c, v in values.items())
+            statements.append(f'''
+    UPDATE {table} SET {updates}
+    WHERE hospital_id = {row}.hospital_id AND {bucket} = {_bucket_sql(table, ts, row)};''')
+    return ''.join(statements)
+
+
+def _record_occupancy(previous):
+    """Upsert the hospital's current occupancy into the current buckets.
+
+    bed_summary moves in two steps per beds update (subtract the old row,
+    add the new one); the intermediate level is never above the previous
+    one, so it cannot inflate occupied_max.
+    """
+    statements = []
+    for table, (bucket, expr) in GRAINS.items():
+        statements.append(f'''
+    INSERT INTO {table} (hospital_id, {bucket}, occupied_max, occupied_last, beds_total)
+    SELECT NEW.hospital_id, {expr.format(ts="'now'")}, MAX({previous}, NEW.total_count - NEW.available_count),
+        NEW.total_count - NEW.available_count, NEW.total_count
+    WHERE NEW.hospital_id IS NOT NULL
+    ON CONFLICT (hospital_id, {bucket}) DO UPDATE SET
+        occupied_max = MAX(COALESCE(occupied_max, 0), excluded.occupied_max),
+        occupied_last = excluded.occupied_last,
+        beds_total = excluded.beds_total;''')
+    return ''.join(statements)
+
+
+TRIGGERS = ''.join(f'''
+CREATE TRIGGER IF NOT EXISTS {source}_analytics_insert AFTER INSERT ON {source}
+BEGIN {_add(source)} END;
+
+CREATE TRIGGER IF NOT EXISTS {source}_analytics_delete AFTER DELETE ON {source}
+BEGIN {_subtract(source)} END;
+
+CREATE TRIGGER IF NOT EXISTS {source}_analytics_update AFTER UPDATE OF {_WATCHED[source]} ON {source}
+BEGIN {_subtract(source)} {_add(source)} END;
+''' for source in _SOURCES) + f'''
+CREATE TRIGGER IF NOT EXISTS bed_summary_analytics_insert AFTER INSERT ON bed_summary
+BEGIN {_record_occupancy('NEW.total_count - NEW.available_count')} END;
+
+CREATE TRIGGER IF NOT EXISTS bed_summary_analytics_update AFTER UPDATE OF total_count, available_count ON bed_summary
+BEGIN {_record_occupancy('OLD.total_count - OLD.available_count')} END;
+'''
+
+
+def _expected(conn, table):
+    """{(hospital_id, bucket): {counter: value}} recomputed from the raw tables."""
+    expected = {}
+    for source, contributions in _SOURCES.items():
+        for ts, values in contributions:
+            select = ', '.join(f'SUM({v.format(r="s")})' for v in values.values())
+            rows = conn.execute(f'''
+                SELECT s.hospital_id, {_bucket_sql(table, ts, "s")} AS b, {select}
+                FROM {source} s WHERE s.hospital_id IS NOT NULL  -- full scan
+                GROUP BY 1, 2 HAVING b IS NOT NULL
+            ''')
+            for hospital_id, bucket, *sums in rows:
+                counters = expected.setdefault((hospital_id, bucket), dict.fromkeys(COUNTERS, 0))
+                for counter, value in zip(values, sums):
+                    counters[counter] += value
+    return expected
+
+
+def find_drift(conn):
+    """Return [(table, key, stored, expected)] for every bucket whose counters disagree with the raw tables."""
+    drift = []
+    for table, (bucket, _) in GRAINS.items():
+        expected = _expected(conn, table)
+        stored = {(r[0], r[1]): dict(zip(COUNTERS, r[2:]))
+                  for r in conn.execute(f'SELECT hospital_id, {bucket}, {", ".join(COUNTERS)} FROM {table}')}
+        zero = dict.fromkeys(COUNTERS, 0)
+        for key in expected.keys() | stored.keys():
+            have, want = stored.get(key, zero), expected.get(key, zero)
+            # Turnaround sums are REAL; ignore float noise from add/subtract.
+            if any(abs(have[c] - want[c]) > 1e-6 for c in COUNTERS):
+                drift.append((table, key, have, want))
+    return drift
+
+
+def rebuild(conn):
+    """Recompute every counter from the raw tables in the current transaction.
+
+    Occupancy history is kept; the current level is recorded for this hour.
+    """
+    for table, (bucket, expr) in GRAINS.items():
+        conn.execute(f'UPDATE {table} SET {", ".join(f"{c} = 0" for c in COUNTERS)}')
+        conn.executemany(f'''
+            INSERT INTO {table} (hospital_id, {bucket}, {", ".join(COUNTERS)}) VALUES (?, ?, {", ".join("?" * len(COUNTERS))})
+            ON CONFLICT (hospital_id, {bucket}) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in COUNTERS)}
+        ''', ((hospital_id, key, *counters.values()) for (hospital_id, key), counters in _expected(conn, table).items()))
+        conn.execute(f'''
+            INSERT INTO {table} (hospital_id, {bucket}, occupied_max, occupied_last, beds_total)
+            SELECT hospital_id, {expr.format(ts="'now'")}, total_count - available_count, total_count - available_count, total_count
+            FROM bed_summary WHERE true  -- full scan
+            ON CONFLICT (hospital_id, {bucket}) DO UPDATE SET
+                occupied_max = MAX(COALESCE(occupied_max, 0), excluded.occupied_max),
+                occupied_last = excluded.occupied_last,
+                beds_total = excluded.beds_total
+        ''')
+        conn.execute(f'''
+            DELETE FROM {table} WHERE occupied_last IS NULL AND {" AND ".join(f"{c} = 0" for c in COUNTERS)}  -- full scan
+        ''')
+
+
+def _hour_label(hour):
+    return datetime(2000, 1, 1, hour % 24).strftime('%I %p').lstrip('0')
+
+
+def peak_hours(profile, width=PEAK_WINDOW_HOURS):
+    """The busiest `width`-hour stretch of a 24-slot hour-of-day profile, e.g. '10 AM - 2 PM'."""
+    if not any(profile):
+        return None
+    start = max(range(24), key=lambda h: sum(profile[(h + i) % 24] for i in range(width)))
+    return f'{_hour_label(start)} - {_hour_label(start + width)}'
+
+
+def hospital_report(conn, hospital_id, days=DEFAULT_DAYS, now=None):
+    """Summary, hour-of-day profile and daily trend for the last `days` days, from the rollups."""
+    now = now or datetime.now()
+    first_day = (now - timedelta(days=days - 1)).date()
+    since_day, since_hour = first_day.isoformat(), f'{first_day.isoformat()} 00:00'
+
+    profile = [0] * 24
+    for hour, arrivals in conn.execute('''
+        SELECT CAST(substr(hour, 12, 2) AS INTEGER), SUM(appointments + reservations + lab_orders)
+        FROM analytics_hourly WHERE hospital_id = ? AND hour >= ? GROUP BY 1
+    ''', (hospital_id, since_hour)):
+        profile[hour] = arrivals
+
+    # Time-weighted utilization: each hour's closing occupancy holds until the
+    # next change, starting from the last level recorded before the window.
+    changes = conn.execute('''
+        SELECT hour, occupied_last, beds_total FROM analytics_hourly
+        WHERE hospital_id = ? AND hour >= ? AND occupied_last IS NOT NULL ORDER BY hour
+    ''', (hospital_id, since_hour)).fetchall()
+    before = conn.execute('''
+        SELECT occupied_last, beds_total FROM analytics_hourly
+        WHERE hospital_id = ? AND hour < ? AND occupied_last IS NOT NULL
+        ORDER BY hour DESC LIMIT 1
+    ''', (hospital_id, since_hour)).fetchone()
+    level, since = (tuple(before) if before else None), datetime.combine(first_day, datetime.min.time())
+    weighted = covered = 0.0
+    for hour, occupied, total in changes + [(None, None, None)]:
+        until = datetime.strptime(hour, '%Y-%m-%d %H:%M') if hour else now
+        if level and level[1]:
+            span = (until - since).total_seconds()
+            weighted += span * level[0] / level[1]
+            covered += span
+        level, since = (occupied, total), until
+
+    daily, served, turnaround_hours, turnaround_count = [], 0, 0.0, 0
+    for row in conn.execute('''
+        SELECT day, appointments, reservations, lab_orders, lab_reports, turnaround_hours, turnaround_count,
+            occupied_max, beds_total
+        FROM analytics_daily WHERE hospital_id = ? AND day >= ? ORDER BY day
+    ''', (hospital_id, since_day)):
+        day, appointments, reservations, lab_orders, lab_reports, turnaround, count, occupied_max, total = row
+        served += appointments
+        turnaround_hours += turnaround
+        turnaround_count += count
+        daily.append({
+            "date": day,
+            "appointments": appointments,
+            "reservations": reservations,
+            "lab_orders": lab_orders,
+            "lab_reports": lab_reports,
+            "lab_turnaround_hours": round(turnaround / count, 1) if count else None,
+            "occupied_peak": occupied_max,
+            "peak_utilization": round(occupied_max / total, 3) if occupied_max is not None and total else None,
+        })
+
+    current = conn.execute('SELECT total_count, available_count FROM bed_summary WHERE hospital_id = ?',
+                           (hospital_id,)).fetchone()
+    return {
+        "patients_served": served,
+        "peak_hours": peak_hours(profile),
+        "days": days,
+        "since": since_day,
+        "hourly_profile": profile,
+        "lab_turnaround_hours": round(turnaround_hours / turnaround_count, 1) if turnaround_count else None,
+        "occupancy": {
+            "occupied": current[0] - current[1] if current else 0,
+            "total": current[0] if current else 0,
+            "average_utilization": round(weighted / covered, 3) if covered else None,
+        },
+        "daily": daily,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the analytics rollups from the raw tables.')
+    parser.add_argument('--dry-run', action='store_true', help='report drift without rebuilding')
+    args = parser.parse_args()
+
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    drift = find_drift(conn)
+    for table, key, have, want in sorted(drift, key=lambda d: (d[0], d[1])):
+        changed = {c: (have[c], want[c]) for c in COUNTERS if have[c] != want[c]}
+        print(f"{table} {key}: stored/expected {changed}")
+    if not args.dry_run:
+        rebuild(conn)
+    conn.commit()
+    conn.close()
+
+    if not drift:
+        print("Analytics rollups are consistent.")
+    elif args.dry_run:
+        print(f"{len(drift)} buckets drifted (not rebuilt).")
+    else:
+        print(f"{len(drift)} buckets drifted; rebuilt from the raw tables.")
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
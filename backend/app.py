@@ -1,27 +1,210 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, send_file, g, Response, make_response, redirect, url_for
 from flask_cors import CORS
+import functools
+import json
+import mimetypes
+import random
+import re
 import sqlite3
 import os
+import string
+import time
+import uuid
+import zipfile
+from datetime import date, datetime
+from urllib.parse import urlsplit
+
+import analytics
+import auth
+import blobs
+import cache
+import dispatch
+import events
+import expiry
+import geo
+import labs
+import metrics
+import occupancy
+import reservations
+import schedule
+import search
+import sse
+import streaming
+import timeline
+import versions
+from database import pool
 
 app = Flask(__name__, static_folder="../frontend", static_url_path="/")
-CORS(app)
-
-DB_PATH = os.path.join(os.path.dirname(__file__), '../database/hospitrack.db')
-REPORT_UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '../frontend/assets/reports')
-
-if not os.path.exists(REPORT_UPLOAD_FOLDER):
-    os.makedirs(REPORT_UPLOAD_FOLDER)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'Upload-Offset'])
+
+MAX_PAGE_SIZE = 1000
+DEFAULT_NEAREST = 10
+# Shown for emergency dispatch holds made without a registered patient.
+UNREGISTERED_PATIENT = 'Unregistered (emergency)'
+# Report files never change under a given link (it is signed over the content
+# hash), so browsers may keep them for a year.
+REPORT_FILE_MAX_AGE = 365 * 24 * 3600
+# Behind nginx/Apache, let the front server send report files (X-Sendfile).
+app.config['USE_X_SENDFILE'] = os.environ.get('HOSPITRACK_X_SENDFILE', '') not in ('', '0')
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Check a pooled connection out for the current app context."""
+    conn = g.get('db')
+    if conn is None or conn.closed:
+        conn = g.db = pool.connect()
+    return conn
+
+def detach_db_connection():
+    """Hand the request's connection to a streamed response, which releases it once the body is sent."""
+    conn = get_db_connection()
+    del g.db
     return conn
 
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+def conditional_get(scopes):
+    """Answer If-None-Match from the data version counters without running the view.
+
+    `scopes(**view_args)` names the version counters the response depends on.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            scope_ids = scopes(**kwargs)
+            current = versions.current(get_db_connection(), scope_ids)
+            g.data_versions = dict(zip(scope_ids, current))
+            etag = versions.make_etag(request.full_path, scope_ids, current)
+            if request.if_none_match.contains(etag):
+                versions.stats.record(hit=True)
+                response = make_response('', 304)
+            else:
+                versions.stats.record(hit=False)
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def require_role(*roles):
+    """Refuse the view to callers without a session in one of `roles`."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if g.session is None:
+                return jsonify({"error": "Login required"}), 401
+            if g.session['role'] not in roles:
+                return jsonify({"error": "Not permitted for this account"}), 403
+            return view(**kwargs)
+        return wrapper
+    return decorator
+
+def data_version(scope):
+    """The scope's version as read by conditional_get for this request, or from the database."""
+    known = g.get('data_versions', {})
+    return known[scope] if scope in known else versions.current(get_db_connection(), [scope])[0]
+
+def hospital_scope(hospital_id, **_):
+    return [hospital_id]
+
+def hospital_and_users_scope(hospital_id, **_):
+    return [hospital_id, versions.USERS]
+
+_hospital_columns = None
+
+def hospital_columns(conn):
+    """Column names of the hospitals table, looked up once per process."""
+    global _hospital_columns
+    if _hospital_columns is None:
+        _hospital_columns = {row['name'] for row in conn.execute('PRAGMA table_info(hospitals)').fetchall()}
+    return _hospital_columns
+
+def nearest_count():
+    """The `k` query parameter for nearest-hospital lookups, clamped to a page."""
+    return min(max(request.args.get('k', DEFAULT_NEAREST, type=int), 1), MAX_PAGE_SIZE)
+
+def free_beds_condition(bed_type=None, price_filter=None):
+    """Predicate for geo.nearest(): the hospital has a free bed matching the filters."""
+    sql = 'EXISTS (SELECT 1 FROM beds b WHERE b.hospital_id = g.id AND b.available_count > 0'
+    params = []
+    if bed_type:
+        sql += ' AND b.bed_type = ?'
+        params.append(bed_type)
+    if price_filter == 'low':
+        sql += ' AND b.price < 200'
+    elif price_filter == 'high':
+        sql += ' AND b.price >= 200'
+    return sql + ')', params
+
+# Registered before load_session so rejected requests are measured too.
+@app.before_request
+def start_request_metrics():
+    g.started = time.perf_counter()
+    g.route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if metrics.ENABLED:
+        metrics.begin_request(g.route)
+    g.profile = metrics.start_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.started
+    if metrics.ENABLED:
+        metrics.end_request(request.method, g.route, response.status_code, elapsed)
+    if g.profile is not None:
+        metrics.dump_profile(g.profile, g.route, elapsed)
+    return response
+
+# Reachable without a session: the public landing and emergency pages,
+# logging in, signed report links and the metrics scrape (keep /metrics off
+# the public proxy).
+PUBLIC_ENDPOINTS = {'static', 'serve_index', 'login', 'signup', 'logout', 'get_hospitals', 'search_hospitals',
+                    'get_hospital_details', 'init_dummy_data', 'get_report_file', 'legacy_report_path', 'get_metrics'}
+
+@app.before_request
+def load_session():
+    """Verify the caller's session token and refuse ids that are not theirs.
+
+    The token comes from `Authorization: Bearer`, or `access_token` for
+    EventSource, which cannot set headers. Verifying it does not touch the
+    database (see auth.py).
+    """
+    g.session = None
+    if request.method == 'OPTIONS':
+        return None
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else request.args.get('access_token')
+    if token:
+        g.session = auth.verify_session(token)
+        if g.session is None:
+            return jsonify({"error": "Session expired, please log in again"}), 401
+    elif request.endpoint not in PUBLIC_ENDPOINTS and (
+            auth.REQUIRE_SESSIONS or (request.method != 'GET' and auth.names_account(request_sources()))):
+        return jsonify({"error": "Login required"}), 401
+    if g.session and not owns_request(g.session):
+        return jsonify({"error": "Not permitted for this account"}), 403
+    return None
+
+def request_sources():
+    """The mappings a request can name ids in: URL variables, each query value, and a JSON object body."""
+    body = request.get_json(silent=True) if request.is_json else None
+    # One mapping per query value, so a repeated ?patient_id= is checked every time.
+    sources = [request.view_args or {}, *({key: value} for key, value in request.args.items(multi=True))]
+    return sources + ([body] if isinstance(body, dict) else [])
+
+def owns_request(session):
+    """False if the request names another patient (for patients) or writes to another hospital (for staff)."""
+    return auth.owns(session, request_sources(), write=request.method != 'GET')
+
 def dict_factory(cursor, row):
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
+    return dict(zip(streaming.column_names(cursor), row))
 
 @app.route('/')
 def serve_index():
@@ -37,20 +220,28 @@ def login():
 
     conn = get_db_connection()
     conn.row_factory = dict_factory
-    
-    if role:
-        user = conn.execute('SELECT * FROM users WHERE username = ? AND password = ? AND role = ?', 
-                            (username, password, role)).fetchone()
-    else:
-        user = conn.execute('SELECT * FROM users WHERE username = ? AND password = ?', 
-                            (username, password)).fetchone()
-    
-    conn.close()
 
-    if user:
-        return jsonify({"message": "Login successful", "user": user})
-    else:
+    user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+    matches, rehash = auth.check_password(user['password'] if user else None, password)
+    if not matches or (role and user['role'] != role):
+        conn.close()
         return jsonify({"error": "Invalid credentials"}), 401
+    if rehash:
+        # Plaintext (or weaker) password from an older version: store the hash now.
+        conn.execute('UPDATE users SET password = ? WHERE id = ?', (auth.hash_password(password), user['id']))
+        conn.commit()
+    conn.close()
+
+    del user['password']
+    token, expires = auth.issue_session(user)
+    return jsonify({"message": "Login successful", "user": user, "token": token, "expires": expires})
+
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    """Revoke the caller's session token on every worker."""
+    if g.session:
+        auth.revocations.revoke(g.session['session_id'], g.session['expires'])
+    return jsonify({"message": "Logged out"})
 
 @app.route('/api/signup', methods=['POST'])
 def signup():
@@ -60,10 +251,9 @@ def signup():
     role = data.get('role')
     full_name = data.get('full_name')
     hospital_id = data.get('hospital_id') # Optional, for staff
+    if not username or not password:
+        return jsonify({"error": "Username and password required"}), 400
 
-    import string
-    import random
-    
     hospitrack_id = None
     if role == 'patient':
         hospitrack_id = "HT-" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
@@ -71,7 +261,7 @@ def signup():
     conn = get_db_connection()
     try:
         conn.execute('INSERT INTO users (username, password, role, full_name, hospital_id, hospitrack_id) VALUES (?, ?, ?, ?, ?, ?)', 
-                     (username, password, role, full_name, hospital_id, hospitrack_id))
+                     (username, auth.hash_password(password), role, full_name, hospital_id, hospitrack_id))
         conn.commit()
         return jsonify({"message": "User created successfully"})
     except sqlite3.IntegrityError:
@@ -104,15 +294,20 @@ def add_update_bed():
     
     conn.commit()
     conn.close()
+    cache.invalidate_hospital(hospital_id)
+    events.bus.publish(events.hospital_topic(hospital_id), 'beds', bed_type=bed_type,
+                       total_count=total, available_count=available, price=price)
     return jsonify({"message": "Bed data updated"})
 
 @app.route('/api/hospital/beds/<int:bed_id>', methods=['DELETE'])
 def delete_bed(bed_id):
     """Delete a bed type for a hospital."""
     conn = get_db_connection()
-    conn.execute('DELETE FROM beds WHERE id = ?', (bed_id,))
+    bed = conn.execute('DELETE FROM beds WHERE id = ? RETURNING hospital_id', (bed_id,)).fetchone()
     conn.commit()
     conn.close()
+    if bed:
+        cache.invalidate_hospital(bed['hospital_id'])
     return jsonify({"message": "Bed deleted successfully"})
 
 @app.route('/api/hospital/doctors', methods=['POST'])
@@ -127,22 +322,40 @@ def add_update_doctor():
     hours = data.get('hours')
     image = data.get('image')
     is_visiting = data.get('is_visiting', 0)
+    # Absent on an update keeps the doctor's current slot length.
+    slot_minutes = data.get('slot_minutes')
+    try:
+        weekly = schedule.parse_schedule(days, hours)
+    except ValueError as e:
+        return jsonify({"error": f"Could not read the doctor's days/hours: {e}"}), 400
+    if slot_minutes is not None and (not isinstance(slot_minutes, int) or not 5 <= slot_minutes <= 240):
+        return jsonify({"error": "slot_minutes must be between 5 and 240"}), 400
 
     conn = get_db_connection()
     if doctor_id:
-        conn.execute('UPDATE doctors SET name=?, specialization=?, days=?, hours=?, image=?, is_visiting=? WHERE id=?',
-                     (name, spec, days, hours, image, is_visiting, doctor_id))
+        doc = conn.execute('UPDATE doctors SET name=?, specialization=?, days=?, hours=?, image=?, is_visiting=?, slot_minutes=COALESCE(?, slot_minutes) WHERE id=? RETURNING hospital_id, availability',
+                           (name, spec, days, hours, image, is_visiting, slot_minutes, doctor_id)).fetchone()
+        hospital_id = doc['hospital_id'] if doc else None
+        if doc and not weekly and doc['availability']:
+            # Seeded doctors only have the combined availability text.
+            try:
+                weekly = schedule.parse_schedule(availability=doc['availability'])
+            except ValueError:
+                pass
     else:
-        conn.execute('INSERT INTO doctors (hospital_id, name, specialization, days, hours, image, is_visiting) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                     (hospital_id, name, spec, days, hours, image, is_visiting))
+        doctor_id = conn.execute('INSERT INTO doctors (hospital_id, name, specialization, days, hours, image, is_visiting, slot_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (hospital_id, name, spec, days, hours, image, is_visiting, slot_minutes or schedule.DEFAULT_SLOT_MINUTES)).lastrowid
+    if hospital_id is not None:
+        schedule.save(conn, doctor_id, weekly)
     conn.commit()
     conn.close()
+    cache.invalidate_hospital(hospital_id)
     return jsonify({"message": "Doctor saved successfully"})
 
 @app.route('/api/hospital/doctors/<int:doctor_id>/status', methods=['PUT'])
 def toggle_doctor_status(doctor_id):
     conn = get_db_connection()
-    doc = conn.execute('SELECT is_available, current_status FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
+    doc = conn.execute('SELECT hospital_id, is_available, current_status FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
     if not doc:
         conn.close()
         return jsonify({"error": "Doctor not found"}), 404
@@ -153,49 +366,53 @@ def toggle_doctor_status(doctor_id):
     conn.execute('UPDATE doctors SET is_available = ?, current_status = ? WHERE id = ?', (new_avail, new_status, doctor_id))
     conn.commit()
     conn.close()
+    cache.invalidate_hospital(doc['hospital_id'])
+    events.bus.publish(events.hospital_topic(doc['hospital_id']), 'doctor', doctor_id=doctor_id,
+                       is_available=new_avail, current_status=new_status)
     return jsonify({"message": "Doctor status updated", "is_available": new_avail})
 
 @app.route('/api/hospital/doctors/<int:doctor_id>', methods=['DELETE'])
 def delete_doctor(doctor_id):
     conn = get_db_connection()
-    conn.execute('DELETE FROM doctors WHERE id = ?', (doctor_id,))
+    doc = conn.execute('DELETE FROM doctors WHERE id = ? RETURNING hospital_id', (doctor_id,)).fetchone()
     conn.commit()
     conn.close()
+    if doc:
+        cache.invalidate_hospital(doc['hospital_id'])
     return jsonify({"message": "Doctor deleted successfully"})
 
 @app.route('/api/hospital/<int:hospital_id>/details', methods=['GET'])
+@conditional_get(hospital_scope)
 def get_hospital_details(hospital_id):
     """Get full details (beds, doctors) for a hospital."""
-    conn = get_db_connection()
-    conn.row_factory = dict_factory
-    
-    hospital = conn.execute('SELECT * FROM hospitals WHERE id = ?', (hospital_id,)).fetchone()
-    beds = conn.execute('SELECT * FROM beds WHERE hospital_id = ?', (hospital_id,)).fetchall()
-    doctors = conn.execute('SELECT * FROM doctors WHERE hospital_id = ?', (hospital_id,)).fetchall()
-    
-    conn.close()
-    return jsonify({
-        "hospital": hospital,
-        "beds": beds,
-        "doctors": doctors
-    })
+    def load():
+        conn = get_db_connection()
+        conn.row_factory = dict_factory
+
+        hospital = conn.execute('SELECT * FROM hospitals WHERE id = ?', (hospital_id,)).fetchone()
+        beds = conn.execute('SELECT * FROM beds WHERE hospital_id = ?', (hospital_id,)).fetchall()
+        doctors = conn.execute('SELECT * FROM doctors WHERE hospital_id = ?', (hospital_id,)).fetchall()
+
+        conn.close()
+        return {
+            "hospital": hospital,
+            "beds": beds,
+            "doctors": doctors
+        }
+
+    return jsonify(cache.cache.get_or_load(cache.details_key(hospital_id, data_version(hospital_id)), load))
 
 @app.route('/api/hospital/<int:hospital_id>/appointments', methods=['GET'])
+@conditional_get(hospital_and_users_scope)
 def get_hospital_appointments(hospital_id):
-    conn = get_db_connection()
-    conn.row_factory = dict_factory
-    
-    query = '''
-        SELECT a.id, a.doctor_name, a.date, a.status, u.full_name as patient_name, u.username as patient_username
+    """Every appointment at the hospital, streamed as a JSON array (or NDJSON, see streaming.py)."""
+    return streaming.stream(detach_db_connection(), '''
+        SELECT a.id, a.doctor_name, a.date, a.status, COALESCE(u.full_name, ?) as patient_name, u.username as patient_username
         FROM appointments a
-        JOIN users u ON a.patient_id = u.id
+        LEFT JOIN users u ON a.patient_id = u.id
         WHERE a.hospital_id = ?
         ORDER BY a.date ASC
-    '''
-    appointments = conn.execute(query, (hospital_id,)).fetchall()
-    conn.close()
-    
-    return jsonify(appointments)
+    ''', (UNREGISTERED_PATIENT, hospital_id), streaming.wants_ndjson(request))
 
 @app.route('/api/hospital/appointments/<int:appointment_id>', methods=['PATCH'])
 def update_appointment_status(appointment_id):
@@ -203,42 +420,64 @@ def update_appointment_status(appointment_id):
     status = data.get('status')
     
     conn = get_db_connection()
-    conn.execute('UPDATE appointments SET status = ? WHERE id = ?', (status, appointment_id))
+    try:
+        conn.execute('UPDATE appointments SET status = ? WHERE id = ?', (status, appointment_id))
+    except sqlite3.IntegrityError:
+        # Reinstating a cancelled appointment whose slot has been booked again.
+        conn.rollback()
+        conn.close()
+        return jsonify({"error": "That slot has since been booked"}), 409
+    apt = conn.execute('SELECT hospital_id, patient_id FROM appointments WHERE id = ?', (appointment_id,)).fetchone()
     conn.commit()
     conn.close()
-    
+
+    if apt:
+        events.bus.publish((events.hospital_topic(apt['hospital_id']), events.patient_topic(apt['patient_id'])),
+                           'appointment', appointment_id=appointment_id, status=status)
     return jsonify({"message": "Appointment status updated"})
 
 @app.route('/api/hospital/<int:hospital_id>/analytics', methods=['GET'])
 def get_hospital_analytics(hospital_id):
+    """Patients served, peak hours, occupancy and lab turnaround over the last `days` days (default 30).
+
+    Read from the hourly/daily rollups kept by analytics.py. Not ETag-cached:
+    the window moves with the clock and lab reports feed it too.
+    """
+    days = min(max(request.args.get('days', analytics.DEFAULT_DAYS, type=int), 1), analytics.MAX_DAYS)
     conn = get_db_connection()
-    conn.row_factory = dict_factory
-    
-    # Simple count of all appointments assigned to this hospital as "patients served"
-    served_count = conn.execute('SELECT count(*) as count FROM appointments WHERE hospital_id = ?', (hospital_id,)).fetchone()['count']
-    
+    report = analytics.hospital_report(conn, hospital_id, days)
     conn.close()
-    
-    return jsonify({
-        "patients_served": served_count,
-        "peak_hours": "10 AM - 2 PM" # Peak hours is tricky to calculate without timestamps, keep static for now or base it on logic
-    })
+    return jsonify(report)
+
+@app.route('/api/hospital/<int:hospital_id>/occupancy', methods=['GET'])
+def get_hospital_occupancy(hospital_id):
+    """Occupied/total beds over the last `hours` hours (default a week) and a forecast of the next `horizon` steps.
+
+    `resolution` is minute, hour or day (default: the finest that fits in
+    2000 points); `bed_type` narrows it to one ward.
+    """
+    hours = min(max(request.args.get('hours', occupancy.DEFAULT_WINDOW_HOURS, type=int), 1), 24 * 366 * 5)
+    horizon = min(max(request.args.get('horizon', occupancy.DEFAULT_HORIZON, type=int), 1), occupancy.MAX_HORIZON)
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in occupancy.TIERS:
+        return jsonify({"error": f"resolution must be one of {', '.join(occupancy.TIERS)}"}), 400
+
+    conn = get_db_connection()
+    series = occupancy.hospital_series(conn, hospital_id, hours, resolution, request.args.get('bed_type'), horizon)
+    conn.close()
+    return jsonify(series)
 
 @app.route('/api/hospital/<int:hospital_id>/reservations', methods=['GET'])
+@conditional_get(hospital_and_users_scope)
 def get_hospital_reservations(hospital_id):
-    conn = get_db_connection()
-    conn.row_factory = dict_factory
-    
-    reservations = conn.execute('''
-        SELECT r.id, r.patient_id, u.full_name as patient_name, u.username as patient_contact, u.hospitrack_id as patient_uid, r.bed_type, r.timestamp, r.status, r.address, r.urgency
+    """Every bed reservation at the hospital, newest first, streamed like the appointments list."""
+    return streaming.stream(detach_db_connection(), '''
+        SELECT r.id, r.patient_id, COALESCE(u.full_name, ?) as patient_name, u.username as patient_contact, u.hospitrack_id as patient_uid, r.bed_type, r.timestamp, r.status, r.address, r.urgency
         FROM bed_reservations r 
-        JOIN users u ON r.patient_id = u.id 
+        LEFT JOIN users u ON r.patient_id = u.id 
         WHERE r.hospital_id = ? 
         ORDER BY r.timestamp DESC
-    ''', (hospital_id,)).fetchall()
-    
-    conn.close()
-    return jsonify(reservations)
+    ''', (UNREGISTERED_PATIENT, hospital_id), streaming.wants_ndjson(request))
 
 @app.route('/api/hospital/reservations/<int:res_id>', methods=['PATCH'])
 def update_bed_reservation(res_id):
@@ -246,51 +485,147 @@ def update_bed_reservation(res_id):
     status = data.get('status')
     
     conn = get_db_connection()
-    res = conn.execute('SELECT hospital_id, bed_type, status FROM bed_reservations WHERE id = ?', (res_id,)).fetchone()
-    
-    if not res:
+    # Refunds the bed if it's being cancelled from an active reserved state
+    try:
+        res = reservations.update_status(conn, res_id, status)
+    except reservations.ReservationClosed as e:
         conn.close()
+        return jsonify({"error": f"Reservation is already {e}; book a new bed instead"}), 409
+    conn.close()
+
+    if res is None:
         return jsonify({"error": "Reservation not found"}), 404
 
-    # If it's being cancelled from an active reserved state, we should refund the bed count
-    if status in ['Cancelled', 'Rejected'] and res['status'] not in ['Cancelled', 'Rejected']:
-        conn.execute('UPDATE beds SET available_count = available_count + 1 WHERE hospital_id = ? AND bed_type = ?', (res['hospital_id'], res['bed_type']))
+    cache.invalidate_hospital(res['hospital_id'])
 
-    conn.execute('UPDATE bed_reservations SET status = ? WHERE id = ?', (status, res_id))
-    conn.commit()
-    conn.close()
-    
+    events.bus.publish((events.hospital_topic(res['hospital_id']), events.patient_topic(res['patient_id'])),
+                       'reservation', reservation_id=res_id, bed_type=res['bed_type'], status=status)
     return jsonify({"message": f"Reservation status updated to {status}"})
 
 # --- Public/Patient API ---
 
+def hospital_list_query(columns, cursor=None, limit=None, ids=None):
+    """(sql, params) listing hospitals with their bed totals: the given ids, or a page after `cursor` in id order."""
+    query = f'SELECT {", ".join(columns)}, h.id AS _cursor FROM hospitals h LEFT JOIN bed_summary s ON s.hospital_id = h.id'
+    if ids is not None:
+        return f"{query} WHERE h.id IN ({', '.join('?' * len(ids))})", list(ids)
+    params = []
+    if cursor is not None:
+        query += ' WHERE h.id > ?'
+        params.append(cursor)
+    query += ' ORDER BY h.id'
+    if limit:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return query, params
+
 @app.route('/api/hospitals', methods=['GET'])
+@conditional_get(lambda: [versions.GLOBAL])
 def get_hospitals():
-    """Fetch all hospitals with aggregated availability."""
+    """Fetch hospitals with aggregated availability.
+
+    Optional query params: `limit` and `cursor` (last seen id) for keyset
+    pagination, and `fields` (comma separated) to project columns. The next
+    cursor is returned in the X-Next-Cursor header so the body stays a list.
+    With `lat` and `lon` it instead returns the `k` nearest hospitals (only
+    those with a free `type` bed, if given), closest first, with `distance_km`.
+    """
+    try:
+        point = geo.parse_point(request.args)
+    except (TypeError, ValueError):
+        return jsonify({"error": "lat and lon must both be valid coordinates"}), 400
+
     conn = get_db_connection()
     conn.row_factory = dict_factory
-    
-    hospitals = conn.execute('SELECT * FROM hospitals').fetchall()
-    result = []
-    
+
+    aggregates = {
+        'available_beds': 'COALESCE(s.available_count, 0) AS available_beds',
+        'total_beds': 'COALESCE(s.total_count, 0) AS total_beds',
+    }
+    fields = request.args.get('fields')
+    if fields:
+        requested = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in aggregates and f not in hospital_columns(conn)]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+        columns = [aggregates.get(f, f'h.{f}') for f in requested]
+    else:
+        columns = ['h.*', *aggregates.values()]
+
+    if point:
+        condition, params = free_beds_condition(request.args.get('type')) if request.args.get('type') else (None, ())
+        distances = {hospital_id: km for km, hospital_id in geo.nearest(conn, *point, nearest_count(), condition, params)}
+        hospitals = conn.execute(*hospital_list_query(columns, ids=list(distances))).fetchall()
+        for h in hospitals:
+            h['distance_km'] = round(distances[h.pop('_cursor')], 2)
+        hospitals.sort(key=lambda h: h['distance_km'])
+        return jsonify(hospitals)
+
+    limit = request.args.get('limit', type=int)
+    page_size = min(max(limit, 1), MAX_PAGE_SIZE) if limit else None
+    hospitals = conn.execute(*hospital_list_query(columns, request.args.get('cursor', type=int), page_size)).fetchall()
+    next_cursor = hospitals[-1]['_cursor'] if page_size and len(hospitals) == page_size else None
     for h in hospitals:
-        # Aggregate bed counts for display
-        beds = conn.execute('SELECT sum(available_count) as free, sum(total_count) as total FROM beds WHERE hospital_id = ?', (h['id'],)).fetchone()
-        h['available_beds'] = beds['free'] if beds['free'] else 0
-        h['total_beds'] = beds['total'] if beds['total'] else 0
-        result.append(h)
-        
-    conn.close()
-    return jsonify(result)
+        del h['_cursor']
+
+    response = jsonify(hospitals)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
 
 @app.route('/api/hospitals/search', methods=['GET'])
+@conditional_get(lambda: [versions.GLOBAL])
 def search_hospitals():
-    query = request.args.get('q', '')
+    """Typeahead search over hospital name, location, bed types and specializations.
+
+    Every word of `q` matches as a word prefix, and results are ranked by
+    bm25 with name matches weighted highest. `limit` and `cursor` page
+    through the ranking (next cursor in X-Next-Cursor); an empty `q` lists
+    hospitals like /api/hospitals.
+    """
+    match = search.match_expression(request.args.get('q', ''))
+    if match is None:
+        return get_hospitals.__wrapped__()
+
     conn = get_db_connection()
     conn.row_factory = dict_factory
-    hospitals = conn.execute(f"SELECT * FROM hospitals WHERE name LIKE '%{query}%' OR location LIKE '%{query}%'").fetchall()
+
+    # Column weights follow the index layout: name, location, bed_types, specializations.
+    query = '''
+        SELECT h.*, COALESCE(s.available_count, 0) AS available_beds, COALESCE(s.total_count, 0) AS total_beds,
+               m.score AS _score
+        FROM (SELECT rowid AS id, bm25(hospital_search, 10.0, 4.0, 2.0, 1.0) AS score
+              FROM hospital_search WHERE hospital_search MATCH ?) m
+        JOIN hospitals h ON h.id = m.id
+        LEFT JOIN bed_summary s ON s.hospital_id = h.id
+        WHERE (m.score, m.id) > (?, ?)
+        ORDER BY m.score, m.id
+        LIMIT ?
+    '''
+    after_score, after_id = float('-inf'), 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            score, _, hospital_id = cursor.partition(':')
+            after_score, after_id = float(score), int(hospital_id)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    limit = request.args.get('limit', type=int)
+    page_size = min(max(limit, 1), MAX_PAGE_SIZE) if limit else -1
+
+    hospitals = conn.execute(query, (match, after_score, after_id, page_size)).fetchall()
     conn.close()
-    return jsonify(hospitals)
+
+    next_cursor = None
+    if limit and len(hospitals) == page_size:
+        next_cursor = f"{hospitals[-1]['_score']!r}:{hospitals[-1]['id']}"
+    for h in hospitals:
+        del h['_score']
+
+    response = jsonify(hospitals)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/api/admin/hospitals', methods=['POST'])
 def create_hospital():
@@ -298,16 +633,69 @@ def create_hospital():
     name = data.get('name')
     location = data.get('location')
     contact = data.get('contact')
+    latitude = data.get('latitude')
+    longitude = data.get('longitude')
     
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("INSERT INTO hospitals (name, location, contact) VALUES (?, ?, ?)", (name, location, contact))
+    cur.execute("INSERT INTO hospitals (name, location, contact, latitude, longitude) VALUES (?, ?, ?, ?, ?)",
+                (name, location, contact, latitude, longitude))
     new_id = cur.lastrowid
     conn.commit()
     conn.close()
     
     return jsonify({"message": "Hospital created", "id": new_id})
 
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    """Server-Sent Events feed of changes for ?hospital_id= and/or ?patient_id=.
+
+    When the asyncio SSE server is running the stream is redirected there, so
+    an idle dashboard does not hold a worker thread; otherwise it is served here.
+    """
+    topics = sse.topics_from_query(request.args.to_dict(flat=False))
+    if not topics:
+        return jsonify({"error": "hospital_id or patient_id required"}), 400
+    if sse.SSE_PORT:
+        host = urlsplit(request.host_url).hostname
+        host = f'[{host}]' if ':' in host else host
+        return redirect(f'{request.scheme}://{host}:{sse.SSE_PORT}{request.full_path}', 307)
+    return Response(events.stream(topics), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/admin/stats', methods=['GET'])
+@require_role('admin', 'hospital_staff')
+def get_server_stats():
+    """Internal counters for diagnosing pool contention."""
+    stats = {"db_pool": pool.stats(), "events": events.bus.stats(), "etag": versions.stats.snapshot(),
+             "cache": cache.cache.stats(), "dispatch": dispatch.stats.snapshot(),
+             "sessions": auth.revocations.stats()}
+    if expiry.scheduler is not None:
+        stats["reservation_expiry"] = expiry.scheduler.stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape: route and SQL timings for this worker process."""
+    stats = pool.stats()
+    snapshots = [
+        ('hospitrack_db_pool_open', 'gauge', 'Open pooled connections.', stats['open']),
+        ('hospitrack_db_pool_in_use', 'gauge', 'Pooled connections checked out.', stats['in_use']),
+        ('hospitrack_db_pool_waits_total', 'counter', 'Checkouts that waited for a free connection.', stats['waits']),
+        ('hospitrack_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting.', stats['timeouts']),
+    ]
+    return Response(metrics.render(snapshots), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/admin/cache', methods=['POST'])
+@require_role('admin', 'hospital_staff')
+def configure_cache():
+    """Turn the read-through cache on or off at runtime; either way it is emptied."""
+    data = request.json or {}
+    if 'enabled' in data:
+        cache.cache.enabled = bool(data['enabled'])
+    cache.cache.clear()
+    return jsonify(cache.cache.stats())
+
 # --- Init Dummy Data ---
 @app.route('/api/init_dummy_data', methods=['POST'])
 def init_dummy_data():
@@ -317,9 +705,9 @@ def init_dummy_data():
     if conn.execute('SELECT count(*) FROM hospitals').fetchone()[0] == 0:
         # Create Hospitals
         cur = conn.cursor()
-        cur.execute("INSERT INTO hospitals (name, location, contact) VALUES ('City Hospital', 'Downtown', '555-0101')")
+        cur.execute("INSERT INTO hospitals (name, location, contact, latitude, longitude) VALUES ('City Hospital', 'Downtown', '555-0101', 28.6139, 77.2090)")
         hid1 = cur.lastrowid
-        cur.execute("INSERT INTO hospitals (name, location, contact) VALUES ('General Medical Center', 'Westside', '555-0102')")
+        cur.execute("INSERT INTO hospitals (name, location, contact, latitude, longitude) VALUES ('General Medical Center', 'Westside', '555-0102', 28.6280, 77.1025)")
         hid2 = cur.lastrowid
         
         # Create Users linked to hospitals
@@ -340,6 +728,7 @@ def init_dummy_data():
         conn.execute("INSERT INTO doctors (hospital_id, name, specialization, availability, is_visiting) VALUES (?, 'Dr. Jones', 'Neurologist', 'Tue, Thu 2PM-6PM', 1)", (hid1,))
         
         conn.commit()
+        cache.cache.clear()
         msg = "Dummy data initialized with dynamic beds/doctors."
     else:
         msg = "Data already exists."
@@ -362,7 +751,7 @@ def update_profile():
     conn = get_db_connection()
     try:
         if password:
-            conn.execute('UPDATE users SET full_name = ?, password = ? WHERE id = ?', (full_name, password, user_id))
+            conn.execute('UPDATE users SET full_name = ?, password = ? WHERE id = ?', (full_name, auth.hash_password(password), user_id))
         else:
             conn.execute('UPDATE users SET full_name = ? WHERE id = ?', (full_name, user_id))
         conn.commit()
@@ -370,6 +759,7 @@ def update_profile():
         # Fetch updated user to return
         updated_user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
         updated_user_dict = dict(updated_user)
+        del updated_user_dict['password']
         return jsonify({"message": "Profile updated", "user": updated_user_dict})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -378,44 +768,71 @@ def update_profile():
 
 # --- Live Bed & Appointment Endpoints ---
 
-@app.route('/api/patient/search_beds', methods=['GET'])
-def search_beds():
-    location = request.args.get('location', '').lower()
-    bed_type = request.args.get('type', '')
-    price_filter = request.args.get('price', '') # 'low' or 'high' or empty
-
-    conn = get_db_connection()
-    conn.row_factory = dict_factory
-    
+def bed_search_query(location_match=None, bed_type=None, hospital_ids=None, price_filter=None):
+    """(sql, params) for the free beds search_beds lists: one row per hospital and bed type."""
+    # Availability comes from the per-type summary; the bed row only supplies id and price.
     query = '''
-        SELECT b.id as bed_id, b.bed_type, b.price, b.available_count, h.id as hospital_id, h.name as hospital_name, h.location as hospital_location
-        FROM beds b
-        JOIN hospitals h ON b.hospital_id = h.id
-        WHERE b.available_count > 0
+        SELECT * FROM (
+            SELECT (SELECT MIN(b.id) FROM beds b WHERE b.hospital_id = s.hospital_id AND b.bed_type = s.bed_type) as bed_id,
+                   s.bed_type,
+                   (SELECT MIN(b.price) FROM beds b WHERE b.hospital_id = s.hospital_id AND b.bed_type = s.bed_type) as price,
+                   s.available_count, h.id as hospital_id, h.name as hospital_name, h.location as hospital_location
+            FROM bed_type_summary s
+            JOIN hospitals h ON s.hospital_id = h.id
+            WHERE s.available_count > 0
     '''
     params = []
-
-    if location:
-        query += " AND (LOWER(h.name) LIKE ? OR LOWER(h.location) LIKE ?)"
-        params.extend([f"%{location}%", f"%{location}%"])
-    
+    if location_match:
+        query += " AND h.id IN (SELECT rowid FROM hospital_search WHERE hospital_search MATCH ?)"
+        params.append(location_match)
     if bed_type:
-        query += " AND b.bed_type = ?"
+        query += " AND s.bed_type = ?"
         params.append(bed_type)
-
+    if hospital_ids is not None:
+        query += f" AND h.id IN ({', '.join('?' * len(hospital_ids))})"
+        params.extend(hospital_ids)
+    query += ")"
     if price_filter == 'low':
-        query += " AND b.price < 200"
+        query += " WHERE price < 200"
     elif price_filter == 'high':
-        query += " AND b.price >= 200"
+        query += " WHERE price >= 200"
+    return query, params
 
-    beds = conn.execute(query, params).fetchall()
+@app.route('/api/patient/search_beds', methods=['GET'])
+def search_beds():
+    location = request.args.get('location', '')
+    bed_type = request.args.get('type', '')
+    price_filter = request.args.get('price', '') # 'low' or 'high' or empty
+    try:
+        point = geo.parse_point(request.args)
+    except (TypeError, ValueError):
+        return jsonify({"error": "lat and lon must both be valid coordinates"}), 400
+
+    conn = get_db_connection()
+    conn.row_factory = dict_factory
+    
+    location_match = search.match_expression(location, columns=('name', 'location'))
+
+    # With the caller's position, keep only the k nearest hospitals that have a matching free bed.
+    distances = {}
+    if point:
+        condition, condition_params = free_beds_condition(bed_type, price_filter)
+        if location_match:
+            condition += " AND g.id IN (SELECT rowid FROM hospital_search WHERE hospital_search MATCH ?)"
+            condition_params.append(location_match)
+        distances = {hospital_id: km for km, hospital_id in geo.nearest(conn, *point, nearest_count(), condition, condition_params)}
+
+    beds = conn.execute(*bed_search_query(location_match, bed_type, list(distances) if point else None, price_filter)).fetchall()
     conn.close()
 
-    # Add mock distance/rating to match frontend expectations
-    import random
+    # Ratings are not tracked yet; keep the mock value the frontend expects.
     for b in beds:
-        b['distance'] = f"{round(random.uniform(1.0, 15.0), 1)} miles"
+        km = distances.get(b['hospital_id'])
+        b['distance_km'] = round(km, 2) if km is not None else None
+        b['distance'] = f"{km:.1f} km" if km is not None else None
         b['rating'] = str(round(random.uniform(3.5, 5.0), 1))
+    if point:
+        beds.sort(key=lambda b: (b['distance_km'], b['hospital_id'], b['bed_type']))
 
     return jsonify(beds)
 
@@ -430,26 +847,49 @@ def reserve_bed():
 
     conn = get_db_connection()
     try:
-        # Verify bed is still available
-        bed = conn.execute('SELECT id, available_count FROM beds WHERE hospital_id = ? AND bed_type = ? AND available_count > 0', 
-                           (hospital_id, bed_type)).fetchone()
-        
-        if not bed:
-            return jsonify({"error": "Bed no longer available"}), 400
-
-        # Deduct bed count
-        conn.execute('UPDATE beds SET available_count = available_count - 1 WHERE id = ?', (bed['id'],))
-        
-        # Log reservation
-        conn.execute('INSERT INTO bed_reservations (patient_id, hospital_id, bed_type, address, urgency) VALUES (?, ?, ?, ?, ?)',
-                     (patient_id, hospital_id, bed_type, address, urgency))
-        conn.commit()
-        return jsonify({"message": "Bed reserved successfully for 30 minutes!"})
+        res_id = reservations.reserve(conn, patient_id, hospital_id, bed_type, address, urgency)
+        cache.invalidate_hospital(hospital_id)
+        events.bus.publish((events.hospital_topic(hospital_id), events.patient_topic(patient_id)),
+                           'reservation', reservation_id=res_id, bed_type=bed_type, status='Reserved', urgency=urgency)
+        return jsonify({"message": f"Bed reserved successfully for {expiry.RESERVATION_TTL_MINUTES} minutes!"})
+    except reservations.BedUnavailable:
+        return jsonify({"error": "Bed no longer available"}), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
 
+@app.route('/api/emergency/dispatch', methods=['POST'])
+def emergency_dispatch():
+    """Allocate a batch of emergency requests to the nearest hospitals with capacity.
+
+    Body: {"requests": [{"urgency", "bed_type", "lat", "lon", "patient_id", "address"}, ...]}.
+    Critical requests are served before High before Normal; everything
+    assigned is reserved in one transaction. `index` in the response refers
+    to the request's position in the batch.
+    """
+    batch = (request.json or {}).get('requests')
+    if not isinstance(batch, list) or not batch or not all(isinstance(r, dict) for r in batch):
+        return jsonify({"error": "requests must be a non-empty list of objects"}), 400
+    if len(batch) > dispatch.MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {dispatch.MAX_BATCH_SIZE} requests per batch"}), 413
+
+    conn = get_db_connection()
+    try:
+        assigned, unassigned, elapsed = dispatch.dispatch(conn, batch)
+    finally:
+        conn.close()
+
+    for hospital_id in {a['hospital_id'] for a in assigned}:
+        cache.invalidate_hospital(hospital_id)
+    for a in assigned:
+        topics = [events.hospital_topic(a['hospital_id'])]
+        if a['patient_id'] is not None:
+            topics.append(events.patient_topic(a['patient_id']))
+        events.bus.publish(topics, 'reservation', reservation_id=a['reservation_id'], bed_type=a['bed_type'],
+                           status='Reserved', urgency=a['urgency'])
+    return jsonify({"assigned": assigned, "unassigned": unassigned, "elapsed_ms": round(elapsed * 1000, 3)})
+
 @app.route('/api/patient/reservations', methods=['GET'])
 def get_reservations():
     patient_id = request.args.get('patient_id')
@@ -469,12 +909,42 @@ def get_reservations():
     return jsonify(reservations)
 
 @app.route('/api/hospital/<int:hospital_id>/doctors_list', methods=['GET'])
+@conditional_get(hospital_scope)
 def get_hospital_doctors_list(hospital_id):
+    def load():
+        conn = get_db_connection()
+        conn.row_factory = dict_factory
+        doctors = conn.execute('SELECT id, name, specialization FROM doctors WHERE hospital_id = ?', (hospital_id,)).fetchall()
+        conn.close()
+        return doctors
+
+    return jsonify(cache.cache.get_or_load(cache.doctors_key(hospital_id, data_version(hospital_id)), load))
+
+@app.route('/api/hospital/<int:hospital_id>/doctors/<int:doctor_id>/slots', methods=['GET'])
+def get_doctor_slots(hospital_id, doctor_id):
+    """A doctor's open and booked slots for `days` days (default 1, up to 62) from `date` (default today).
+
+    `scheduled` is false for doctors without a parsed weekly schedule; they
+    have no slots and are booked by day (doctor_name and date) instead.
+    """
+    try:
+        first_day = date.fromisoformat(request.args['date']) if request.args.get('date') else date.today()
+    except ValueError:
+        return jsonify({"error": "date must be a YYYY-MM-DD date"}), 400
+    days = min(max(request.args.get('days', 1, type=int), 1), schedule.MAX_DAYS)
+
     conn = get_db_connection()
-    conn.row_factory = dict_factory
-    doctors = conn.execute('SELECT id, name, specialization FROM doctors WHERE hospital_id = ?', (hospital_id,)).fetchall()
+    doctor = conn.execute('''
+        SELECT slot_minutes, EXISTS (SELECT 1 FROM doctor_schedules s WHERE s.doctor_id = d.id) AS scheduled
+        FROM doctors d WHERE d.id = ? AND d.hospital_id = ?
+    ''', (doctor_id, hospital_id)).fetchone()
+    if not doctor:
+        conn.close()
+        return jsonify({"error": "Doctor not found"}), 404
+    calendar = schedule.doctor_slots(conn, [doctor_id], first_day, days)[doctor_id]
     conn.close()
-    return jsonify(doctors)
+    return jsonify({"doctor_id": doctor_id, "slot_minutes": doctor['slot_minutes'] or schedule.DEFAULT_SLOT_MINUTES,
+                    "scheduled": bool(doctor['scheduled']), "days": calendar})
 
 @app.route('/api/patient/appointments', methods=['GET', 'POST'])
 def manage_appointments():
@@ -487,13 +957,40 @@ def manage_appointments():
         hospital_id = data.get('hospital_id')
         doctor_name = data.get('doctor_name')
         
+        appointment_no = "APT-" + str(uuid.uuid4().hex[:8]).upper()
+
+        if data.get('doctor_id') and data.get('slot') is not None:
+            # A slot claim: at most one appointment per doctor per slot.
+            if not isinstance(data['slot'], str) or not isinstance(data['doctor_id'], int):
+                conn.close()
+                return jsonify({"error": "doctor_id must be an id and slot a YYYY-MM-DDTHH:MM time"}), 400
+            try:
+                slot_start = datetime.strptime(data['slot'].replace('T', ' ')[:16], schedule.SLOT_FORMAT)
+                apt = schedule.book(conn, data['doctor_id'], slot_start, patient_id, appointment_no)
+            except ValueError:
+                conn.close()
+                return jsonify({"error": "slot must be a YYYY-MM-DDTHH:MM time"}), 400
+            except schedule.SlotUnavailable as e:
+                conn.close()
+                return jsonify({"error": f"Slot unavailable: {e}"}), 409
+            conn.close()
+            return jsonify({"message": "Appointment booked successfully", **apt})
+
+        # Older clients name the doctor and a day instead of a slot. A doctor
+        # with a parsed schedule is only bookable by slot, so this path cannot
+        # sidestep the unique slot index; unscheduled doctors have no slots to clash.
+        scheduled = conn.execute('''
+            SELECT 1 FROM doctors d
+            WHERE d.hospital_id = ? AND d.name = ? AND EXISTS (SELECT 1 FROM doctor_schedules s WHERE s.doctor_id = d.id)
+        ''', (hospital_id, doctor_name)).fetchone()
+        if scheduled:
+            conn.close()
+            return jsonify({"error": "This doctor is booked by time slot: send doctor_id and slot"}), 400
+
         # Accept either `date` or `appointment_date` from JSON depending on frontend version
         date = data.get('appointment_date') or data.get('date')
-        
-        import uuid
-        appointment_no = "APT-" + str(uuid.uuid4().hex[:8]).upper()
 
-        conn.execute('INSERT INTO appointments (patient_id, hospital_id, doctor_name, appointment_date, date, appointment_no) VALUES (?, ?, ?, ?, ?, ?)',
+        conn.execute('INSERT INTO appointments (patient_id, hospital_id, doctor_name, appointment_date, date, appointment_no, created_at) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)',
                      (patient_id, hospital_id, doctor_name, date, date, appointment_no))
         conn.commit()
         conn.close()
@@ -505,17 +1002,17 @@ def manage_appointments():
             conn.close()
             return jsonify([])
         
-        # Join with hospitals to get name and reports to see if file exists
+        # Join with hospitals to get name, and the latest report to see if a file exists
         appointments = conn.execute('''
-            SELECT a.*, h.name as hospital_name, r.file_path as report_file_path
+            SELECT a.*, h.name as hospital_name, r.id as report_id, r.file_sha256 as report_sha256
             FROM appointments a 
             JOIN hospitals h ON a.hospital_id = h.id 
-            LEFT JOIN reports r ON a.appointment_no = r.appointment_no
+            LEFT JOIN reports r ON r.id = (SELECT id FROM reports WHERE appointment_no = a.appointment_no ORDER BY id DESC LIMIT 1)
             WHERE a.patient_id = ? 
             ORDER BY a.date DESC
         ''', (patient_id,)).fetchall()
         conn.close()
-        return jsonify(appointments)
+        return jsonify(with_file_urls(appointments, 'report_id', 'report_sha256', 'report_file_url'))
 
 @app.route('/api/patient/reports', methods=['GET'])
 def get_patient_reports():
@@ -524,7 +1021,41 @@ def get_patient_reports():
     conn.row_factory = dict_factory
     reports = conn.execute('SELECT * FROM reports WHERE patient_id = ? ORDER BY date_uploaded DESC', (patient_id,)).fetchall()
     conn.close()
-    return jsonify(reports)
+    return jsonify(with_file_urls(reports))
+
+DEFAULT_TIMELINE_PAGE_SIZE = 50
+
+@app.route('/api/patient/<int:patient_id>/timeline', methods=['GET'])
+def get_patient_timeline(patient_id):
+    """A patient's appointments, reservations and reports merged newest first, a page at a time.
+
+    `type` (comma separated: appointment, reservation, report) narrows the
+    sources. `limit` (default 50) and `cursor` page through the events; the
+    next cursor is returned in the X-Next-Cursor header.
+    """
+    types = list(dict.fromkeys(t for t in request.args.get('type', '').split(',') if t)) or None
+    unknown = set(types or ()) - set(timeline.SOURCES)
+    if unknown:
+        return jsonify({"error": f"type must be one of {', '.join(timeline.SOURCES)}"}), 400
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = timeline.parse_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    limit = min(max(request.args.get('limit', DEFAULT_TIMELINE_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+    conn = get_db_connection()
+    conn.row_factory = dict_factory
+    entries = timeline.patient_events(conn, patient_id, types, after, limit)
+    conn.close()
+
+    for entry in with_file_urls(entries, 'report_id', 'report_sha256'):
+        del entry['report_sha256']
+    response = jsonify(entries)
+    if len(entries) == limit:
+        response.headers['X-Next-Cursor'] = timeline.make_cursor(entries[-1])
+    return response
 
 @app.route('/api/patient/search', methods=['GET'])
 def search_patient():
@@ -541,60 +1072,240 @@ def search_patient():
         return jsonify(patient)
     return jsonify({"error": "Patient not found"}), 404
 
+def report_file_url(report_id, digest):
+    """Signed link to a report's file, or None if it has no stored file."""
+    if not digest:
+        return None
+    expires = auth.link_expiry()
+    return url_for('get_report_file', report_id=report_id, expires=expires,
+                   sig=auth.sign(expires, 'report', report_id, digest), _external=True)
+
+def with_file_urls(rows, id_key='id', digest_key='file_sha256', url_key='file_url'):
+    # A signed link opens the file for whoever holds it, so none are handed
+    # to anonymous callers; signed-in ones only reach rows scoped to them.
+    for row in rows:
+        row[url_key] = report_file_url(row[id_key], row[digest_key]) if g.session else None
+    return rows
+
+def lab_order_scope(session):
+    """(conditions, params) limiting reports to the ones a session may read; None if it may read none."""
+    if session['role'] in ('lab_tech', 'admin'):
+        return [], []
+    if session['role'] == 'patient':
+        return ['r.patient_id = ?'], [session['user_id']]
+    if session['role'] == 'hospital_staff' and session['hospital_id'] is not None:
+        return ['r.hospital_id = ?'], [session['hospital_id']]
+    return None
+
+@app.route('/assets/reports/<path:filename>')
+def legacy_report_path(filename):
+    # Reports used to be saved under the static folder; never serve that path.
+    return jsonify({"error": "Not found"}), 404
+
+@app.route('/api/reports/<int:report_id>/file', methods=['GET'])
+def get_report_file(report_id):
+    """Stream a report file to the holder of a signed link, with Range and conditional GET support."""
+    conn = get_db_connection()
+    report = conn.execute('SELECT file_name, file_sha256 FROM reports WHERE id = ?', (report_id,)).fetchone()
+    conn.close()
+    digest = report['file_sha256'] if report else None
+    if not digest or not auth.verify(request.args.get('sig', ''), request.args.get('expires'), 'report', report_id, digest):
+        return jsonify({"error": "Report not found or link expired"}), 403
+    path = blobs.store.path(digest)
+    if not os.path.exists(path):
+        return jsonify({"error": "Report file is missing"}), 404
+
+    file_name = report['file_name'] or digest
+    response = send_file(path, mimetype=mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+                         download_name=file_name, conditional=True, etag=digest, max_age=REPORT_FILE_MAX_AGE)
+    # Patient data: browsers may cache it, shared proxies may not.
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+def resolve_report_patient(conn, patient_id, appointment_no, lab_order_id):
+    """The patient a report belongs to, from the form or its appointment/lab order."""
+    # Try finding patient by appointment OR order_id
+    if appointment_no and not patient_id:
+        apt = conn.execute("SELECT patient_id FROM appointments WHERE appointment_no = ?", (appointment_no,)).fetchone()
+        if apt:
+            patient_id = apt['patient_id']
+
+    if lab_order_id and not patient_id:
+        ord_row = conn.execute("SELECT patient_id FROM reports WHERE lab_order_id = ?", (lab_order_id,)).fetchone()
+        if ord_row:
+            patient_id = ord_row['patient_id']
+    return patient_id
+
+def record_report(conn, patient_id, file_name, digest, size, report_type, lab_name, appointment_no, lab_order_id):
+    """Attach a stored file to its pending lab order, or add an ad-hoc report; returns the report id."""
+    # Path inside the report store; clients download through report_file_url()
+    db_path = blobs.store.relative_path(digest)
+    date_now = datetime.now().strftime("%Y-%m-%d")
+
+    if lab_order_id:
+        # Update existing pending order
+        row = conn.execute('''
+            UPDATE reports SET file_name = ?, file_path = ?, file_size = ?, file_sha256 = ?, status = ?, date_uploaded = ?, appointment_no = ?,
+                completed_at = COALESCE(completed_at, CURRENT_TIMESTAMP)
+            WHERE lab_order_id = ? RETURNING id
+        ''', (file_name, db_path, size, digest, 'Completed', date_now, appointment_no, lab_order_id)).fetchone()
+        if row:
+            return row['id']
+    # Insert ad-hoc report
+    return conn.execute('''
+        INSERT INTO reports (patient_id, file_name, report_name, lab_name, date_uploaded, file_path, file_size, file_sha256, appointment_no, status, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (patient_id, file_name, report_type, lab_name, date_now, db_path, size, digest, appointment_no, 'Completed')).lastrowid
+
 @app.route('/api/lab/upload', methods=['POST'])
 def upload_report():
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
-    
+
     file = request.files['file']
     patient_id = request.form.get('patient_id')
     appointment_no = request.form.get('appointment_no')
     lab_order_id = request.form.get('lab_order_id')
     report_type = request.form.get('report_type')
     lab_name = request.form.get('lab_name', 'Central Lab')
-    
+
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
     conn = get_db_connection()
-    
-    # Try finding patient by appointment OR order_id
-    if appointment_no and not patient_id:
-        apt = conn.execute("SELECT patient_id FROM appointments WHERE appointment_no = ?", (appointment_no,)).fetchone()
-        if apt:
-            patient_id = apt['patient_id']
-            
-    if lab_order_id and not patient_id:
-        ord_row = conn.execute("SELECT patient_id FROM reports WHERE lab_order_id = ?", (lab_order_id,)).fetchone()
-        if ord_row:
-            patient_id = ord_row['patient_id']
-            
+    patient_id = resolve_report_patient(conn, patient_id, appointment_no, lab_order_id)
     if not patient_id:
         conn.close()
         return jsonify({"error": "Patient ID or Valid reference is required"}), 400
 
-    # Save file
-    filename = f"{patient_id}_{file.filename}"
-    filepath = os.path.join(REPORT_UPLOAD_FOLDER, filename)
-    file.save(filepath)
-    
-    # Store relative path for frontend access
-    db_path = f"assets/reports/{filename}" 
-    from datetime import datetime
-    date_now = datetime.now().strftime("%Y-%m-%d")
+    # Save file under its content hash; identical files are stored once.
+    try:
+        digest, size, _ = blobs.store.put_stream(file.stream)
+    except blobs.UploadTooLarge as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 413
 
-    if lab_order_id:
-        # Update existing pending order
-        conn.execute('UPDATE reports SET file_name = ?, file_path = ?, status = ?, date_uploaded = ?, appointment_no = ? WHERE lab_order_id = ?',
-                     (file.filename, db_path, 'Completed', date_now, appointment_no, lab_order_id))
-    else:
-        # Insert ad-hoc report
-        conn.execute('INSERT INTO reports (patient_id, file_name, report_name, lab_name, date_uploaded, file_path, appointment_no, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                     (patient_id, file.filename, report_type, lab_name, date_now, db_path, appointment_no, 'Completed'))
+    record_report(conn, patient_id, file.filename, digest, size, report_type, lab_name, appointment_no, lab_order_id)
+    conn.commit()
+    conn.close()
+
+    return jsonify({"message": "Report uploaded successfully", "sha256": digest, "size": size})
+
+@app.route('/api/lab/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload; the file itself follows in PATCH requests."""
+    data = request.json or {}
+    file_name = data.get('file_name')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        size = -1
+    if not file_name or size < 0:
+        return jsonify({"error": "file_name and size are required"}), 400
+    if size > blobs.MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"upload exceeds {blobs.MAX_UPLOAD_BYTES} bytes"}), 413
+    # Optional: the file's SHA-256, checked once the last byte has arrived.
+    expected = data.get('sha256')
+    if expected is not None and not (isinstance(expected, str) and re.fullmatch(r'[0-9a-fA-F]{64}', expected)):
+        return jsonify({"error": "sha256 must be 64 hex digits"}), 400
+
+    conn = get_db_connection()
+    patient_id = resolve_report_patient(conn, data.get('patient_id'), data.get('appointment_no'), data.get('lab_order_id'))
+    if not patient_id:
+        conn.close()
+        return jsonify({"error": "Patient ID or Valid reference is required"}), 400
+
+    upload_id = uuid.uuid4().hex
+    blobs.store.begin(upload_id)
+    conn.execute('''
+        INSERT INTO upload_sessions (id, patient_id, lab_order_id, appointment_no, report_type, lab_name, file_name, size, sha256)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (upload_id, patient_id, data.get('lab_order_id'), data.get('appointment_no'), data.get('report_type'),
+          data.get('lab_name', 'Central Lab'), file_name, size, expected and expected.lower()))
+    conn.commit()
+    conn.close()
+
+    return upload_progress(upload_id, size, 0), 201
+
+def upload_progress(upload_id, size, received):
+    response = jsonify({"upload_id": upload_id, "size": size, "received": received, "chunk_size": blobs.SESSION_CHUNK_SIZE})
+    response.headers['Upload-Offset'] = str(received)
+    return response
+
+@app.route('/api/lab/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Where to resume: the number of bytes the server holds."""
+    conn = get_db_connection()
+    session = conn.execute('SELECT size FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    conn.close()
+    received = blobs.store.received(upload_id) if session else None
+    if received is None:
+        return jsonify({"error": "Upload session not found"}), 404
+    return upload_progress(upload_id, session['size'], received)
+
+@app.route('/api/lab/uploads/<upload_id>', methods=['PATCH'])
+def append_upload_chunk(upload_id):
+    """Write the request body at the Upload-Offset header; the last byte completes the report."""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header is required"}), 400
+
+    conn = get_db_connection()
+    session = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    if session is None:
+        conn.close()
+        return jsonify({"error": "Upload session not found"}), 404
+    if request.content_length is not None and offset + request.content_length > session['size']:
+        conn.close()
+        return jsonify({"error": "Chunk extends past the announced size"}), 413
+    try:
+        received = blobs.store.write_chunk(upload_id, offset, request.stream, session['size'])
+    except blobs.OffsetMismatch as e:
+        conn.close()
+        return upload_progress(upload_id, session['size'], e.received), 409
+    except blobs.UploadTooLarge:
+        conn.close()
+        return jsonify({"error": "Chunk extends past the announced size"}), 413
+    except FileNotFoundError:
+        conn.close()
+        return jsonify({"error": "Upload session not found"}), 404
+
+    if received < session['size']:
+        conn.close()
+        return upload_progress(upload_id, session['size'], received)
+
+    try:
+        digest, size, stored = blobs.store.finish(upload_id, session['sha256'])
+    except blobs.DigestMismatch as e:
+        # The bytes are wrong somewhere; the client has to start over.
+        conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+        conn.commit()
+        conn.close()
+        return jsonify({"error": "Upload does not match the announced sha256", "sha256": e.digest}), 422
+    report_id = record_report(conn, session['patient_id'], session['file_name'], digest, size, session['report_type'],
+                              session['lab_name'], session['appointment_no'], session['lab_order_id'])
+    conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
     conn.commit()
     conn.close()
+    response = jsonify({"message": "Report uploaded successfully", "report_id": report_id, "sha256": digest,
+                        "size": size, "deduplicated": not stored})
+    response.headers['Upload-Offset'] = str(size)
+    return response, 201
 
-    return jsonify({"message": "Report uploaded successfully"})
+@app.route('/api/lab/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload_session(upload_id):
+    conn = get_db_connection()
+    # Only ids the server issued reach the store, which builds a file path from them.
+    deleted = conn.execute('DELETE FROM upload_sessions WHERE id = ? RETURNING id', (upload_id,)).fetchone()
+    conn.commit()
+    conn.close()
+    if deleted is None:
+        return jsonify({"error": "Upload session not found"}), 404
+    blobs.store.discard(upload_id)
+    return jsonify({"message": "Upload cancelled"})
 
 @app.route('/api/lab/create_order', methods=['POST'])
 def create_lab_order():
@@ -608,40 +1319,172 @@ def create_lab_order():
     if not patient_id:
         return jsonify({"error": "Patient ID required"}), 400
 
-    import uuid
-    lab_order_id = "LAB-" + str(uuid.uuid4().hex[:8]).upper()
+    lab_order_id = labs.new_order_id()
     
     conn = get_db_connection()
-    from datetime import datetime
     date_now = datetime.now().strftime("%Y-%m-%d")
 
     conn.execute('''
-        INSERT INTO reports (patient_id, hospital_id, doctor_name, report_name, lab_name, date_uploaded, status, lab_order_id, file_name) 
-        VALUES (?, ?, ?, ?, ?, ?, 'Pending', ?, 'Pending Upload')
+        INSERT INTO reports (patient_id, hospital_id, doctor_name, report_name, lab_name, date_uploaded, status, lab_order_id, file_name, ordered_at) 
+        VALUES (?, ?, ?, ?, ?, ?, 'Pending', ?, 'Pending Upload', CURRENT_TIMESTAMP)
     ''', (patient_id, hospital_id, doctor_name, report_type, lab_name, date_now, lab_order_id))
     
     conn.commit()
     conn.close()
     return jsonify({"message": "Lab Order Created", "lab_order_id": lab_order_id})
 
+@app.route('/api/lab/orders/bulk', methods=['POST'])
+def create_lab_orders_bulk():
+    """Create many pending lab orders in one transaction; one result per order."""
+    orders = request.json
+    if not isinstance(orders, list) or not orders:
+        return jsonify({"error": "Expected a non-empty list of orders"}), 400
+    if len(orders) > labs.MAX_BULK_ORDERS:
+        return jsonify({"error": f"At most {labs.MAX_BULK_ORDERS} orders per request"}), 413
+
+    conn = get_db_connection()
+    results = labs.create_orders(conn, orders)
+    conn.close()
+    created = sum('lab_order_id' in r for r in results)
+    return jsonify({"created": created, "failed": len(results) - created, "results": results})
+
+def report_key_from_name(file_name):
+    """Map a file named after its order or appointment (LAB-1A2B3C4D.pdf, APT-...) to that reference."""
+    stem = os.path.splitext(os.path.basename(file_name))[0].upper()
+    if stem.startswith('LAB-'):
+        return {"lab_order_id": stem}
+    if stem.startswith('APT-'):
+        return {"appointment_no": stem}
+    return {}
+
+def batch_report_files(files):
+    """(file name, readable stream) for every uploaded file and every member of uploaded zips."""
+    for file in files:
+        if file.filename.lower().endswith('.zip') or file.mimetype in ('application/zip', 'application/x-zip-compressed'):
+            with zipfile.ZipFile(file.stream) as archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or not name or member.filename.startswith('__MACOSX/'):
+                        continue
+                    with archive.open(member) as stream:
+                        yield name, stream
+        else:
+            yield file.filename, file.stream
+
+@app.route('/api/lab/upload/batch', methods=['POST'])
+def upload_report_batch():
+    """Store many report files (or a zip of them) and file each against its lab order or appointment.
+
+    Files are matched by the optional `manifest` form field, a JSON object
+    mapping file names to {"lab_order_id" | "appointment_no", "report_type"},
+    or else by their names (LAB-xxxxxxxx.pdf / APT-xxxxxxxx.pdf).
+    """
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not files:
+        return jsonify({"error": "No files"}), 400
+    try:
+        manifest = json.loads(request.form.get('manifest') or '{}')
+    except ValueError:
+        return jsonify({"error": "manifest must be a JSON object"}), 400
+    if not isinstance(manifest, dict):
+        return jsonify({"error": "manifest must be a JSON object"}), 400
+    defaults = {"report_type": request.form.get('report_type'), "lab_name": request.form.get('lab_name', 'Central Lab')}
+
+    items = []
+    try:
+        for name, stream in batch_report_files(files):
+            if len(items) == labs.MAX_BATCH_FILES:
+                return jsonify({"error": f"At most {labs.MAX_BATCH_FILES} files per batch"}), 413
+            entry = manifest.get(name)
+            item = {**defaults, **(entry if isinstance(entry, dict) else report_key_from_name(name)), "file_name": name}
+            try:
+                item["sha256"], item["size"], _ = blobs.store.put_stream(stream)
+            except blobs.UploadTooLarge as e:
+                item["error"] = str(e)
+            items.append(item)
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Not a valid zip archive"}), 400
+
+    conn = get_db_connection()
+    results = labs.attach_reports(conn, items)
+    conn.close()
+    stored = sum('error' not in r for r in results)
+    return jsonify({"stored": stored, "failed": len(results) - stored, "results": results})
+
+LAB_ORDER_COLUMNS = (
+    'r.id', 'r.lab_order_id', 'r.patient_id', 'r.hospital_id', 'r.doctor_name', 'r.report_name', 'r.lab_name',
+    'r.status', 'r.date_uploaded', 'r.appointment_no', 'r.file_name', 'r.file_size', 'r.file_sha256',
+)
+DEFAULT_LAB_PAGE_SIZE = 50
+
 @app.route('/api/lab/orders', methods=['GET'])
 def get_lab_orders():
+    """Newest lab orders first, a page at a time.
+
+    Filters: `status` (Pending/Completed), `lab_name`, `hospital_id`, `from`/`to`
+    (YYYY-MM-DD, inclusive, on date_uploaded) and `q` (a lab order id or
+    patient Hospitrack ID). `limit` (default 50) and `cursor` page through the
+    results; the next cursor is returned in the X-Next-Cursor header.
+
+    Needs a session: lab technicians and admins see every order, hospital
+    staff their hospital's and patients their own.
+    """
+    if g.session is None:
+        return jsonify({"error": "Login required"}), 401
+    scope = lab_order_scope(g.session)
+    if scope is None:
+        return jsonify({"error": "Not permitted for this account"}), 403
+    conditions, params = scope
+    for arg, column in (('status', 'r.status'), ('lab_name', 'r.lab_name'), ('hospital_id', 'r.hospital_id')):
+        if request.args.get(arg):
+            conditions.append(f'{column} = ?')
+            params.append(request.args[arg])
+    for arg, op in (('from', '>='), ('to', '<=')):
+        if request.args.get(arg):
+            try:
+                day = datetime.strptime(request.args[arg], '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                return jsonify({"error": f"{arg} must be a YYYY-MM-DD date"}), 400
+            conditions.append(f'r.date_uploaded {op} ?')
+            params.append(day)
+    if request.args.get('q'):
+        q = request.args['q'].strip().upper()
+        conditions.append('(r.lab_order_id = ? OR r.patient_id IN (SELECT id FROM users WHERE hospitrack_id = ?))')
+        params += [q, q]
+    cursor = request.args.get('cursor', type=int)
+    if cursor is not None:
+        conditions.append('r.id < ?')
+        params.append(cursor)
+    limit = min(max(request.args.get('limit', DEFAULT_LAB_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
     conn = get_db_connection()
     conn.row_factory = dict_factory
-    
     # We join with users to get patient name
-    orders = conn.execute('''
-        SELECT r.*, u.full_name as patient_name, u.hospitrack_id as patient_uid
+    orders = conn.execute(f'''
+        SELECT {', '.join(LAB_ORDER_COLUMNS)}, u.full_name as patient_name, u.hospitrack_id as patient_uid
         FROM reports r
         JOIN users u ON r.patient_id = u.id
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
         ORDER BY r.id DESC
-    ''').fetchall()
-    
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
     conn.close()
-    return jsonify(orders)
+
+    for order in with_file_urls(orders):
+        del order['file_sha256']
+    response = jsonify(orders)
+    if len(orders) == limit:
+        response.headers['X-Next-Cursor'] = str(orders[-1]['id'])
+    return response
 
 if __name__ == '__main__':
+    # Development server; serve.py runs pre-forked workers for production.
     # Ensure tables exist
     import init_db
     init_db.init_db()
+    # With the debug reloader, only the serving child process sweeps.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        expiry.start_scheduler()
+        if sse.SSE_PORT:
+            sse.SSEServer().start_in_thread()
     app.run(debug=True, port=9000)
@@ -0,0 +1,250 @@
+"""Password hashing, session tokens and signed, expiring links.
+
+A link or session token carries an expiry time and an HMAC over its
+contents, so checking it is a local computation: no session lookup and no
+database query. The key is HOSPITRACK_SECRET_KEY, or a random key generated
+once into SECRET_KEY_PATH and shared by every worker process on the host.
+
+Logging out revokes a token by its session id. Revocations are written to
+`revoked_sessions` and each process keeps its own copy in memory, pulling
+new rows at most every REVOCATION_REFRESH_SECONDS, so a revoked token stops
+working everywhere within that interval. An entry is dropped once the token
+it names would have expired anyway.
+
+Passwords are stored as PBKDF2-SHA256 hashes. Rows from before hashing
+still hold the plaintext; check_password() accepts them and asks the caller
+to re-hash, which login() does, so each account upgrades on its next login.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+from database import pool
+
+SECRET_KEY_PATH = os.environ.get('HOSPITRACK_SECRET_KEY_PATH', os.path.join(os.path.dirname(__file__), '../database/secret.key'))
+# Links stay unchanged for a whole window so browsers can reuse cached copies.
+LINK_TTL_SECONDS = int(os.environ.get('HOSPITRACK_LINK_TTL', 3600))
+SESSION_TTL_SECONDS = int(os.environ.get('HOSPITRACK_SESSION_TTL', 12 * 3600))
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('HOSPITRACK_REVOCATION_REFRESH', 5))
+# Raising this re-hashes each password at its owner's next login.
+PBKDF2_ITERATIONS = int(os.environ.get('HOSPITRACK_PBKDF2_ITERATIONS', 600_000))
+# Refuse API requests without a valid session, except app.PUBLIC_ENDPOINTS.
+# HOSPITRACK_REQUIRE_SESSIONS=0 lets older clients read anonymously; an
+# anonymous write that names a patient or hospital is refused either way.
+REQUIRE_SESSIONS = os.environ.get('HOSPITRACK_REQUIRE_SESSIONS', '1') not in ('', '0')
+ACCOUNT_KEYS = ('patient_id', 'user_id', 'hospital_id')
+
+# AUTOINCREMENT so ids are never reused after pruning: processes sync by id.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS revoked_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL UNIQUE,
+    expires_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_sessions_expires ON revoked_sessions (expires_at);
+'''
+
+_secret_key = None
+
+
+def secret_key():
+    global _secret_key
+    if _secret_key is None:
+        configured = os.environ.get('HOSPITRACK_SECRET_KEY')
+        if configured:
+            _secret_key = configured.encode()
+        else:
+            if not os.path.exists(SECRET_KEY_PATH):
+                tmp_path = f'{SECRET_KEY_PATH}.{os.getpid()}'
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(secrets.token_hex(32))
+                try:
+                    # Linking fails if another worker got there first; its key wins.
+                    os.link(tmp_path, SECRET_KEY_PATH)
+                except FileExistsError:
+                    pass
+                finally:
+                    os.remove(tmp_path)
+            with open(SECRET_KEY_PATH) as f:
+                _secret_key = f.read().strip().encode()
+    return _secret_key
+
+
+def sign(*parts):
+    message = '\n'.join(str(p) for p in parts).encode()
+    return hmac.new(secret_key(), message, hashlib.sha256).hexdigest()
+
+
+def link_expiry(now=None, ttl=LINK_TTL_SECONDS):
+    """End of the window after the current one: valid for ttl to 2*ttl seconds."""
+    now = time.time() if now is None else now
+    return (int(now) // ttl + 2) * ttl
+
+
+def verify(signature, expires, *parts):
+    """True if `signature` was made by sign(expires, *parts) and has not expired."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(str(signature), sign(expires, *parts))
+
+
+# --- Passwords ---
+
+_HASH_SCHEME = 'pbkdf2_sha256'
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS):
+    salt = secrets.token_hex(16)
+    return f'{_HASH_SCHEME}${iterations}${salt}${_pbkdf2(password, salt, iterations)}'
+
+
+def check_password(stored, password):
+    """(matches, needs_rehash) for a stored hash or a legacy plaintext password.
+
+    With no stored password (unknown user) a hash is still computed, so the
+    reply takes as long as it would for a real account.
+    """
+    password = password if isinstance(password, str) else ''
+    if stored is None:
+        _pbkdf2(password, '', PBKDF2_ITERATIONS)
+        return False, False
+    if not stored.startswith(_HASH_SCHEME + '$'):
+        return bool(password) and hmac.compare_digest(stored.encode(), password.encode()), True
+    _, iterations, salt, digest = stored.split('$')
+    matches = hmac.compare_digest(_pbkdf2(password, salt, int(iterations)), digest)
+    return matches, int(iterations) < PBKDF2_ITERATIONS
+
+
+# --- Sessions ---
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+_session_mac = None
+
+
+def _sign_session(payload):
+    """sign('session', payload), reusing the keyed HMAC state instead of re-keying per call."""
+    global _session_mac
+    if _session_mac is None:
+        _session_mac = hmac.new(secret_key(), b'session\n', hashlib.sha256)
+    mac = _session_mac.copy()
+    mac.update(payload.encode())
+    return mac.hexdigest()
+
+
+def issue_session(user, now=None, ttl=SESSION_TTL_SECONDS):
+    """(token, expires) for a users row: its id, role and hospital signed together."""
+    expires = int(time.time() if now is None else now) + ttl
+    hospital_id = user.get('hospital_id')
+    claims = f"{user['id']}\n{user['role']}\n{'' if hospital_id is None else hospital_id}\n{expires}\n{secrets.token_urlsafe(12)}"
+    payload = _b64(claims.encode())
+    return f'{payload}.{_sign_session(payload)}', expires
+
+
+def verify_session(token, now=None):
+    """The session dict a token carries, or None if it is forged, expired or revoked."""
+    payload, _, signature = str(token).partition('.')
+    if not hmac.compare_digest(signature.encode(), _sign_session(payload).encode()):
+        return None
+    user_id, role, hospital_id, expires, session_id = (
+        base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode().split('\n'))
+    expires = int(expires)
+    if expires < (time.time() if now is None else now) or revocations.is_revoked(session_id):
+        return None
+    return {"user_id": int(user_id), "role": role, "hospital_id": int(hospital_id) if hospital_id else None,
+            "session_id": session_id, "expires": expires}
+
+
+def names_account(sources):
+    """True if any mapping in sources carries a patient, user or hospital id."""
+    return any(source.get(key) is not None for source in sources for key in ACCOUNT_KEYS)
+
+
+def owns(session, sources, write=False):
+    """False if any mapping in sources names another patient (for patients) or, on a write, another hospital (for staff)."""
+    if session['role'] == 'patient':
+        keys, own = ('patient_id', 'user_id'), session['user_id']
+    elif session['role'] == 'hospital_staff' and write and session['hospital_id'] is not None:
+        keys, own = ('hospital_id',), session['hospital_id']
+    else:
+        return True
+    return all(str(source[key]) == str(own) for source in sources for key in keys if source.get(key) is not None)
+
+
+class RevocationList:
+    """In-process mirror of revoked_sessions, refreshed every `refresh` seconds.
+
+    Holds only revocations whose tokens are still unexpired, so its size is
+    bounded by the logouts in one SESSION_TTL_SECONDS window.
+    """
+
+    def __init__(self, refresh=REVOCATION_REFRESH_SECONDS):
+        self.refresh = refresh
+        self._revoked = {}
+        self._last_id = 0
+        self._synced_at = float('-inf')
+        self._lock = threading.Lock()
+        self.syncs = 0
+
+    def revoke(self, session_id, expires):
+        conn = pool.connect()
+        try:
+            conn.execute('INSERT OR IGNORE INTO revoked_sessions (session_id, expires_at) VALUES (?, ?)', (session_id, expires))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._revoked[session_id] = expires
+
+    def is_revoked(self, session_id):
+        if time.monotonic() - self._synced_at >= self.refresh:
+            self.sync(force=False)
+        return session_id in self._revoked
+
+    def sync(self, force=True):
+        """Pull revocations written since the last sync, by this or any other process."""
+        with self._lock:
+            if not force and time.monotonic() - self._synced_at < self.refresh:
+                return  # another thread synced while this one waited
+            conn = pool.connect()
+            try:
+                rows = conn.execute('SELECT id, session_id, expires_at FROM revoked_sessions WHERE id > ? ORDER BY id',
+                                    (self._last_id,)).fetchall()
+            finally:
+                conn.close()
+            now = time.time()
+            live = {session_id: expires for session_id, expires in self._revoked.items() if expires >= now}
+            for row_id, session_id, expires in rows:
+                self._last_id = row_id
+                if expires >= now:
+                    live[session_id] = expires
+            self._revoked = live
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+
+    def stats(self):
+        return {"revoked": len(self._revoked), "syncs": self.syncs, "refresh_seconds": self.refresh}
+
+
+revocations = RevocationList()
+
+
+def prune_revocations(conn, now=None):
+    """Delete revocations of tokens that have expired anyway; returns how many."""
+    now = int(time.time() if now is None else now)
+    return conn.execute('DELETE FROM revoked_sessions WHERE expires_at < ?', (now,)).rowcount
@@ -0,0 +1,119 @@
+"""Materialized bed availability per hospital and per (hospital, bed type).
+
+The summary tables are created by migration 4 (migrations.py) and
+maintained by the triggers below, so every write to `beds` (add/update/
+delete a bed type, reserve, refund) adjusts them inside the same
+transaction.
+
+Run as a script to rebuild the summaries from `beds` and report drift:
+
+    python backend/bed_summary.py [--dry-run]
+"""
+import argparse
+import sys
+
+from database import connect
+
+_ADD = '''
+    INSERT INTO bed_summary (hospital_id, total_count, available_count)
+    SELECT NEW.hospital_id, COALESCE(NEW.total_count, 0), COALESCE(NEW.available_count, 0)
+    WHERE NEW.hospital_id IS NOT NULL
+    ON CONFLICT (hospital_id) DO UPDATE SET
+        total_count = total_count + excluded.total_count,
+        available_count = available_count + excluded.available_count;
+    INSERT INTO bed_type_summary (hospital_id, bed_type, total_count, available_count)
+    SELECT NEW.hospital_id, NEW.bed_type, COALESCE(NEW.total_count, 0), COALESCE(NEW.available_count, 0)
+    WHERE NEW.hospital_id IS NOT NULL
+    ON CONFLICT (hospital_id, bed_type) DO UPDATE SET
+        total_count = total_count + excluded.total_count,
+        available_count = available_count + excluded.available_count;
+'''
+
+_SUBTRACT = '''
+    UPDATE bed_summary SET
+        total_count = total_count - COALESCE(OLD.total_count, 0),
+        available_count = available_count - COALESCE(OLD.available_count, 0)
+    WHERE hospital_id = OLD.hospital_id;
+    UPDATE bed_type_summary SET
+        total_count = total_count - COALESCE(OLD.total_count, 0),
+        available_count = available_count - COALESCE(OLD.available_count, 0)
+    WHERE hospital_id = OLD.hospital_id AND bed_type = OLD.bed_type;
+'''
+
+TRIGGERS = f'''
+CREATE TRIGGER IF NOT EXISTS beds_summary_insert AFTER INSERT ON beds
+BEGIN {_ADD} END;
+
+CREATE TRIGGER IF NOT EXISTS beds_summary_delete AFTER DELETE ON beds
+BEGIN {_SUBTRACT} END;
+
+CREATE TRIGGER IF NOT EXISTS beds_summary_update
+AFTER UPDATE OF hospital_id, bed_type, total_count, available_count ON beds
+BEGIN {_SUBTRACT} {_ADD} END;
+'''
+
+_EXPECTED_BY_HOSPITAL = '''
+    SELECT hospital_id, COALESCE(SUM(total_count), 0), COALESCE(SUM(available_count), 0)
+    FROM beds WHERE hospital_id IS NOT NULL GROUP BY hospital_id
+'''
+_EXPECTED_BY_TYPE = '''
+    SELECT hospital_id, bed_type, COALESCE(SUM(total_count), 0), COALESCE(SUM(available_count), 0)
+    FROM beds WHERE hospital_id IS NOT NULL GROUP BY hospital_id, bed_type
+'''
+
+
+def find_drift(conn):
+    """Return [(table, key, stored, expected)] for every summary row that disagrees with `beds`."""
+    drift = []
+    checks = (
+        ('bed_summary', _EXPECTED_BY_HOSPITAL,
+         'SELECT hospital_id, total_count, available_count FROM bed_summary', 1),
+        ('bed_type_summary', _EXPECTED_BY_TYPE,
+         'SELECT hospital_id, bed_type, total_count, available_count FROM bed_type_summary', 2),
+    )
+    for table, expected_sql, stored_sql, key_len in checks:
+        expected = {tuple(r[:key_len]): tuple(r[key_len:]) for r in conn.execute(expected_sql)}
+        stored = {tuple(r[:key_len]): tuple(r[key_len:]) for r in conn.execute(stored_sql)}
+        for key in expected.keys() | stored.keys():
+            # Rows that have dropped to zero are equivalent to missing ones.
+            have = stored.get(key, (0, 0))
+            want = expected.get(key, (0, 0))
+            if have != want:
+                drift.append((table, key, have, want))
+    return drift
+
+
+def rebuild(conn):
+    """Recompute both summary tables from `beds` in the current transaction."""
+    conn.execute('DELETE FROM bed_summary')
+    conn.execute('DELETE FROM bed_type_summary')
+    conn.execute(f'INSERT INTO bed_summary (hospital_id, total_count, available_count) {_EXPECTED_BY_HOSPITAL}')
+    conn.execute(f'INSERT INTO bed_type_summary (hospital_id, bed_type, total_count, available_count) {_EXPECTED_BY_TYPE}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the bed availability summaries against the beds table.')
+    parser.add_argument('--dry-run', action='store_true', help='report drift without rebuilding')
+    args = parser.parse_args()
+
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    drift = find_drift(conn)
+    for table, key, have, want in sorted(drift):
+        print(f"{table} {key}: stored total/available={have}, beds say {want}")
+    if drift and not args.dry_run:
+        rebuild(conn)
+    conn.commit()
+    conn.close()
+
+    if not drift:
+        print("Bed summaries are consistent.")
+    elif args.dry_run:
+        print(f"{len(drift)} summary rows drifted (not rebuilt).")
+    else:
+        print(f"{len(drift)} summary rows drifted; rebuilt from beds.")
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
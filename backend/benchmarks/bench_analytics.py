@@ -0,0 +1,115 @@
+"""Hospital analytics: rollup reads vs scanning the raw tables, and the write cost.
+
+Seeds a year of appointments, reservations and lab orders across
+--hospitals hospitals (--rows of each), then times
+GET /api/hospital/<id>/analytics against computing the same hour-of-day
+profile and daily trend straight from the raw rows. Also times inserting
+with and without the rollup triggers, and a full backfill.
+
+    python backend/benchmarks/bench_analytics.py [--rows 1000000] [--hospitals 20]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import common
+
+import analytics
+import migrations
+
+START = datetime(2025, 10, 1)
+
+
+def raw_report(conn, hospital_id, since):
+    """The hour-of-day profile and daily trend computed from the raw rows."""
+    profile = conn.execute('''
+        SELECT strftime('%H', ts, 'localtime') AS h, COUNT(*) FROM (
+            SELECT created_at AS ts FROM appointments WHERE hospital_id = ? AND created_at >= ?
+            UNION ALL SELECT timestamp FROM bed_reservations WHERE hospital_id = ? AND timestamp >= ?
+            UNION ALL SELECT ordered_at FROM reports WHERE hospital_id = ? AND ordered_at >= ?
+        ) GROUP BY h
+    ''', (hospital_id, since) * 3).fetchall()
+    daily = conn.execute('''
+        SELECT date(completed_at, 'localtime') AS d, COUNT(*), AVG((julianday(completed_at) - julianday(ordered_at)) * 24)
+        FROM reports WHERE hospital_id = ? AND completed_at >= ? GROUP BY d
+    ''', (hospital_id, since)).fetchall()
+    served = conn.execute('SELECT COUNT(*) FROM appointments WHERE hospital_id = ?', (hospital_id,)).fetchone()
+    return profile, daily, served
+
+
+def rows(rng, count, hospitals):
+    for _ in range(count):
+        at = START + timedelta(seconds=rng.randrange(365 * 86400))
+        yield rng.randint(1, hospitals), at.strftime('%Y-%m-%d %H:%M:%S'), at
+
+
+def seed(conn, count, hospitals, rng):
+    conn.executemany("INSERT INTO appointments (patient_id, hospital_id, doctor_name, date, created_at) VALUES (1, ?, 'Dr. Bench', ?, ?)",
+                     ((h, at.date().isoformat(), ts) for h, ts, at in rows(rng, count, hospitals)))
+    conn.executemany("INSERT INTO bed_reservations (patient_id, hospital_id, bed_type, timestamp) VALUES (1, ?, 'ICU', ?)",
+                     ((h, ts) for h, ts, _ in rows(rng, count, hospitals)))
+    conn.executemany('''
+        INSERT INTO reports (patient_id, hospital_id, report_name, status, ordered_at, completed_at)
+        VALUES (1, ?, 'CBC', 'Completed', ?, ?)
+    ''', ((h, ts, (at + timedelta(hours=rng.uniform(1, 72))).strftime('%Y-%m-%d %H:%M:%S'))
+          for h, ts, at in rows(rng, count, hospitals)))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000, help='appointments, reservations and lab orders each')
+    parser.add_argument('--hospitals', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, 4)
+    # The raw-scan comparison gets the indexes it would need.
+    conn.executescript('''
+        CREATE INDEX bench_appointments_created ON appointments (hospital_id, created_at);
+        CREATE INDEX bench_reports_ordered ON reports (hospital_id, ordered_at);
+        CREATE INDEX bench_reports_completed ON reports (hospital_id, completed_at);
+    ''')
+
+    sample = 50000
+    start = time.perf_counter()
+    seed(conn, sample, args.hospitals, rng)
+    with_triggers = time.perf_counter() - start
+    triggers = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%analytics%'")]
+    for name in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    start = time.perf_counter()
+    seed(conn, sample, args.hospitals, rng)
+    without = time.perf_counter() - start
+    print(f'insert {3 * sample:,} rows  with rollup triggers {with_triggers:6.2f} s   without {without:6.2f} s   '
+          f'({(with_triggers - without) / (3 * sample) * 1e6:.1f} us/row)')
+
+    seed(conn, args.rows - 2 * sample, args.hospitals, rng)
+    start = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    analytics.rebuild(conn)
+    conn.commit()
+    print(f'backfill of {3 * args.rows:,} rows: {time.perf_counter() - start:.2f} s')
+    migrations.run_script(conn, analytics.TRIGGERS)
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    from app import app
+    client = common.signed_in(app.test_client())
+    now = START + timedelta(days=365)
+    print(f'\n{args.rows:,} appointments, reservations and lab orders over {args.hospitals} hospitals')
+    for days in (7, 30, 365):
+        since = (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        _, samples = common.timed(lambda: analytics.hospital_report(conn, 7, days, now), args.repeat)
+        common.report(f'  rollups, {days:3} days', samples)
+        _, samples = common.timed(lambda: raw_report(conn, 7, since), max(args.repeat // 4, 1))
+        common.report(f'  raw rows, {days:3} days', samples)
+    _, samples = common.timed(lambda: client.get('/api/hospital/7/analytics'), args.repeat)
+    common.report('  GET /api/hospital/7/analytics', samples)
+
+
+if __name__ == '__main__':
+    main()
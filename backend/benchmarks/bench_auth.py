@@ -0,0 +1,78 @@
+"""Session tokens: per-request verification cost with many active sessions.
+
+Issues --sessions tokens and revokes --revoked of them from "another
+worker" (rows written straight to revoked_sessions), then times
+auth.verify_session() over every token, the same check done by a request
+through the app, and a per-request users-table lookup for comparison. A
+login (PBKDF2) is timed too: it is slow on purpose and happens once per
+session.
+
+    python backend/benchmarks/bench_auth.py [--sessions 50000] [--revoked 0.1]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+import common
+
+import auth
+
+
+def per_call_us(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=50000)
+    parser.add_argument('--revoked', type=float, default=0.1, help='fraction of sessions logged out')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(21)
+    conn = common.fresh_database()
+    conn.executemany("INSERT INTO users (id, username, password, role, full_name) VALUES (?, ?, 'x', 'patient', ?)",
+                     ((i, f'patient{i}', f'Patient {i}') for i in range(1, args.sessions + 1)))
+    conn.execute("INSERT INTO users (id, username, password, role, full_name) VALUES (0, 'bench', 'secret', 'patient', 'Bench')")
+    conn.commit()
+
+    sessions = [auth.issue_session({"id": i, "role": 'patient', "hospital_id": None})[0] for i in range(1, args.sessions + 1)]
+    revoked = set(rng.sample(range(len(sessions)), int(len(sessions) * args.revoked)))
+    conn.executemany('INSERT INTO revoked_sessions (session_id, expires_at) VALUES (?, ?)',
+                     ((auth.verify_session(sessions[i])['session_id'], int(time.time()) + 3600) for i in revoked))
+    conn.commit()
+    tracemalloc.start()
+    auth.revocations.sync()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{len(sessions):,} active sessions, {len(revoked):,} revoked ({memory / 1024:,.0f} KiB of revocations in memory)')
+
+    rejected = [i for i, token in enumerate(sessions) if auth.verify_session(token) is None]
+    assert set(rejected) == revoked, 'revoked and rejected sessions differ'
+    print(f'  verify_session, every token          {per_call_us(auth.verify_session, sessions):8.1f} us per call')
+    forged = [token[:-4] + '0000' for token in rng.sample(sessions, 5000)]
+    print(f'  verify_session, forged tokens        {per_call_us(auth.verify_session, forged):8.1f} us per call')
+    print(f'  users lookup by id (open connection) '
+          f'{per_call_us(lambda i: conn.execute("SELECT * FROM users WHERE id = ?", (i,)).fetchone(), range(1, 5001)):8.1f} us per call')
+
+    from app import app
+    client = app.test_client()
+    picks = [i for i in rng.sample(range(len(sessions)), args.requests) if i not in revoked]
+    path = '/api/hospital/1/doctors_list'
+    auth.REQUIRE_SESSIONS = False  # HOSPITRACK_REQUIRE_SESSIONS=0, for the comparison only
+    anonymous = per_call_us(lambda i: client.get(path), picks)
+    auth.REQUIRE_SESSIONS = True
+    signed_in = per_call_us(lambda i: client.get(path, headers={'Authorization': f'Bearer {sessions[i]}'}), picks)
+    print(f'  GET {path} without a token {anonymous:8.1f} us per request (legacy anonymous reads)')
+    print(f'  GET {path} with a token    {signed_in:8.1f} us per request ({signed_in - anonymous:+.1f} us)')
+
+    _, samples = common.timed(lambda: client.post('/api/login', json={'username': 'bench', 'password': 'secret'}), 5)
+    common.report(f'  login (PBKDF2, {auth.PBKDF2_ITERATIONS:,} iterations)', samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Mass-casualty burst: batch dispatch vs one reserve() transaction per patient.
+
+Seeds hospitals around a city, then allocates bursts of emergency requests
+clustered near an incident, once through dispatch.dispatch() in batches and
+once the way individual reserve_bed calls would (nearest hospital with a
+free bed, own transaction each). Checks bed counts stay consistent.
+
+    python backend/benchmarks/bench_dispatch.py [--hospitals 5000] [--requests 20000] [--batch 2000]
+"""
+import argparse
+import random
+import shutil
+import time
+
+import common
+import bed_summary
+import dispatch
+import geo
+import reservations
+from database import DB_PATH, connect
+
+CITY = (28.61, 77.21)
+BED_TYPES = ('ICU', 'General Ward', 'Ventilator', 'Emergency')
+URGENCIES = ('Critical', 'High', 'Normal')
+
+
+def make_requests(n, rng):
+    return [{
+        'urgency': rng.choices(URGENCIES, weights=(2, 3, 5))[0],
+        'bed_type': rng.choice(BED_TYPES),
+        'lat': rng.gauss(CITY[0], 0.05),
+        'lon': rng.gauss(CITY[1], 0.05),
+        'patient_id': i,
+    } for i in range(n)]
+
+
+def check_grid(rng, n=500, lookups=200):
+    """The ring search must agree with a distance to every hospital, fills included."""
+    rows = [(i, rng.gauss(CITY[0], 0.3), rng.gauss(CITY[1], 0.3), rng.randint(1, 3)) for i in range(n)]
+    grid = dispatch.CapacityGrid(rows)
+    free = {i: f for i, _, _, f in rows}
+    for _ in range(lookups):
+        lat, lon = rng.gauss(CITY[0], 0.1), rng.gauss(CITY[1], 0.1)
+        expected = min((geo.haversine_km(lat, lon, h_lat, h_lon), i) for i, h_lat, h_lon, _ in rows if free[i])
+        km, hospital_id = grid.nearest(lat, lon)
+        assert hospital_id == expected[1] and abs(km - expected[0]) < 1e-6, (lat, lon, km, hospital_id, expected)
+        grid.take(hospital_id)
+        free[hospital_id] -= 1
+
+
+def one_by_one(conn, requests):
+    condition = 'EXISTS (SELECT 1 FROM beds b WHERE b.hospital_id = g.id AND b.bed_type = ? AND b.available_count > 0)'
+    placed = 0
+    for r in requests:
+        for _, hospital_id in geo.nearest(conn, r['lat'], r['lon'], 1, condition, (r['bed_type'],)):
+            try:
+                reservations.reserve(conn, r['patient_id'], hospital_id, r['bed_type'], urgency=r['urgency'])
+                placed += 1
+            except reservations.BedUnavailable:
+                pass
+    return placed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hospitals', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    check_grid(rng)
+    conn = common.fresh_database()
+    conn.executemany('INSERT INTO hospitals (id, name, location, latitude, longitude) VALUES (?, ?, ?, ?, ?)',
+                     ((i, f'Hospital {i}', 'Metro', rng.gauss(CITY[0], 0.3), rng.gauss(CITY[1], 0.3)) for i in range(1, args.hospitals + 1)))
+    conn.executemany('INSERT INTO beds (hospital_id, bed_type, total_count, available_count, price) VALUES (?, ?, ?, ?, 100)',
+                     ((h, t, 10, rng.randint(0, 10)) for h in range(1, args.hospitals + 1) for t in BED_TYPES))
+    conn.commit()
+    free = conn.execute('SELECT SUM(available_count) FROM beds').fetchone()[0]
+    conn.close()
+    print(f'Seeded {args.hospitals} hospitals with {free} free beds; {args.requests} requests near one incident\n')
+
+    snapshot = DB_PATH + '.seed'
+    shutil.copy(DB_PATH, snapshot)
+    requests = make_requests(args.requests, rng)
+
+    conn = connect()
+    start = time.perf_counter()
+    assigned = 0
+    for i in range(0, len(requests), args.batch):
+        placed, _, _ = dispatch.dispatch(conn, requests[i:i + args.batch])
+        assigned += len(placed)
+    elapsed = time.perf_counter() - start
+    assert not bed_summary.find_drift(conn)
+    left = conn.execute('SELECT SUM(available_count) FROM beds').fetchone()[0]
+    assert left == free - assigned and conn.execute('SELECT MIN(available_count) FROM beds').fetchone()[0] >= 0
+    conn.close()
+    s = dispatch.stats.snapshot()
+    print(f'dispatch (batches of {args.batch}): {assigned} placed in {elapsed:.2f} s = {len(requests) / elapsed:,.0f} requests/s; '
+          f'batch p50 {s["batch_ms_p50"]:.1f} ms, p95 {s["batch_ms_p95"]:.1f} ms, max {s["batch_ms_max"]:.1f} ms')
+
+    shutil.copy(snapshot, DB_PATH)
+    conn = connect()
+    start = time.perf_counter()
+    placed = one_by_one(conn, requests)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    print(f'one reserve() per request:     {placed} placed in {elapsed:.2f} s = {len(requests) / elapsed:,.0f} requests/s '
+          f'(arrival order, no urgency priority)')
+
+
+if __name__ == '__main__':
+    main()
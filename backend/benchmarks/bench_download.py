@@ -0,0 +1,158 @@
+"""Concurrent downloads of a large report: memory stays flat while streaming.
+
+Stores one --size MB report, then has --clients threads download it at once
+from a real threaded Werkzeug server over HTTP, first whole and then as
+Range requests for random 1 MB slices. The process RSS is sampled
+throughout. For contrast, the same download runs against a handler that
+reads the file into memory before responding.
+
+    python backend/benchmarks/bench_download.py [--size 256] [--clients 16]
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import common
+import blobs
+from werkzeug.serving import make_server
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class RSSSampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(0.01):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def serve(wsgi_app):
+    server = make_server('127.0.0.1', 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def download(port, path, headers=None, expect=200):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', path, headers=headers or {})
+    response = conn.getresponse()
+    assert response.status == expect, response.status
+    received = 0
+    while True:
+        block = response.read(64 * 1024)
+        if not block:
+            break
+        received += len(block)
+    conn.close()
+    return received
+
+
+def run_clients(label, clients, fn):
+    before = rss_mb()
+    sampler = RSSSampler()
+    sampler.start()
+    results = [None] * clients
+
+    def worker(i):
+        results[i] = fn(i)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    peak = sampler.stop()
+    total = sum(results)
+    print(f'{label:<44} {elapsed:6.2f} s  {total / elapsed / 1024 ** 2:8.1f} MB/s   '
+          f'RSS {before:6.1f} MB -> peak {peak:7.1f} MB')
+
+
+def buffering_app(path):
+    """A handler that loads the whole file before responding, for comparison."""
+    from flask import Flask, Response
+    legacy = Flask(__name__)
+
+    @legacy.route('/file')
+    def whole_file():
+        with open(path, 'rb') as f:
+            return Response(f.read(), mimetype='application/octet-stream')
+
+    return legacy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=256, help='report size in MB')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--ranges', type=int, default=50, help='1 MB range requests per client')
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    conn.execute("INSERT INTO users (id, username, password, role) VALUES (1, 'bench', 'x', 'patient')")
+    conn.commit()
+    conn.close()
+
+    blobs.store = blobs.BlobStore(tempfile.mkdtemp(prefix='hospitrack-download-'))
+    from app import app, report_file_url
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    client = common.signed_in(app.test_client())
+    with tempfile.TemporaryFile() as f:
+        block = os.urandom(1024 * 1024)
+        for i in range(args.size):
+            f.write(i.to_bytes(8, 'big') + block[8:])
+        f.seek(0)
+        response = client.post('/api/lab/upload', data={'file': (f, 'scan.dcm'), 'patient_id': '1', 'report_type': 'CT'},
+                               content_type='multipart/form-data')
+    digest = response.json['sha256']
+    size = args.size * 1024 * 1024
+    with app.test_request_context():
+        url = urlsplit(report_file_url(1, digest))
+    path = f'{url.path}?{url.query}'
+    print(f'{args.clients} clients downloading a {args.size} MB report; baseline RSS {rss_mb():.1f} MB\n')
+
+    server = serve(app)
+    port = server.server_port
+    run_clients('GET /api/reports/<id>/file, whole file', args.clients, lambda i: download(port, path))
+
+    def ranges(i):
+        rng = random.Random(i)
+        received = 0
+        for _ in range(args.ranges):
+            start = rng.randrange(0, size - 1024 * 1024)
+            received += download(port, path, {'Range': f'bytes={start}-{start + 1024 * 1024 - 1}'}, expect=206)
+        return received
+
+    run_clients(f'GET /api/reports/<id>/file, {args.ranges} x 1 MB ranges', args.clients, ranges)
+    server.shutdown()
+
+    server = serve(buffering_app(blobs.store.path(digest)))
+    port = server.server_port
+    run_clients('read whole file, then respond (contrast)', args.clients, lambda i: download(port, '/file'))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""k-nearest hospital lookups: R*Tree search vs haversine over every row.
+
+Places the seeded hospitals at random points across a country-sized region
+and times nearest-hospital queries from random caller positions.
+
+    python backend/benchmarks/bench_geo.py [--hospitals 50000] [--queries 200] [--k 10]
+"""
+import argparse
+import random
+
+import common
+import geo
+
+# Roughly the extent of India.
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+
+
+def brute_force(conn, lat, lon, k, bed_type=None):
+    """Distance to every qualifying hospital, then sort."""
+    query = 'SELECT h.id, h.latitude, h.longitude FROM hospitals h WHERE h.latitude IS NOT NULL'
+    params = ()
+    if bed_type:
+        query += ' AND EXISTS (SELECT 1 FROM beds b WHERE b.hospital_id = h.id AND b.available_count > 0 AND b.bed_type = ?)'
+        params = (bed_type,)
+    rows = conn.execute(query, params).fetchall()
+    return sorted((geo.haversine_km(lat, lon, r[1], r[2]), r[0]) for r in rows)[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hospitals', type=int, default=50000)
+    parser.add_argument('--beds', type=int, default=3, help='bed rows per hospital')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, args.beds)
+    rng = random.Random(3)
+    conn.executemany('UPDATE hospitals SET latitude = ?, longitude = ? WHERE id = ?',
+                     ((rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), i) for i in range(1, args.hospitals + 1)))
+    conn.commit()
+    print(f'Seeded {args.hospitals} hospitals with coordinates / {args.hospitals * args.beds} bed rows\n')
+
+    points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.queries)]
+    condition = 'EXISTS (SELECT 1 FROM beds b WHERE b.hospital_id = g.id AND b.available_count > 0 AND b.bed_type = ?)'
+
+    # The two strategies must agree before their timings mean anything.
+    for lat, lon in points[:20]:
+        fast = [h for _, h in geo.nearest(conn, lat, lon, args.k, condition, ('ICU',))]
+        slow = [h for _, h in brute_force(conn, lat, lon, args.k, 'ICU')]
+        assert fast == slow, (lat, lon, fast, slow)
+
+    from app import app
+    client = common.signed_in(app.test_client())
+
+    cases = (
+        ('haversine over every row', lambda p: brute_force(conn, *p, args.k)),
+        ('geo.nearest (R*Tree)', lambda p: geo.nearest(conn, *p, args.k)),
+        ('haversine, free ICU beds', lambda p: brute_force(conn, *p, args.k, 'ICU')),
+        ('geo.nearest, free ICU beds', lambda p: geo.nearest(conn, *p, args.k, condition, ('ICU',))),
+        ('GET search_beds?lat&lon&type=ICU', lambda p: client.get(
+            '/api/patient/search_beds', query_string={'lat': p[0], 'lon': p[1], 'k': args.k, 'type': 'ICU'})),
+        ('GET /api/hospitals?lat&lon', lambda p: client.get(
+            '/api/hospitals', query_string={'lat': p[0], 'lon': p[1], 'k': args.k})),
+    )
+    for label, fn in cases:
+        samples = []
+        for p in points:
+            _, (sample,) = common.timed(lambda: fn(p), repeat=1)
+            samples.append(sample)
+        common.report(f'{label} (k={args.k})', samples)
+
+
+if __name__ == '__main__':
+    main()
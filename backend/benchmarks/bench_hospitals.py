@@ -0,0 +1,51 @@
+"""Compare the old N+1 hospital listing with the grouped /api/hospitals query.
+
+    python backend/benchmarks/bench_hospitals.py [--hospitals 10000] [--beds 10]
+"""
+import argparse
+
+import common
+
+
+def legacy_listing(conn):
+    """The original get_hospitals(): one aggregate query per hospital."""
+    result = []
+    for h in conn.execute('SELECT * FROM hospitals').fetchall():
+        h = dict(h)
+        beds = conn.execute('SELECT sum(available_count) as free, sum(total_count) as total FROM beds WHERE hospital_id = ?', (h['id'],)).fetchone()
+        h['available_beds'] = beds['free'] if beds['free'] else 0
+        h['total_beds'] = beds['total'] if beds['total'] else 0
+        result.append(h)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hospitals', type=int, default=10000)
+    parser.add_argument('--beds', type=int, default=10, help='bed rows per hospital')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, args.beds)
+    print(f'Seeded {args.hospitals} hospitals / {args.hospitals * args.beds} bed rows\n')
+
+    from app import app
+    client = common.signed_in(app.test_client())
+
+    legacy, samples = common.timed(lambda: legacy_listing(conn), args.repeat)
+    common.report('legacy N+1 loop', samples)
+
+    response, samples = common.timed(lambda: client.get('/api/hospitals'), args.repeat)
+    assert len(response.get_json()) == len(legacy)
+    common.report('GET /api/hospitals (full)', samples)
+
+    _, samples = common.timed(lambda: client.get('/api/hospitals?limit=50&cursor=5000'), args.repeat)
+    common.report('GET /api/hospitals?limit=50', samples)
+
+    _, samples = common.timed(lambda: client.get('/api/hospitals?limit=50&cursor=5000&fields=id,name,available_beds'), args.repeat)
+    common.report('GET ...&fields=id,name,available_beds', samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Lab order and report ingestion: one request per item vs the bulk endpoints.
+
+Creates --orders lab orders through POST /api/lab/create_order one at a
+time and through POST /api/lab/orders/bulk in one request, then files
+--reports small reports against those orders through /api/lab/upload per
+file and through /api/lab/upload/batch as a single zip.
+
+    python backend/benchmarks/bench_lab_bulk.py [--orders 10000] [--reports 1000]
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+import zipfile
+
+import common
+import blobs
+
+PATIENTS = 500
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--reports', type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    conn.executemany("INSERT INTO users (id, username, password, role) VALUES (?, ?, 'x', 'patient')",
+                     ((i, f'patient{i}') for i in range(1, PATIENTS + 1)))
+    conn.commit()
+    blobs.store = blobs.BlobStore(tempfile.mkdtemp(prefix='hospitrack-lab-'))
+
+    from app import app
+    client = common.signed_in(app.test_client())
+    orders = [{'patient_id': i % PATIENTS + 1, 'hospital_id': 1, 'doctor_name': 'Dr. Bench', 'report_type': 'CBC'}
+              for i in range(args.orders)]
+
+    start = time.perf_counter()
+    for order in orders:
+        assert client.post('/api/lab/create_order', json=order).status_code == 200
+    single = time.perf_counter() - start
+    print(f'{args.orders} x POST /api/lab/create_order      {single:7.2f} s  {args.orders / single:9,.0f} orders/s')
+
+    start = time.perf_counter()
+    response = client.post('/api/lab/orders/bulk', json=orders)
+    bulk = time.perf_counter() - start
+    assert response.json['created'] == args.orders, response.json
+    print(f'POST /api/lab/orders/bulk ({args.orders} orders) {bulk:7.2f} s  {args.orders / bulk:9,.0f} orders/s   ({single / bulk:.0f}x)')
+
+    order_ids = [r['lab_order_id'] for r in response.json['results']]
+    files = [(f'{order_ids[i]}.pdf', os.urandom(4096)) for i in range(min(args.reports, len(order_ids)))]
+
+    start = time.perf_counter()
+    for name, body in files[:len(files) // 2]:
+        response = client.post('/api/lab/upload', data={'file': (io.BytesIO(body), name), 'lab_order_id': name[:-4]},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200
+    single = (time.perf_counter() - start) / (len(files) // 2)
+    print(f'\n{len(files) // 2} x POST /api/lab/upload (4 KB)          {single * 1000:7.2f} ms/report')
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as z:
+        for name, body in files[len(files) // 2:]:
+            z.writestr(name, body)
+    archive.seek(0)
+    start = time.perf_counter()
+    response = client.post('/api/lab/upload/batch', data={'files': (archive, 'shift.zip')}, content_type='multipart/form-data')
+    batch = (time.perf_counter() - start) / (len(files) - len(files) // 2)
+    assert response.json['failed'] == 0, response.json['results'][:3]
+    print(f'POST /api/lab/upload/batch ({len(files) - len(files) // 2} in a zip)  {batch * 1000:7.2f} ms/report   ({single / batch:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Lab order queue: the old unbounded listing vs keyset pages with filters.
+
+Times GET /api/lab/orders pages (first page, a page deep in the history,
+and each filter) with a small reports table and again after growing it to
+--rows, to show page latency does not depend on table size. The legacy
+query is timed on the same tables.
+
+    python backend/benchmarks/bench_lab_orders.py [--rows 1000000] [--small 10000]
+"""
+import argparse
+import random
+from datetime import date, timedelta
+
+import common
+
+PATIENTS = 50000
+LABS = [f'Lab {i}' for i in range(20)]
+START = date(2023, 1, 1)
+
+
+def legacy_lab_orders(conn):
+    """The original get_lab_orders() query."""
+    return conn.execute('''
+        SELECT r.*, u.full_name as patient_name, u.hospitrack_id as patient_uid
+        FROM reports r
+        JOIN users u ON r.patient_id = u.id
+        ORDER BY r.id DESC
+    ''').fetchall()
+
+
+def add_reports(conn, first_id, count, rng):
+    conn.executemany('''
+        INSERT INTO reports (id, patient_id, hospital_id, doctor_name, report_name, lab_name, date_uploaded, status, lab_order_id, file_name)
+        VALUES (?, ?, ?, 'Dr. Bench', 'CBC', ?, ?, ?, ?, 'result.pdf')
+    ''', ((i, rng.randint(1, PATIENTS), rng.randint(1, 200), rng.choice(LABS),
+           (START + timedelta(days=i * 1000 // (first_id + count))).isoformat(),
+           'Pending' if rng.random() < 0.05 else 'Completed', f'LAB-{i:08X}') for i in range(first_id, first_id + count)))
+    conn.commit()
+
+
+def run_cases(client, conn, rows, repeat):
+    deep = client.get('/api/lab/orders', query_string={'limit': 50, 'cursor': rows // 2}).headers.get('X-Next-Cursor')
+    cases = (
+        ('first page', {}),
+        ('deep page (cursor)', {'cursor': deep}),
+        ('status=Pending', {'status': 'Pending'}),
+        ('lab_name', {'lab_name': 'Lab 7'}),
+        ('hospital_id', {'hospital_id': 42}),
+        ('status + lab_name', {'status': 'Pending', 'lab_name': 'Lab 7'}),
+        ('one week (from/to)', {'from': '2024-03-01', 'to': '2024-03-07'}),
+        ('q=<lab order id>', {'q': f'LAB-{rows // 3:08X}'}),
+    )
+    for label, args in cases:
+        _, samples = common.timed(lambda: client.get('/api/lab/orders', query_string={'limit': 50, **args}), repeat)
+        common.report(f'  GET /api/lab/orders {label}', samples)
+    _, samples = common.timed(lambda: legacy_lab_orders(conn), 1)
+    common.report('  legacy: every order, r.*', samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--small', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(16)
+    conn = common.fresh_database()
+    conn.executemany("INSERT INTO users (id, username, password, role, full_name, hospitrack_id) VALUES (?, ?, 'x', 'patient', ?, ?)",
+                     ((i, f'patient{i}', f'Patient {i}', f'HT-{i:06d}') for i in range(1, PATIENTS + 1)))
+    add_reports(conn, 1, args.small, rng)
+
+    from app import app
+    client = common.signed_in(app.test_client())
+
+    print(f'{args.small:,} reports')
+    run_cases(client, conn, args.small, args.repeat)
+    add_reports(conn, args.small + 1, args.rows - args.small, rng)
+    conn.execute('ANALYZE')
+    conn.commit()
+    print(f'\n{args.rows:,} reports')
+    run_cases(client, conn, args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
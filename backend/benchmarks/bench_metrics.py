@@ -0,0 +1,78 @@
+"""Instrumentation overhead: requests and statements with metrics on and off.
+
+Seeds --hospitals hospitals and --orders lab orders, then times the same
+requests and a primary-key lookup on a pooled connection with
+metrics.ENABLED off and on, and how long a /metrics scrape takes once
+every route and statement has been seen.
+
+    python backend/benchmarks/bench_metrics.py [--hospitals 500] [--orders 50000]
+"""
+import argparse
+import random
+import statistics
+import time
+
+import common
+
+import metrics
+from database import pool
+
+ROUTES = ('/api/hospitals', '/api/lab/orders?limit=50', '/api/lab/orders?status=Pending&limit=50',
+          '/api/hospital/1/appointments', '/api/patient/1/timeline')
+
+
+def per_call_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hospitals', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(22)
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, 4)
+    conn.execute("INSERT INTO users (id, username, password, role, full_name) VALUES (1, 'bench', 'x', 'patient', 'Bench')")
+    conn.executemany('''
+        INSERT INTO reports (patient_id, hospital_id, report_name, lab_name, date_uploaded, status, lab_order_id, file_name)
+        VALUES (1, ?, 'CBC', 'Central Lab', ?, ?, ?, 'Pending Upload')
+    ''', ((rng.randint(1, args.hospitals), f'2026-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}',
+           rng.choice(('Pending', 'Completed')), f'LAB-{i:08X}') for i in range(args.orders)))
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    from app import app
+    client = common.signed_in(app.test_client())
+    print(f'{args.hospitals:,} hospitals, {args.orders:,} lab orders; {args.repeat} calls per measurement')
+    for route in ROUTES:
+        timings = {}
+        # Alternate so drift (page cache, CPU frequency) hits both sides alike.
+        for _ in range(3):
+            for enabled in (False, True):
+                metrics.ENABLED = enabled
+                timings.setdefault(enabled, []).append(per_call_us(lambda: client.get(route), args.repeat // 3))
+        off, on = statistics.median(timings[False]), statistics.median(timings[True])
+        print(f'  {route:<42} off {off:8.1f} us   on {on:8.1f} us   ({on - off:+.1f} us)')
+
+    lookup = pool.connect()
+    ids = [rng.randint(1, args.orders) for _ in range(20000)]
+    for enabled in (False, True):
+        metrics.ENABLED = enabled
+        it = iter(ids * 2)
+        cost = per_call_us(lambda: lookup.execute('SELECT * FROM reports WHERE id = ?', (next(it),)).fetchone(), len(ids))
+        print(f'  pooled primary-key lookup, metrics {"on " if enabled else "off"} {cost:8.2f} us per statement')
+    lookup.close()
+
+    _, samples = common.timed(lambda: client.get('/metrics'), 20)
+    body = client.get('/metrics').get_data()
+    common.report(f'  GET /metrics ({len(body) / 1024:,.0f} KiB)', samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Occupancy history: storage per sample, query latency, write overhead, pruning.
+
+Fills the occupancy store as if every bed type of --hospitals hospitals had
+changed every minute for --years years and pruning had kept up: minute rows
+for the last MINUTE_RETENTION_DAYS, hour rows for HOUR_RETENTION_DAYS and
+day rows throughout. Then it times the occupancy endpoint over several
+windows, bed updates with and without the sampling triggers, and pruning a
+further day of minute and hour rows.
+
+    python backend/benchmarks/bench_occupancy.py [--hospitals 200] [--years 3]
+"""
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+import common
+
+import occupancy
+
+BED_TYPES = 4
+
+
+def tier_rows(rng, series_count, first_slot, slots):
+    """Random-walk occupancy rows for every series over `slots` consecutive slots."""
+    for series_id in range(1, series_count + 1):
+        total = int(rng.integers(20, 120))
+        walk = np.clip(total // 2 + np.cumsum(rng.integers(-2, 3, slots)), 0, total)
+        spread = rng.integers(0, 3, slots)
+        for i in range(slots):
+            last = int(walk[i])
+            yield (series_id, first_slot + i, max(last - int(spread[i]), 0), min(last + int(spread[i]), total), last, total)
+
+
+def fill(store, beds, years, rng):
+    now = int(time.time())
+    plan = [(tier, (now - days * 86400) // step, now // step + 1)
+            for tier, step, days in (('minute', 60, occupancy.MINUTE_RETENTION_DAYS),
+                                     ('hour', 3600, occupancy.HOUR_RETENTION_DAYS),
+                                     ('day', 86400, int(years * 365)))]
+    series_count = len(beds)
+    # Replace what the triggers recorded while seeding; series ids match beds ids.
+    for table in ('series', *occupancy.TIERS):
+        store.execute(f'DELETE FROM occupancy_{table}')
+    store.executemany('INSERT INTO occupancy_series (id, hospital_id, bed_type) VALUES (?, ?, ?)', beds)
+    counts = {}
+    for tier, first_slot, end_slot in plan:
+        slots = end_slot - first_slot
+        start = time.perf_counter()
+        store.executemany(f'''
+            INSERT INTO occupancy_{tier} (series_id, slot, available_min, available_max, available_last, total)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', tier_rows(rng, series_count, first_slot, slots))
+        store.commit()
+        counts[tier] = series_count * slots
+        print(f'  {tier:<6} {counts[tier]:>12,} rows  ({time.perf_counter() - start:.1f} s)')
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hospitals', type=int, default=200)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, BED_TYPES)
+    beds = [tuple(row) for row in conn.execute('SELECT id, hospital_id, bed_type FROM beds ORDER BY id')]
+    conn.close()
+
+    series_count = len(beds)
+    print(f'Filling {args.years:g} years of per-minute samples for {series_count:,} series (pruned):')
+    store = occupancy.connect_store()
+    counts = fill(store, beds, args.years, np.random.default_rng(18))
+    store.execute('PRAGMA occupancy.wal_checkpoint(TRUNCATE)')
+    size = os.path.getsize(occupancy.OCCUPANCY_DB)
+    raw = series_count * int(args.years * 365 * 1440)
+    print(f'occupancy.db: {size / 1024 ** 2:,.0f} MB for {sum(counts.values()):,} rows '
+          f'({size / sum(counts.values()):.0f} B/row); unpruned per-minute history would be {raw:,} rows '
+          f'(~{raw * size / sum(counts.values()) / 1024 ** 3:,.0f} GB)\n')
+
+    from app import app
+    client = common.signed_in(app.test_client())
+    for label, query in (('24 h', {'hours': 24, 'resolution': 'minute'}),
+                         ('7 days', {}),
+                         ('60 days', {'hours': 60 * 24}),
+                         ('1 year', {'hours': 365 * 24}),
+                         (f'{args.years:g} years', {'hours': int(args.years * 365 * 24)})):
+        response = client.get('/api/hospital/7/occupancy', query_string=query)
+        assert response.status_code == 200 and response.json['forecast'], response.json
+        label = f"{label} by {response.json['resolution']}"
+        _, samples = common.timed(lambda: client.get('/api/hospital/7/occupancy', query_string=query), args.repeat)
+        common.report(f'  GET occupancy, {label}', samples)
+
+    from database import connect
+    rng = random.Random(18)
+    for label, hooks in (('with sampling triggers', True), ('without', False)):
+        conn = connect(hooks=hooks)
+        start = time.perf_counter()
+        for _ in range(args.updates):
+            conn.execute('UPDATE beds SET available_count = MAX(available_count - 1, 0) WHERE id = ?', (rng.randint(1, series_count),))
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        conn.close()
+        print(f'{args.updates:,} bed updates, {label:<24} {elapsed / args.updates * 1e6:7.1f} us/update')
+
+    # Age the store by a day so one more day of minute and hour rows falls out of retention.
+    start = time.perf_counter()
+    removed = occupancy.prune(store, time.time() + 86400)
+    elapsed = time.perf_counter() - start
+    print(f'\npruning: deleted {removed:,} rows in {elapsed:.2f} s ({removed / elapsed:,.0f} rows/s)')
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Fire simultaneous reservations at one bed type and check nothing is oversold.
+
+    python backend/benchmarks/bench_reservations.py [--requests 4000] [--beds 500]
+                                                   [--processes 4] [--threads 16]
+
+Every worker process runs its own copy of the app (and connection pool)
+against the same database file, so this exercises SQLite locking across
+processes as well as threads. Exits non-zero on any oversell.
+"""
+import argparse
+import multiprocessing
+import threading
+import time
+
+import common
+
+BED_TYPE = 'ICU'
+
+
+def worker(count, threads, results):
+    from app import app
+
+    statuses = {}
+    lock = threading.Lock()
+
+    def fire(n):
+        client = common.signed_in(app.test_client())
+        for _ in range(n):
+            status = client.post('/api/patient/reserve_bed',
+                                 json={'patient_id': 1, 'hospital_id': 1, 'bed_type': BED_TYPE}).status_code
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    per_thread = [count // threads + (1 if i < count % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=fire, args=(n,)) for n in per_thread]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--beds', type=int, default=500, help='available beds of the contended type')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16, help='threads per process')
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    conn.execute("INSERT INTO hospitals (id, name, location) VALUES (1, 'Contention General', 'Downtown')")
+    conn.execute('INSERT INTO beds (hospital_id, bed_type, total_count, available_count, price) VALUES (1, ?, ?, ?, 500)',
+                 (BED_TYPE, args.beds, args.beds))
+    conn.commit()
+
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    share = [args.requests // args.processes + (1 if i < args.requests % args.processes else 0) for i in range(args.processes)]
+    procs = [ctx.Process(target=worker, args=(n, args.threads, results)) for n in share]
+
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    statuses = {}
+    for _ in procs:
+        for status, n in results.get().items():
+            statuses[status] = statuses.get(status, 0) + n
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    available = conn.execute('SELECT available_count FROM beds WHERE hospital_id = 1 AND bed_type = ?', (BED_TYPE,)).fetchone()[0]
+    reserved = conn.execute('SELECT count(*) FROM bed_reservations').fetchone()[0]
+    summary = conn.execute('SELECT available_count FROM bed_type_summary WHERE hospital_id = 1 AND bed_type = ?', (BED_TYPE,)).fetchone()[0]
+
+    print(f'{args.requests} requests over {args.processes} processes x {args.threads} threads in {elapsed:.2f}s '
+          f'({args.requests / elapsed:.0f} req/s)')
+    print(f'responses: {dict(sorted(statuses.items()))}')
+    print(f'beds: {args.beds} offered, {reserved} reservations logged, available_count now {available} (summary {summary})')
+
+    ok = (statuses.get(200, 0) == reserved == min(args.beds, args.requests)
+          and available == args.beds - reserved == summary
+          and statuses.get(500, 0) == 0)
+    print('PASS: no oversell' if ok else 'FAIL: reservation counts disagree')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""Doctor schedules: slot lookup latency and conflict-free booking under contention.
+
+Seeds --doctors doctors with parsed weekly hours and books --fill of their
+slots over the next month, then times a month of slots for one doctor
+(GET .../slots?days=31), a month for every doctor in one
+schedule.doctor_slots() call, single bookings, and --threads clients racing
+for the same slots (exactly one may win each).
+
+    python backend/benchmarks/bench_schedule.py [--doctors 1000] [--fill 0.3]
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import common
+
+import schedule
+
+HOURS = ('9AM-5PM', '9 Am-12 Noon', '2PM-6PM', '08:00-13:00, 14:00-17:00', '10-4')
+DAYS = ('Mon-Fri', 'Mon-Sat', 'Tue, Thu', 'Mon, Wed, Fri', 'Daily')
+
+
+def seed(conn, doctors, hospitals, rng):
+    rows = [(i, rng.randint(1, hospitals), f'Dr. {i}', rng.choice(DAYS), rng.choice(HOURS), rng.choice((15, 20, 30)))
+            for i in range(1, doctors + 1)]
+    conn.executemany('INSERT INTO doctors (id, hospital_id, name, specialization, days, hours, slot_minutes) VALUES (?, ?, ?, \'GP\', ?, ?, ?)', rows)
+    for doctor_id, _, _, days, hours, _ in rows:
+        schedule.save(conn, doctor_id, schedule.parse_schedule(days, hours))
+    conn.commit()
+    return {doctor_id: hospital_id for doctor_id, hospital_id, *_ in rows}
+
+
+def book_fraction(conn, hospitals, first_day, fill, rng):
+    calendars = schedule.doctor_slots(conn, list(hospitals), first_day, 31)
+    rows = [(hospitals[doctor_id], doctor_id, f"{day['date']} {slot}", day['date'], day['date'], f'APT-{uuid.uuid4().hex[:8].upper()}')
+            for doctor_id, calendar in calendars.items() for day in calendar for slot in day['available']
+            if rng.random() < fill]
+    conn.executemany('''
+        INSERT INTO appointments (patient_id, hospital_id, doctor_id, doctor_name, slot_start, date, appointment_date, appointment_no)
+        VALUES (1, ?, ?, 'Dr. Bench', ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--doctors', type=int, default=1000)
+    parser.add_argument('--hospitals', type=int, default=100)
+    parser.add_argument('--fill', type=float, default=0.3, help='fraction of next month\'s slots already booked')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(20)
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, 2)
+    conn.execute("INSERT INTO users (id, username, password, role, full_name) VALUES (1, 'bench', 'x', 'patient', 'Bench')")
+    hospitals = seed(conn, args.doctors, args.hospitals, rng)
+    first_day = date.today() + timedelta(days=1)
+    booked = book_fraction(conn, hospitals, first_day, args.fill, rng)
+    conn.execute('ANALYZE')
+    conn.commit()
+    print(f'{args.doctors:,} doctors, {booked:,} slots booked over the next 31 days')
+
+    from app import app
+    client = common.signed_in(app.test_client())
+    doctor_ids = list(hospitals)
+    _, samples = common.timed(lambda: [
+        client.get(f'/api/hospital/{hospitals[d]}/doctors/{d}/slots', query_string={'date': first_day.isoformat(), 'days': 31})
+        for d in [rng.choice(doctor_ids)]], args.repeat)
+    common.report('  GET slots, one doctor, 31 days', samples)
+    (calendars,), samples = common.timed(lambda: [schedule.doctor_slots(conn, doctor_ids, first_day, 31)], 5)
+    free = sum(len(day['available']) for calendar in calendars.values() for day in calendar)
+    common.report(f'  doctor_slots, all {args.doctors:,} doctors, 31 days', samples)
+    print(f'  ({free:,} open slots)')
+
+    def attempt(client, doctor_id, slot):
+        return client.post('/api/patient/appointments', json={'patient_id': 1, 'doctor_id': doctor_id, 'slot': slot}).status_code
+
+    open_slots = [(d, f"{day['date']}T{t}") for d, calendar in calendars.items() for day in calendar for t in day['available']]
+    rng.shuffle(open_slots)
+    single = open_slots[:200]
+    start = time.perf_counter()
+    statuses = [attempt(client, d, slot) for d, slot in single]
+    elapsed = time.perf_counter() - start
+    assert statuses.count(200) == len(single), statuses
+    print(f'{len(single)} bookings, one client: {elapsed / len(single) * 1000:.2f} ms each')
+
+    contested = open_slots[200:300]
+    wins, lock = [], threading.Lock()
+
+    def racer():
+        local = common.signed_in(app.test_client())
+        for d, slot in contested:
+            status = attempt(local, d, slot)
+            with lock:
+                wins.append((d, slot, status))
+    threads = [threading.Thread(target=racer) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    per_slot = {}
+    for d, slot, status in wins:
+        per_slot.setdefault((d, slot), []).append(status)
+    double = sum(1 for statuses in per_slot.values() if statuses.count(200) != 1)
+    rows = conn.execute("SELECT COUNT(*) FROM appointments WHERE slot_start >= ?", (datetime.now().strftime(schedule.SLOT_FORMAT),)).fetchone()[0]
+    print(f'{args.threads} clients racing for {len(contested)} slots: {len(wins)} attempts in {elapsed:.2f} s, '
+          f'{double} slots without exactly one winner, {rows:,} booked slots in total')
+
+
+if __name__ == '__main__':
+    main()
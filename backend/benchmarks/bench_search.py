@@ -0,0 +1,88 @@
+"""Compare the old LIKE '%q%' hospital/bed search with the FTS5 index.
+
+Gives the seeded hospitals varied names and locations, then replays
+typeahead keystrokes (each prefix of a query) against both. Endpoint
+timings include JSON serialization; the legacy ones are bare SQL.
+
+    python backend/benchmarks/bench_search.py [--hospitals 100000] [--beds 3]
+"""
+import argparse
+import random
+
+import common
+
+SPECIALIZATIONS = ('Cardiologist', 'Neurologist', 'Pediatrician', 'Oncologist', 'Orthopedic Surgeon',
+                   'Dermatologist', 'General Physician', 'Radiologist', 'Gynecologist', 'Psychiatrist')
+NAMES = ('St. Mary', 'Sunrise', 'Riverside', 'Mercy', 'Lakeview', 'Apollo', 'Fortis', 'Green Valley', 'Hillcrest',
+         'Unity', 'Good Samaritan', 'Silverline', 'Northstar', 'Harmony', 'Lotus', 'Cedar', 'Beacon', 'Meridian')
+KINDS = ('General Hospital', 'Medical Center', 'Clinic', 'Memorial Hospital', "Children's Hospital",
+         'Heart Institute', 'Care Hospital', 'Multispeciality Hospital', 'Nursing Home', 'Trauma Center')
+SYLLABLES = ('ka', 'ran', 'pur', 'vel', 'ton', 'mar', 'bad', 'ga', 'lin', 'shi', 'dor', 'na', 'ro', 'ven', 'tal')
+
+
+def place(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def rename_hospitals(conn, hospitals, seed=11):
+    rng = random.Random(seed)
+    conn.executemany('UPDATE hospitals SET name = ?, location = ? WHERE id = ?',
+                     ((f'{place(rng)} {rng.choice(NAMES)} {rng.choice(KINDS)}', f'{place(rng)} {place(rng)}', i)
+                      for i in range(1, hospitals + 1)))
+
+
+def legacy_search_hospitals(conn, q):
+    """The original search_hospitals(), parameterized but otherwise unchanged."""
+    return conn.execute('SELECT * FROM hospitals WHERE name LIKE ? OR location LIKE ?', (f'%{q}%', f'%{q}%')).fetchall()
+
+
+def legacy_search_beds(conn, q):
+    """The original search_beds() location filter."""
+    return conn.execute('''
+        SELECT b.id, b.bed_type, h.name FROM beds b JOIN hospitals h ON b.hospital_id = h.id
+        WHERE b.available_count > 0 AND (LOWER(h.name) LIKE ? OR LOWER(h.location) LIKE ?)
+    ''', (f'%{q.lower()}%', f'%{q.lower()}%')).fetchall()
+
+
+def keystrokes(query):
+    return [query[:n] for n in range(2, len(query) + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hospitals', type=int, default=100000)
+    parser.add_argument('--beds', type=int, default=3, help='bed rows per hospital')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, args.hospitals, args.beds)
+    rng = random.Random(7)
+    conn.executemany('INSERT INTO doctors (hospital_id, name, specialization) VALUES (?, ?, ?)',
+                     ((rng.randint(1, args.hospitals), f'Dr. {i}', rng.choice(SPECIALIZATIONS)) for i in range(args.hospitals)))
+    rename_hospitals(conn, args.hospitals)
+    conn.commit()
+    print(f'Seeded {args.hospitals} hospitals / {args.hospitals * args.beds} bed rows / {args.hospitals} doctors\n')
+
+    from app import app
+    client = common.signed_in(app.test_client())
+
+    sample = conn.execute('SELECT name, location FROM hospitals WHERE id = ?', (args.hospitals // 2,)).fetchone()
+    for query in (sample['name'], sample['location'], 'Neuro', 'Maternity'):
+        prefixes = keystrokes(query)
+        print(f'"{query}" typed as {len(prefixes)} keystrokes:')
+        _, samples = common.timed(lambda: [legacy_search_hospitals(conn, p) for p in prefixes], args.repeat)
+        common.report('  legacy hospitals LIKE', samples)
+        _, samples = common.timed(lambda: [client.get('/api/hospitals/search', query_string={'q': p, 'limit': 20})
+                                           for p in prefixes], args.repeat)
+        common.report('  /api/hospitals/search?limit=20', samples)
+        _, samples = common.timed(lambda: [legacy_search_beds(conn, p) for p in prefixes], args.repeat)
+        common.report('  legacy search_beds LIKE', samples)
+        _, samples = common.timed(lambda: [client.get('/api/patient/search_beds', query_string={'location': p})
+                                           for p in prefixes], args.repeat)
+        common.report('  /api/patient/search_beds', samples)
+        print()
+
+
+if __name__ == '__main__':
+    main()
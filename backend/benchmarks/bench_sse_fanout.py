@@ -0,0 +1,100 @@
+"""Fan-out benchmark for the asyncio SSE server.
+
+Opens many idle EventSource-style connections for one hospital, publishes
+events on the bus from another thread and measures how long each event
+takes to reach every subscriber. Also reports the server's thread count to
+show connections do not each hold a thread.
+
+    python backend/benchmarks/bench_sse_fanout.py [--clients 5000] [--events 50]
+"""
+import argparse
+import asyncio
+import resource
+import statistics
+import threading
+import time
+
+import common  # noqa: F401  (sets up sys.path)
+import events
+import sse
+
+
+async def client(port, topic_query, received, ready, arrived):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /api/stream?{topic_query} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+    await writer.drain()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    ready()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b'data: '):
+            received.append(time.perf_counter())
+            arrived()
+
+
+async def run(args):
+    server = sse.SSEServer(port=0)
+    server.start_in_thread()
+    threads_before = threading.active_count()
+
+    received = [[] for _ in range(args.clients)]
+    connected = delivered = 0
+
+    def ready():
+        nonlocal connected
+        connected += 1
+
+    def arrived():
+        nonlocal delivered
+        delivered += 1
+
+    tasks = []
+    for i in range(args.clients):
+        tasks.append(asyncio.create_task(client(server.port, 'hospital_id=1', received[i], ready, arrived)))
+        if i % 500 == 499:
+            await asyncio.sleep(0.05)
+    while connected < args.clients or server.connections < args.clients:
+        await asyncio.sleep(0.05)
+    print(f'{args.clients} clients connected; process threads: {threading.active_count()} '
+          f'(was {threads_before} before connecting)')
+
+    latencies = []
+    for n in range(args.events):
+        for r in received:
+            r.clear()
+        delivered = 0
+        sent = time.perf_counter()
+        threading.Thread(target=events.bus.publish,
+                         args=(events.hospital_topic(1), 'beds'), kwargs={'bed_type': 'ICU', 'available_count': n}).start()
+        while delivered < args.clients:
+            await asyncio.sleep(0.001)
+        latencies.append(max(r[0] for r in received) - sent)
+
+    for task in tasks:
+        task.cancel()
+
+    ms = sorted(l * 1000 for l in latencies)
+    print(f'{args.events} events x {args.clients} subscribers: time to reach all subscribers '
+          f'median {statistics.median(ms):.1f} ms, p95 {ms[int(len(ms) * 0.95) - 1]:.1f} ms, max {ms[-1]:.1f} ms')
+    print(f'throughput: {args.clients * args.events / (sum(latencies)):.0f} deliveries/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=50)
+    args = parser.parse_args()
+
+    # Each connection costs two descriptors here (client and server side).
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = args.clients * 2 + 256
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
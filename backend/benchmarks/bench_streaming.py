@@ -0,0 +1,131 @@
+"""Hospital reservation lists: buffered jsonify vs streamed JSON.
+
+Seeds one hospital per --rows size with that many bed reservations, then
+fetches each list through the app with the body read incrementally, the way
+a WSGI server sends it. Reports time to first byte, total time and the peak
+Python heap (tracemalloc, measured in a separate pass so it does not slow the
+timings) for the previous handler (dict_factory rows, fetchall(), jsonify)
+and for the streamed JSON array and NDJSON responses.
+
+    python backend/benchmarks/bench_streaming.py [--rows 10000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import time
+import tracemalloc
+
+import common
+
+# Every full-list query here is "slow"; keep the slow query log out of the table.
+os.environ.setdefault('HOSPITRACK_SLOW_QUERY_MS', '0')
+
+PATIENTS = 10000
+
+
+def seed(conn, sizes, seed=7):
+    rng = random.Random(seed)
+    conn.executemany('INSERT INTO hospitals (id, name, location, contact) VALUES (?, ?, ?, ?)',
+                     ((hid, f'Hospital {hid}', 'District 1', '555-0000') for hid in range(1, len(sizes) + 1)))
+    conn.executemany('INSERT INTO users (id, username, password, role, full_name, hospitrack_id) VALUES (?, ?, ?, ?, ?, ?)',
+                     ((i, f'patient{i:05d}', 'x', 'patient', f'Patient {i}', f'HT-{i:06X}') for i in range(1, PATIENTS + 1)))
+    start = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+    for hid, rows in enumerate(sizes, 1):
+        conn.executemany(
+            'INSERT INTO bed_reservations (patient_id, hospital_id, bed_type, timestamp, status, address, urgency) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((rng.randint(1, PATIENTS), hid, rng.choice(common.BED_TYPES),
+              time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start + n * 60)),
+              rng.choice(('Reserved', 'Admitted', 'Cancelled')), f'{rng.randint(1, 999)} Main St', rng.choice(('low', 'high')))
+             for n in range(rows)))
+    conn.commit()
+
+
+def buffered_app():
+    """The handler as it was before streaming.py, for comparison."""
+    from flask import Flask, jsonify
+    from database import pool
+    legacy = Flask(__name__)
+
+    def dict_factory(cursor, row):
+        d = {}
+        for idx, col in enumerate(cursor.description):
+            d[col[0]] = row[idx]
+        return d
+
+    @legacy.route('/api/hospital/<int:hospital_id>/reservations')
+    def get_hospital_reservations(hospital_id):
+        conn = pool.connect()
+        conn.row_factory = dict_factory
+        reservations = conn.execute('''
+            SELECT r.id, r.patient_id, u.full_name as patient_name, u.username as patient_contact, u.hospitrack_id as patient_uid, r.bed_type, r.timestamp, r.status, r.address, r.urgency
+            FROM bed_reservations r
+            JOIN users u ON r.patient_id = u.id
+            WHERE r.hospital_id = ?
+            ORDER BY r.timestamp DESC
+        ''', (hospital_id,)).fetchall()
+        conn.close()
+        return jsonify(reservations)
+
+    return legacy
+
+
+def fetch(client, path, headers):
+    """(seconds to first byte, seconds to last byte, body bytes) for one request."""
+    start = time.perf_counter()
+    response = client.get(path, headers=headers, buffered=False)
+    first = None
+    size = 0
+    for block in response.response:
+        if block and first is None:
+            first = time.perf_counter() - start
+        size += len(block)
+    total = time.perf_counter() - start
+    response.close()
+    assert response.status_code == 200, response.status_code
+    return first, total, size
+
+
+def peak_heap(client, path, headers):
+    tracemalloc.start()
+    try:
+        fetch(client, path, headers)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', default='10000,100000,1000000', help='comma-separated list sizes')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(n) for n in args.rows.split(',')]
+
+    conn = common.fresh_database()
+    start = time.perf_counter()
+    seed(conn, sizes)
+    conn.close()
+    print(f'Seeded {sum(sizes):,} reservations in {time.perf_counter() - start:.1f} s\n')
+
+    from app import app
+    variants = (
+        ('dict_factory + fetchall + jsonify', buffered_app().test_client(), {}),
+        ('streamed JSON array', common.signed_in(app.test_client()), {}),
+        ('streamed NDJSON', common.signed_in(app.test_client()), {'Accept': 'application/x-ndjson'}),
+    )
+    print(f'{"rows":>9}  {"handler":<34} {"first byte":>11} {"total":>9} {"body":>9} {"peak heap":>10}')
+    for hid, rows in enumerate(sizes, 1):
+        path = f'/api/hospital/{hid}/reservations'
+        for label, client, headers in variants:
+            runs = [fetch(client, path, headers) for _ in range(args.repeat)]
+            first = min(run[0] for run in runs)
+            total = min(run[1] for run in runs)
+            peak = peak_heap(client, path, headers)
+            print(f'{rows:>9,}  {label:<34} {first * 1000:8.1f} ms {total:7.2f} s '
+                  f'{runs[0][2] / 1024 ** 2:6.1f} MB {peak / 1024 ** 2:7.1f} MB')
+        print()
+
+
+if __name__ == '__main__':
+    main()
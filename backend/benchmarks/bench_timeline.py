@@ -0,0 +1,79 @@
+"""Patient timeline: three per-source listings vs one merged, paged query.
+
+Seeds --events appointments, reservations and lab reports each across
+--patients patients, then for a patient with --history events per source
+times the three calls the dashboard used to make against one
+/api/patient/<id>/timeline page (first page, a deep page, and one source).
+
+    python backend/benchmarks/bench_timeline.py [--events 100000] [--history 2000]
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+import common
+
+START = datetime(2022, 1, 1)
+HOSPITALS = 50
+
+
+def add_events(conn, patients, count, rng):
+    def at():
+        return START + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+    conn.executemany('''
+        INSERT INTO appointments (patient_id, hospital_id, doctor_name, date, appointment_date, appointment_no, status)
+        VALUES (?, ?, 'Dr. Bench', ?, ?, ?, 'Completed')
+    ''', ((p, rng.randint(1, HOSPITALS), d, d, f'APT-{rng.getrandbits(32):08X}')
+          for p, d in ((rng.choice(patients), at().date().isoformat()) for _ in range(count))))
+    conn.executemany('''
+        INSERT INTO bed_reservations (patient_id, hospital_id, bed_type, timestamp, status) VALUES (?, ?, 'ICU', ?, 'Arrived')
+    ''', ((rng.choice(patients), rng.randint(1, HOSPITALS), at().strftime('%Y-%m-%d %H:%M:%S')) for _ in range(count)))
+    conn.executemany('''
+        INSERT INTO reports (patient_id, hospital_id, report_name, lab_name, date_uploaded, status, file_name)
+        VALUES (?, ?, 'CBC', 'Central Lab', ?, 'Completed', 'result.pdf')
+    ''', ((rng.choice(patients), rng.randint(1, HOSPITALS), at().date().isoformat()) for _ in range(count)))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=100000, help='rows per source across all patients')
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--history', type=int, default=2000, help='rows per source for the timed patient')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(19)
+    conn = common.fresh_database()
+    common.seed_hospitals(conn, HOSPITALS, 2)
+    conn.executemany("INSERT INTO users (id, username, password, role, full_name) VALUES (?, ?, 'x', 'patient', ?)",
+                     ((i, f'patient{i}', f'Patient {i}') for i in range(2, args.patients + 2)))
+    conn.execute("INSERT INTO users (id, username, password, role, full_name) VALUES (1, 'busy', 'x', 'patient', 'Busy')")
+    add_events(conn, range(2, args.patients + 2), args.events, rng)
+    add_events(conn, [1], args.history, rng)
+    conn.execute('ANALYZE')
+    conn.commit()
+
+    from app import app
+    client = common.signed_in(app.test_client())
+    print(f'{3 * args.events:,} events over {args.patients:,} patients; timed patient has {3 * args.history:,}')
+
+    def three_calls():
+        for path in ('appointments', 'reservations', 'reports'):
+            client.get(f'/api/patient/{path}', query_string={'patient_id': 1})
+    _, samples = common.timed(three_calls, max(args.repeat // 4, 1))
+    common.report('  3 per-source listings, every row', samples)
+
+    deep = None
+    for _ in range(args.history // 50):
+        deep = client.get('/api/patient/1/timeline', query_string={'limit': 50, **({'cursor': deep} if deep else {})}).headers['X-Next-Cursor']
+    for label, query in (('first page', {}),
+                         ('deep page (cursor)', {'cursor': deep}),
+                         ('type=report', {'type': 'report'}),
+                         ('limit=1000', {'limit': 1000})):
+        _, samples = common.timed(lambda: client.get('/api/patient/1/timeline', query_string={'limit': 50, **query}), args.repeat)
+        common.report(f'  timeline {label}', samples)
+
+
+if __name__ == '__main__':
+    main()
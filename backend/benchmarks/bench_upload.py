@@ -0,0 +1,123 @@
+"""Large lab report uploads: legacy file.save() vs the streaming blob store.
+
+Uploads one file of --size MB through the Flask test client four ways and
+reports throughput and the peak Python heap allocation during each (so a
+path that buffered the body would show up as a peak near the file size):
+
+* the original handler: multipart form, `file.save()` to a named file;
+* POST /api/lab/upload: the same multipart form, streamed into the store;
+* an upload session sending the whole file in one PATCH;
+* an upload session in SESSION_CHUNK_SIZE PATCHes, as the lab dashboard does.
+
+    python backend/benchmarks/bench_upload.py [--size 1024]
+"""
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import common
+import blobs
+
+
+def make_file(path, size_mb):
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        for i in range(size_mb):
+            # Vary each MB so the content is not trivially compressible or repetitive.
+            f.write(i.to_bytes(8, 'big') + chunk[8:])
+
+
+def legacy_app(folder):
+    """The original upload_report() file handling on a bare Flask app."""
+    from flask import Flask, request, jsonify
+    legacy = Flask(__name__)
+
+    @legacy.route('/upload', methods=['POST'])
+    def upload_report():
+        file = request.files['file']
+        filename = f"{request.form.get('patient_id')}_{file.filename}"
+        file.save(os.path.join(folder, filename))
+        return jsonify({"message": "Report uploaded successfully"})
+
+    return legacy.test_client()
+
+
+def measure(label, size, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert response.status_code in (200, 201), response.get_data(as_text=True)
+    print(f'{label:<40} {elapsed:7.2f} s  {size / elapsed / 1024 ** 2:8.1f} MB/s   peak heap {peak / 1024 ** 2:7.1f} MB')
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1024, help='file size in MB')
+    args = parser.parse_args()
+
+    conn = common.fresh_database()
+    conn.execute("INSERT INTO users (id, username, password, role) VALUES (1, 'bench', 'x', 'patient')")
+    conn.commit()
+    conn.close()
+
+    workdir = tempfile.mkdtemp(prefix='hospitrack-upload-')
+    source = os.path.join(workdir, 'scan.dcm')
+    make_file(source, args.size)
+    size = os.path.getsize(source)
+    print(f'Uploading a {args.size} MB file\n')
+
+    from app import app
+    client = common.signed_in(app.test_client())
+
+    def fresh_store():
+        # An empty store each time, so no run is answered by deduplication.
+        blobs.store = blobs.BlobStore(tempfile.mkdtemp(dir=workdir))
+
+    def multipart(client, url):
+        with open(source, 'rb') as f:
+            return client.post(url, data={'file': (f, 'scan.dcm'), 'patient_id': '1', 'report_type': 'MRI'},
+                               content_type='multipart/form-data')
+
+    def session(chunk_size):
+        response = client.post('/api/lab/uploads', json={'file_name': 'scan.dcm', 'size': size, 'patient_id': 1})
+        upload_id = response.json['upload_id']
+        with open(source, 'rb') as f:
+            for offset in range(0, size, chunk_size):
+                body = f.read(chunk_size)
+                response = client.patch(f'/api/lab/uploads/{upload_id}', data=body, headers={'Upload-Offset': str(offset)})
+                # Test responses hold their request body in a reference cycle;
+                # collect it so the peak reflects the server, not the client.
+                gc.collect()
+        return response
+
+    legacy = legacy_app(tempfile.mkdtemp(dir=workdir))
+    measure('legacy multipart + file.save()', size, lambda: multipart(legacy, '/upload'))
+    fresh_store()
+    measure('POST /api/lab/upload (multipart)', size, lambda: multipart(client, '/api/lab/upload'))
+    fresh_store()
+
+    def single_patch():
+        response = client.post('/api/lab/uploads', json={'file_name': 'scan.dcm', 'size': size, 'patient_id': 1})
+        with open(source, 'rb') as f:
+            return client.patch(f'/api/lab/uploads/{response.json["upload_id"]}', input_stream=f,
+                                headers={'Upload-Offset': '0', 'Content-Length': str(size)})
+
+    measure('upload session, one PATCH', size, single_patch)
+    fresh_store()
+    measure(f'upload session, {blobs.SESSION_CHUNK_SIZE // 1024 ** 2} MB PATCHes', size,
+            lambda: session(blobs.SESSION_CHUNK_SIZE))
+    response = measure('same file again (deduplicated)', size, lambda: session(blobs.SESSION_CHUNK_SIZE))
+    assert response.json['deduplicated']
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Shared helpers for the benchmark scripts.
+
+Each benchmark runs against a throwaway database so the real
+database/hospitrack.db is never touched. Import this module before
+anything from the backend so HOSPITRACK_DB is set in time.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+if 'HOSPITRACK_DB' not in os.environ:
+    os.environ['HOSPITRACK_DB'] = os.path.join(tempfile.mkdtemp(prefix='hospitrack-bench-'), 'bench.db')
+
+BED_TYPES = ('ICU', 'General Ward', 'Ventilator', 'Maternity', 'Pediatric', 'Isolation', 'Burn Unit', 'Cardiac', 'Neonatal', 'Emergency')
+
+
+def fresh_database():
+    """Create an empty schema in the benchmark database and return a connection."""
+    from database import DB_PATH, connect
+    import init_db
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    init_db.init_db()
+    return connect()
+
+
+def seed_hospitals(conn, hospitals, beds_per_hospital, seed=42):
+    """Bulk insert hospitals and bed rows."""
+    rng = random.Random(seed)
+    conn.executemany('INSERT INTO hospitals (id, name, location, contact) VALUES (?, ?, ?, ?)',
+                     ((i, f'Hospital {i}', f'District {i % 97}', f'555-{i:05d}') for i in range(1, hospitals + 1)))
+    rows = []
+    for hid in range(1, hospitals + 1):
+        for bed_type in rng.sample(BED_TYPES, min(beds_per_hospital, len(BED_TYPES))):
+            total = rng.randint(5, 120)
+            rows.append((hid, bed_type, total, rng.randint(0, total), rng.choice((100, 250, 500, 1000))))
+    conn.executemany('INSERT INTO beds (hospital_id, bed_type, total_count, available_count, price) VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+
+
+def signed_in(client):
+    """Give a Flask test client an admin session, since the API refuses anonymous calls."""
+    import auth
+    token, _ = auth.issue_session({'id': 0, 'role': 'admin', 'hospital_id': None})
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+def timed(fn, repeat=5):
+    """Run fn `repeat` times and return (result, [seconds...])."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, samples
+
+
+def report(label, samples):
+    ms = sorted(s * 1000 for s in samples)
+    print(f'{label:<40} median {statistics.median(ms):9.2f} ms   min {ms[0]:9.2f} ms   max {ms[-1]:9.2f} ms')
@@ -0,0 +1,320 @@
+"""Bulk-load a production-sized synthetic hospitrack.db for load testing.
+
+Creates a fresh database at --db (refusing to replace one without --force)
+with hospitals, beds, doctors and their schedules, staff/lab/patient
+accounts, a year of appointments, bed reservations and lab reports whose
+files go to a report store next to the database. Output is deterministic
+for a given --seed and day.
+
+    python backend/benchmarks/generate_data.py --db /tmp/load/hospitrack.db \\
+        --hospitals 10000 --patients 1000000 --appointments 5000000 --reports 1000000
+
+Rows are inserted with executemany() in one transaction with journaling
+off and the loaded tables' secondary indexes and triggers dropped; then the
+indexes and triggers are recreated and the tables they maintain (bed
+summaries, search, geo, doctor schedules, analytics rollups) are rebuilt
+in one pass each. Every account shares one password hash (--password),
+since hashing a million PBKDF2 passwords would take days. Usernames are
+admin, staff00001 (hospital 1), lab001 and patient0000001.
+
+Serve the result with the environment printed at the end, then run
+load_test.py against it.
+"""
+import argparse
+import io
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import common
+
+CITIES = (('Delhi', 28.61, 77.21), ('Mumbai', 19.08, 72.88), ('Bengaluru', 12.97, 77.59), ('Chennai', 13.08, 80.27),
+          ('Kolkata', 22.57, 88.36), ('Hyderabad', 17.39, 78.49), ('Pune', 18.52, 73.86), ('Jaipur', 26.91, 75.79))
+SPECIALIZATIONS = ('Cardiologist', 'Neurologist', 'Orthopedic', 'Pediatrician', 'Dermatologist', 'General Physician',
+                   'Gynecologist', 'Oncologist', 'ENT Specialist', 'Psychiatrist')
+SURNAMES = ('Sharma', 'Patel', 'Iyer', 'Reddy', 'Khan', 'Das', 'Mehta', 'Nair', 'Singh', 'Gupta', 'Rao', 'Bose')
+AVAILABILITY = ('Mon-Fri 9AM-5PM', 'Tue, Thu 2PM-6PM', 'Mon-Sat 10AM-1PM, 4PM-8PM', 'Mon, Wed, Fri 8AM-12PM', 'Sat-Sun 10AM-4PM')
+REPORT_TYPES = ('CBC', 'Lipid Panel', 'Thyroid Profile', 'X-Ray', 'MRI', 'Urinalysis', 'Liver Function', 'HbA1c')
+URGENCY = ('Normal', 'Urgent', 'Critical')
+SLOT_MINUTES = 30
+FUTURE_DAYS = 30
+# Tables loaded here; their secondary indexes and triggers are recreated after the load.
+TABLES = ('users', 'hospitals', 'beds', 'doctors', 'appointments', 'bed_reservations', 'reports')
+
+
+class Phase:
+    """Times a step and prints it, with a rate when `rows` is set."""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        line = f'  {self.label:<28} {elapsed:8.1f} s'
+        if self.rows:
+            line += f'   {self.rows:>11,} rows   {self.rows / elapsed:>10,.0f} rows/s'
+        print(line)
+
+
+def drop_indexes_and_triggers(conn):
+    """Drop what the load would otherwise maintain row by row; returns the SQL to recreate it."""
+    placeholders = ', '.join('?' * len(TABLES))
+    saved = conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', TABLES).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    # Indexes first, so the rebuilds that follow the load can use them.
+    return [sql for kind, _, sql in sorted(saved, key=lambda row: row[0] != 'index')]
+
+
+def template_slots(days, today):
+    """Per AVAILABILITY template, every (date, 'HH:MM') slot from `days` ago to FUTURE_DAYS ahead."""
+    import schedule
+
+    calendar = [today + timedelta(days=offset) for offset in range(-days, FUTURE_DAYS)]
+    slots = []
+    for availability in AVAILABILITY:
+        weekly = {}
+        for weekday, start, end in schedule.parse_schedule(availability=availability):
+            weekly.setdefault(weekday, []).extend(
+                f'{minute // 60:02}:{minute % 60:02}' for minute in range(start, end - SLOT_MINUTES + 1, SLOT_MINUTES))
+        slots.append([(day.isoformat(), label) for day in calendar for label in weekly.get(day.weekday(), ())])
+    return slots
+
+
+def coprime_stride(n, rng):
+    """A step that visits every position of range(n) once before repeating."""
+    while True:
+        stride = rng.randrange(1, max(n, 2))
+        a, b = stride, n
+        while b:
+            a, b = b, a % b
+        if a == 1:
+            return stride
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='database file to create')
+    parser.add_argument('--force', action='store_true', help='replace an existing database at --db')
+    parser.add_argument('--hospitals', type=int, default=1000)
+    parser.add_argument('--beds', type=int, default=6, help='bed types per hospital')
+    parser.add_argument('--doctors', type=int, default=8, help='doctors per hospital')
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--labs', type=int, default=20, help='lab technician accounts')
+    parser.add_argument('--appointments', type=int, default=500000)
+    parser.add_argument('--reservations', type=int, default=50000)
+    parser.add_argument('--reports', type=int, default=200000)
+    parser.add_argument('--files', type=int, default=500, help='distinct report files shared by the reports')
+    parser.add_argument('--file-kb', type=int, default=64, help='size of each report file')
+    parser.add_argument('--days', type=int, default=365, help='days of history before today')
+    parser.add_argument('--password', default='password', help='password of every generated account')
+    parser.add_argument('--seed', type=int, default=24)
+    args = parser.parse_args()
+    if min(args.hospitals, args.beds, args.doctors, args.patients, args.labs, args.files) < 1:
+        parser.error('--hospitals, --beds, --doctors, --patients, --labs and --files must be at least 1')
+    if os.path.exists(args.db) and not args.force:
+        sys.exit(f'{args.db} exists; pass --force to replace it')
+
+    # Point the backend at the new database, with its report store and occupancy history beside it.
+    db_dir = os.path.dirname(os.path.abspath(args.db))
+    os.makedirs(db_dir, exist_ok=True)
+    env = {'HOSPITRACK_DB': os.path.abspath(args.db),
+           'HOSPITRACK_REPORT_DIR': os.environ.get('HOSPITRACK_REPORT_DIR', os.path.join(db_dir, 'reports')),
+           'HOSPITRACK_OCCUPANCY_DB': os.environ.get('HOSPITRACK_OCCUPANCY_DB', os.path.join(db_dir, 'occupancy.db'))}
+    os.environ.update(env)
+    import analytics
+    import auth
+    import bed_summary
+    import blobs
+    import geo
+    import schedule
+    import search
+
+    rng = random.Random(args.seed)
+    today = date.today()
+    now = datetime.now()
+    started = time.perf_counter()
+    print(f'Generating {env["HOSPITRACK_DB"]}')
+
+    with Phase('schema'):
+        conn = common.fresh_database()
+        recreate = drop_indexes_and_triggers(conn)
+        conn.commit()
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+
+    with Phase('hospitals') as phase:
+        def hospital_rows():
+            for hid in range(1, args.hospitals + 1):
+                city, lat, lon = CITIES[hid % len(CITIES)]
+                yield (hid, f'{city} {rng.choice(SURNAMES)} Hospital {hid}', f'{city} District {hid % 97}', f'555-{hid:05d}',
+                       round(lat + rng.uniform(-0.3, 0.3), 5), round(lon + rng.uniform(-0.3, 0.3), 5))
+        conn.executemany('INSERT INTO hospitals (id, name, location, contact, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?)',
+                         hospital_rows())
+        phase.rows = args.hospitals
+
+    bed_types = [None]
+    with Phase('beds') as phase:
+        rows = []
+        for hid in range(1, args.hospitals + 1):
+            bed_types.append(rng.sample(common.BED_TYPES, min(args.beds, len(common.BED_TYPES))))
+            for bed_type in bed_types[hid]:
+                total = rng.randint(5, 120)
+                rows.append((hid, bed_type, total, rng.randint(0, total), rng.choice((100, 250, 500, 1000))))
+        conn.executemany('INSERT INTO beds (hospital_id, bed_type, total_count, available_count, price) VALUES (?, ?, ?, ?, ?)', rows)
+        phase.rows = len(rows)
+
+    # doctor id -> (hospital id, name, AVAILABILITY index); hospital h has ids (h-1)*n+1 .. h*n
+    doctors = [None]
+    with Phase('doctors') as phase:
+        for hid in range(1, args.hospitals + 1):
+            for _ in range(args.doctors):
+                doctors.append((hid, f'Dr. {rng.choice(SURNAMES)} {len(doctors)}', rng.randrange(len(AVAILABILITY))))
+        conn.executemany('''
+            INSERT INTO doctors (id, hospital_id, name, specialization, availability, is_visiting, slot_minutes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ((did, hid, name, rng.choice(SPECIALIZATIONS), AVAILABILITY[template], int(rng.random() < 0.2), SLOT_MINUTES)
+              for did, (hid, name, template) in enumerate(doctors[1:], 1)))
+        phase.rows = len(doctors) - 1
+
+    password = auth.hash_password(args.password)
+    first_lab = args.hospitals + 2
+    first_patient = first_lab + args.labs
+    last_patient = first_patient + args.patients - 1
+    with Phase('users') as phase:
+        accounts = itertools.chain(
+            [(1, 'admin', 'admin', 'System Admin', None, None)],
+            ((hid + 1, f'staff{hid:05d}', 'hospital_staff', f'Staff, Hospital {hid}', hid, None)
+             for hid in range(1, args.hospitals + 1)),
+            ((first_lab + i, f'lab{i + 1:03d}', 'lab_tech', f'Lab Tech {i + 1}', None, None) for i in range(args.labs)),
+            ((uid, f'patient{uid - first_patient + 1:07d}', 'patient', f'{rng.choice(SURNAMES)} Patient {uid}', None, f'HT-{uid:06X}')
+             for uid in range(first_patient, last_patient + 1)))
+        conn.executemany('''
+            INSERT INTO users (id, username, password, role, full_name, hospital_id, hospitrack_id) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ((uid, username, password, role, name, hid, htid) for uid, username, role, name, hid, htid in accounts))
+        phase.rows = 1 + args.hospitals + args.labs + args.patients
+
+    with Phase('appointments') as phase:
+        # Each doctor's bookings walk its calendar with a stride coprime to
+        # its length, so no slot is booked twice (the unique slot index).
+        slots = template_slots(args.days, today)
+        strides = [coprime_stride(len(calendar), rng) for calendar in slots]
+        offsets = [rng.randrange(1 << 30) for _ in doctors]
+        booked = [0] * len(doctors)
+        today_label = today.isoformat()
+        times = [f'{h:02}:{m:02}:00' for h in range(24) for m in range(0, 60, 15)]
+
+        def appointment_rows():
+            randrange, uniform = rng.randrange, rng.random
+            for k in range(1, args.appointments + 1):
+                did = randrange(1, len(doctors))
+                hid, name, template = doctors[did]
+                calendar = slots[template]
+                j = booked[did]
+                booked[did] += 1
+                if j < len(calendar):
+                    day, label = calendar[(offsets[did] + j * strides[template]) % len(calendar)]
+                    slot_start = f'{day} {label}'
+                else:
+                    # The doctor's calendar is full: an appointment without a slot.
+                    day, slot_start = calendar[randrange(len(calendar))][0], None
+                if day >= today_label:
+                    status = 'Pending'
+                else:
+                    roll = uniform()
+                    status = 'Completed' if roll < 0.85 else 'Cancelled' if roll < 0.93 else 'Checked-in' if roll < 0.96 else 'Pending'
+                booked_on = (date.fromisoformat(day) - timedelta(days=randrange(15))).isoformat()
+                yield (k, randrange(first_patient, last_patient + 1), hid, did, name, day, day, status, f'APT-{k:08X}',
+                       f'{booked_on} {times[randrange(len(times))]}', slot_start)
+        conn.executemany('''
+            INSERT INTO appointments (id, patient_id, hospital_id, doctor_id, doctor_name, date, appointment_date, status,
+                                      appointment_no, created_at, slot_start)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', appointment_rows())
+        phase.rows = args.appointments
+
+    history_seconds = args.days * 86400
+    with Phase('bed reservations') as phase:
+        def reservation_rows():
+            for k in range(1, args.reservations + 1):
+                hid = rng.randint(1, args.hospitals)
+                at = now - timedelta(seconds=rng.randrange(history_seconds))
+                yield (k, rng.randint(first_patient, last_patient), hid, rng.choice(bed_types[hid]), at.strftime('%Y-%m-%d %H:%M:%S'),
+                       'Expired' if rng.random() < 0.7 else 'Cancelled', f'{rng.randint(1, 999)} Main Road', rng.choice(URGENCY))
+        conn.executemany('''
+            INSERT INTO bed_reservations (id, patient_id, hospital_id, bed_type, timestamp, status, address, urgency)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', reservation_rows())
+        phase.rows = args.reservations
+
+    with Phase('report files') as phase:
+        store = blobs.BlobStore()
+        files = []
+        for _ in range(args.files):
+            digest, size, _ = store.put_stream(io.BytesIO(b'%PDF-1.4\n' + rng.randbytes(args.file_kb * 1024)))
+            files.append((store.relative_path(digest), size, digest))
+        phase.rows = args.files
+
+    with Phase('reports') as phase:
+        lab_names = [f'Lab Tech {i + 1}' for i in range(args.labs)]
+
+        def report_rows():
+            for k in range(1, args.reports + 1):
+                hid = rng.randint(1, args.hospitals)
+                doctor_name = doctors[(hid - 1) * args.doctors + rng.randint(1, args.doctors)][1]
+                report_type = rng.choice(REPORT_TYPES)
+                ordered = now - timedelta(seconds=rng.randrange(history_seconds))
+                ordered_at = ordered.strftime('%Y-%m-%d %H:%M:%S')
+                if rng.random() < 0.9:
+                    completed = min(ordered + timedelta(minutes=rng.randint(30, 4320)), now)
+                    path, size, digest = files[rng.randrange(len(files))]
+                    yield (k, rng.randint(first_patient, last_patient), hid, doctor_name, report_type, rng.choice(lab_names),
+                           completed.strftime('%Y-%m-%d'), f'{report_type.replace(" ", "_")}_{k}.pdf', path, 'Completed',
+                           f'LAB-{k:08X}', size, digest, ordered_at, completed.strftime('%Y-%m-%d %H:%M:%S'))
+                else:
+                    yield (k, rng.randint(first_patient, last_patient), hid, doctor_name, report_type, rng.choice(lab_names),
+                           ordered.strftime('%Y-%m-%d'), 'Pending Upload', None, 'Pending', f'LAB-{k:08X}', None, None,
+                           ordered_at, None)
+        conn.executemany('''
+            INSERT INTO reports (id, patient_id, hospital_id, doctor_name, report_name, lab_name, date_uploaded, file_name,
+                                 file_path, status, lab_order_id, file_size, file_sha256, ordered_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', report_rows())
+        phase.rows = args.reports
+
+    with Phase('indexes and triggers'):
+        for sql in recreate:
+            conn.execute(sql)
+    with Phase('bed summaries, search, geo'):
+        bed_summary.rebuild(conn)
+        search.rebuild(conn)
+        geo.rebuild(conn)
+    with Phase('doctor schedules'):
+        schedule.rebuild(conn)
+    with Phase('analytics rollups'):
+        analytics.rebuild(conn)
+    with Phase('commit and ANALYZE'):
+        conn.commit()
+        conn.execute('ANALYZE')
+        conn.commit()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.close()
+
+    print(f'Done in {time.perf_counter() - started:.1f} s, {os.path.getsize(args.db) / 1024 ** 2:,.0f} MiB. Serve it with:')
+    print('  ' + ' '.join(f'{name}={value}' for name, value in env.items()) + ' python3 backend/serve.py')
+
+
+if __name__ == '__main__':
+    main()
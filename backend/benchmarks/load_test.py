@@ -0,0 +1,378 @@
+"""End-to-end load test replaying the dashboards' API calls against a running server.
+
+Virtual users log in as generated accounts (see generate_data.py) and
+repeat what their portal does, in the same order and with the same query
+strings as patient_dashboard.js, hospital_dashboard.js and lab_dashboard.js:
+
+  patient   timeline and bed search on load; sometimes books an appointment
+            (hospitals, doctors_list, slots, POST appointments, timeline) or
+            reserves a bed (POST reserve_bed, timeline, bed search)
+  hospital  details, analytics and appointments on load; sometimes edits a
+            bed count, toggles a doctor, or checks a patient in, then reloads
+  lab       patient search by HospiTrack ID, then a report upload
+
+Each user switches to another account (logout, login) every
+--visits-per-login visits. Live update streams are not opened; see
+bench_sse_fanout.py for those.
+
+    python3 backend/serve.py &            # with the environment generate_data.py printed
+    python backend/benchmarks/load_test.py --db /tmp/load/hospitrack.db --concurrency 32 --duration 60
+
+Latency percentiles per endpoint are printed and saved as JSON (with the
+commit, settings and data volumes) under database/loadtests/; --compare
+prints the change against an earlier run. The client shares the machine
+with the server unless --url points elsewhere, so compare runs made the
+same way.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+RESULTS_DIR = os.path.join(REPO_DIR, 'database/loadtests')
+ROLES = {'patient': 'patient', 'hospital': 'hospital_staff', 'lab': 'lab_tech'}
+# Accounts sampled per role; virtual users draw from these.
+ACCOUNT_SAMPLE = 5000
+
+
+class Recorder:
+    """Latency samples and status counts per endpoint, shared by every virtual user."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, elapsed):
+        with self._lock:
+            self.samples[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Client:
+    """One browser tab: a session token and a new connection per request, as the dev server closes each one."""
+
+    def __init__(self, url, recorder, timeout):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, endpoint, method, path, body=None, content_type='application/json'):
+        """Send one request, recorded under `endpoint`; returns (status, parsed JSON or None)."""
+        headers = {}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        if body is not None:
+            if content_type == 'application/json':
+                body = json.dumps(body).encode()
+            headers['Content-Type'] = content_type
+        start = time.perf_counter()
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, f'/api{path}', body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            self.recorder.record(f'{method} /api{endpoint}', type(e).__name__, time.perf_counter() - start)
+            return None, None
+        finally:
+            conn.close()
+        self.recorder.record(f'{method} /api{endpoint}', status, time.perf_counter() - start)
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def get(self, endpoint, path):
+        return self.request(endpoint, 'GET', path)
+
+    def post(self, endpoint, path, body):
+        return self.request(endpoint, 'POST', path, body)
+
+
+# --- Dashboard flows ---
+
+def patient_visit(client, user, rng, ctx):
+    uid = user['id']
+
+    def load_timeline(types=('appointment', 'reservation', 'report')):
+        client.get('/patient/<id>/timeline', f'/patient/{uid}/timeline?type={",".join(types)}&limit=1000')
+
+    def search_beds():
+        query = ''
+        if rng.random() < 0.5:
+            # Browsers that share their position get the nearest hospitals.
+            hospital = rng.choice(ctx['hospitals'])
+            query = '?' + urlencode({'lat': hospital['latitude'], 'lon': hospital['longitude']})
+        return client.get('/patient/search_beds', f'/patient/search_beds{query}')[1] or []
+
+    load_timeline()
+    beds = search_beds()
+    if rng.random() < 0.3:
+        _, hospitals = client.get('/hospitals', '/hospitals')
+        if not hospitals:
+            return
+        hospital_id = rng.choice(hospitals)['id']
+        _, doctors = client.get('/hospital/<id>/doctors_list', f'/hospital/{hospital_id}/doctors_list')
+        if not doctors:
+            return
+        doctor_id = rng.choice(doctors)['id']
+        for _ in range(3):
+            day = (date.today() + timedelta(days=rng.randint(1, 14))).isoformat()
+            status, slots = client.get('/hospital/<id>/doctors/<id>/slots', f'/hospital/{hospital_id}/doctors/{doctor_id}/slots?date={day}')
+            available = slots['days'][0]['available'] if status == 200 else []
+            if available:
+                client.post('/patient/appointments', '/patient/appointments',
+                            {'patient_id': uid, 'doctor_id': doctor_id, 'slot': f'{day}T{rng.choice(available)}'})
+                load_timeline(('appointment',))
+                break
+    elif beds and rng.random() < 0.05:
+        bed = rng.choice(beds)
+        client.post('/patient/reserve_bed', '/patient/reserve_bed',
+                    {'patient_id': uid, 'hospital_id': bed['hospital_id'], 'bed_type': bed['bed_type'],
+                     'address': 'Load test', 'urgency': rng.choice(('Normal', 'Urgent', 'Critical'))})
+        load_timeline(('reservation',))
+        search_beds()
+
+
+def hospital_visit(client, user, rng, ctx):
+    hospital_id = user['hospital_id']
+
+    def load_dashboard():
+        _, details = client.get('/hospital/<id>/details', f'/hospital/{hospital_id}/details')
+        client.get('/hospital/<id>/analytics', f'/hospital/{hospital_id}/analytics')
+        _, appointments = client.get('/hospital/<id>/appointments', f'/hospital/{hospital_id}/appointments')
+        return details or {}, appointments or []
+
+    details, appointments = load_dashboard()
+    roll = rng.random()
+    if roll < 0.2 and details.get('beds'):
+        bed = rng.choice(details['beds'])
+        available = min(bed['total_count'], max(0, bed['available_count'] + rng.choice((-1, 1))))
+        client.post('/hospital/beds', '/hospital/beds',
+                    {'hospital_id': hospital_id, 'bed_type': bed['bed_type'], 'total_count': bed['total_count'],
+                     'available_count': available, 'price': bed['price']})
+        load_dashboard()
+    elif roll < 0.3 and details.get('doctors'):
+        doctor_id = rng.choice(details['doctors'])['id']
+        client.request('/hospital/doctors/<id>/status', 'PUT', f'/hospital/doctors/{doctor_id}/status')
+        load_dashboard()
+    elif roll < 0.5:
+        pending = [a for a in appointments if a['status'] == 'Pending']
+        if pending:
+            client.request('/hospital/appointments/<id>', 'PATCH', f'/hospital/appointments/{rng.choice(pending)["id"]}',
+                           {'status': 'Checked-in'})
+
+
+def lab_visit(client, user, rng, ctx):
+    hospitrack_id = rng.choice(ctx['hospitrack_ids'])
+    status, patient = client.get('/patient/search', f'/patient/search?{urlencode({"hospitrack_id": hospitrack_id})}')
+    if status != 200:
+        return
+    boundary = uuid.uuid4().hex
+    fields = {'patient_id': patient['id'], 'report_type': rng.choice(('CBC', 'X-Ray', 'MRI', 'Lipid Panel')),
+              'lab_name': user['full_name']}
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="report.pdf"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n'.encode() + b'%PDF-1.4\n' + rng.randbytes(ctx['upload_bytes']) + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    client.request('/lab/upload', 'POST', '/lab/upload', b''.join(parts), f'multipart/form-data; boundary={boundary}')
+
+
+VISITS = {'patient': patient_visit, 'hospital': hospital_visit, 'lab': lab_visit}
+
+
+def assign_roles(mix, users):
+    """Split `users` between roles in proportion to the mix weights."""
+    total = sum(mix.values())
+    roles = []
+    for i in range(users):
+        point, cumulative = (i + 0.5) / users * total, 0
+        for role, weight in mix.items():
+            cumulative += weight
+            if point < cumulative:
+                break
+        roles.append(role)
+    return roles
+
+
+def virtual_user(index, role, args, recorder, ctx, deadline):
+    rng = random.Random(args.seed * 1000 + index)
+    client = Client(args.url, recorder, args.timeout)
+    while time.monotonic() < deadline:
+        account = rng.choice(ctx['accounts'][role])
+        status, body = client.post('/login', '/login', {'username': account, 'password': args.password})
+        if status != 200:
+            time.sleep(1)
+            continue
+        client.token = body['token']
+        for _ in range(args.visits_per_login):
+            if time.monotonic() >= deadline:
+                break
+            VISITS[role](client, body['user'], rng, ctx)
+            if args.think:
+                time.sleep(rng.expovariate(1 / args.think))
+        client.post('/logout', '/logout', {})
+        client.token = None
+
+
+def load_context(path, mix):
+    """Accounts, hospitals and patients to draw from, and the data volumes, read from the served database."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    accounts = {}
+    for role, db_role in ROLES.items():
+        accounts[role] = [row[0] for row in conn.execute(
+            'SELECT username FROM users WHERE role = ? ORDER BY random() LIMIT ?', (db_role, ACCOUNT_SAMPLE))]
+        if mix.get(role) and not accounts[role]:
+            raise SystemExit(f'{path} has no {db_role} accounts; generate data with generate_data.py')
+    hospitrack_ids = [row[0] for row in conn.execute(
+        "SELECT hospitrack_id FROM users WHERE role = 'patient' AND hospitrack_id IS NOT NULL ORDER BY random() LIMIT ?",
+        (ACCOUNT_SAMPLE,))]
+    hospitals = [dict(row) for row in conn.execute(
+        'SELECT id, latitude, longitude FROM hospitals WHERE latitude IS NOT NULL ORDER BY random() LIMIT 1000')]
+    dataset = {table: conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+               for table in ('hospitals', 'doctors', 'appointments', 'bed_reservations', 'reports')}
+    dataset.update(('users_' + role, count) for role, count in conn.execute('SELECT role, count(*) FROM users GROUP BY role'))
+    conn.close()
+    return {'accounts': accounts, 'hospitrack_ids': hospitrack_ids, 'hospitals': hospitals or [{'latitude': 28.6, 'longitude': 77.2}]}, dataset
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        statuses = recorder.statuses[endpoint]
+        endpoints[endpoint] = {
+            'requests': len(ordered),
+            'errors': sum(n for status, n in statuses.items() if not isinstance(status, int) or status >= 500),
+            'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+            'rps': round(len(ordered) / elapsed, 2),
+            'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+            'max_ms': round(ordered[-1] * 1000, 2),
+        }
+    everything = sorted(s for samples in recorder.samples.values() for s in samples)
+    total = {
+        'requests': len(everything),
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'rps': round(len(everything) / elapsed, 2),
+    }
+    if everything:
+        total.update(p50_ms=round(percentile(everything, 50) * 1000, 2), p95_ms=round(percentile(everything, 95) * 1000, 2),
+                     p99_ms=round(percentile(everything, 99) * 1000, 2))
+    return total, endpoints
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_results(result, baseline=None):
+    print(f'{result["total"]["requests"]:,} requests in {result["duration_seconds"]:.0f} s '
+          f'({result["total"]["rps"]:,.1f}/s, {result["total"]["errors"]} errors)')
+    previous = baseline['endpoints'] if baseline else {}
+    print(f'  {"endpoint":<48} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}  statuses')
+    for endpoint, stats in result['endpoints'].items():
+        line = f'  {endpoint:<48} {stats["requests"]:>7,} {stats["p50_ms"]:>9.1f} {stats["p95_ms"]:>9.1f} {stats["p99_ms"]:>9.1f}  '
+        line += ' '.join(f'{status}x{n}' for status, n in stats['statuses'].items())
+        print(line)
+        old = previous.get(endpoint)
+        if old:
+            changes = '  '.join(f'{p} {old[p + "_ms"]:.1f} -> {stats[p + "_ms"]:.1f} ({(stats[p + "_ms"] / old[p + "_ms"] - 1) * 100:+.0f}%)'
+                                for p in ('p50', 'p95', 'p99') if old[p + '_ms'])
+            print(f'  {"":<48} vs baseline: {changes}')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        if role not in VISITS:
+            raise argparse.ArgumentTypeError(f'unknown role {role!r}; expected {", ".join(VISITS)}')
+        mix[role] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:9000')
+    parser.add_argument('--db', default=os.environ.get('HOSPITRACK_DB', os.path.join(REPO_DIR, 'database/hospitrack.db')),
+                        help='the database the server uses, read for accounts to log in as')
+    parser.add_argument('--password', default='password', help='password of the generated accounts')
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('patient=6,hospital=3,lab=1'), help='role weights')
+    parser.add_argument('--visits-per-login', type=int, default=10)
+    parser.add_argument('--think', type=float, default=0, help='mean pause between visits, seconds')
+    parser.add_argument('--upload-kb', type=int, default=64)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help=f'results file (default: {os.path.relpath(RESULTS_DIR, REPO_DIR)}/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    ctx, dataset = load_context(args.db, args.mix)
+    ctx['upload_bytes'] = args.upload_kb * 1024
+    recorder = Recorder()
+    print(f'{args.concurrency} virtual users for {args.duration:.0f} s against {args.url}; data: '
+          + ', '.join(f'{name} {count:,}' for name, count in dataset.items()))
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    start = time.monotonic()
+    deadline = start + args.duration
+    users = [threading.Thread(target=virtual_user, args=(i, role, args, recorder, ctx, deadline), daemon=True)
+             for i, role in enumerate(assign_roles(args.mix, args.concurrency))]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - start
+
+    total, endpoints = summarize(recorder, elapsed)
+    commit, dirty = git_commit()
+    settings = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'password')}
+    result = {'started_at': started_at, 'commit': commit, 'dirty': dirty, 'duration_seconds': round(elapsed, 1),
+              'settings': settings, 'dataset': dataset, 'total': total, 'endpoints': endpoints}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f'Baseline: {args.compare} (commit {(baseline.get("commit") or "unknown")[:10]})')
+    print_results(result, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{(commit or "nogit")[:10]}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'Saved {output}')
+
+
+if __name__ == '__main__':
+    main()
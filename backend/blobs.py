@@ -0,0 +1,250 @@
+"""Content-addressed storage for uploaded lab report files.
+
+Uploads are streamed to disk in fixed-size chunks while their SHA-256 is
+computed, then moved into place under the digest (`ab/abcdef...`), so a file
+uploaded twice - for another patient or another order - is stored once and
+memory use does not grow with the file. The store lives outside the static
+folder; files are only served through the authorized report endpoint.
+
+Large files can also be sent through an upload session: the client announces
+the size, then sends the bytes in as many PATCH requests as it likes, each
+starting at the offset the server already holds. After a dropped connection
+it asks for that offset and carries on from there. A session may announce
+the file's SHA-256; if the bytes received do not hash to it, the upload is
+discarded instead of stored. Sessions nobody finishes are purged after
+UPLOAD_SESSION_TTL_HOURS:
+
+    python backend/blobs.py [--ttl-hours 24]
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+from database import connect
+
+STORE_DIR = os.environ.get('HOSPITRACK_REPORT_DIR', os.path.join(os.path.dirname(__file__), '../database/reports'))
+# Where reports used to be saved, relative to the frontend folder.
+LEGACY_PREFIX = 'assets/reports/'
+CHUNK_SIZE = 1024 * 1024
+# What the upload session endpoint suggests clients send per request.
+SESSION_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('HOSPITRACK_MAX_UPLOAD_BYTES', 4 * 1024 ** 3))
+UPLOAD_SESSION_TTL_HOURS = 24
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    patient_id INTEGER REFERENCES users (id),
+    lab_order_id TEXT,
+    appointment_no TEXT,
+    report_type TEXT,
+    lab_name TEXT,
+    file_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_created ON upload_sessions (created);
+CREATE INDEX IF NOT EXISTS idx_reports_sha256 ON reports (file_sha256);
+'''
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class DigestMismatch(Exception):
+    """A finished session upload does not hash to the SHA-256 its client announced."""
+
+    def __init__(self, digest):
+        super().__init__(f'upload hashes to {digest}')
+        self.digest = digest
+
+
+class OffsetMismatch(Exception):
+    """A chunk would leave a gap after the bytes already received."""
+
+    def __init__(self, received):
+        super().__init__(f'upload continues at byte {received}')
+        self.received = received
+
+
+def _copy(stream, out, sha, limit):
+    """Copy stream to out chunk by chunk, hashing as it goes; returns bytes copied."""
+    copied = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if copied > limit:
+            raise UploadTooLarge(f'upload exceeds {limit} bytes')
+        if sha is not None:
+            sha.update(chunk)
+        out.write(chunk)
+
+
+class BlobStore:
+    """Files named by their SHA-256 under `root`, plus partial session uploads."""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self._incoming = os.path.join(root, '.incoming')
+        self._sessions = os.path.join(root, '.sessions')
+        os.makedirs(self._incoming, exist_ok=True)
+        os.makedirs(self._sessions, exist_ok=True)
+        # upload id -> (offset, running sha256) for sessions whose chunks have
+        # arrived in order in this process; anything else is rehashed at the end.
+        self._hashers = {}
+        self._lock = threading.Lock()
+
+    def relative_path(self, digest):
+        return f'{digest[:2]}/{digest}'
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _commit(self, tmp_path, digest):
+        """Move a finished upload into place; False if the blob was already stored."""
+        dest = self.path(digest)
+        if os.path.exists(dest):
+            os.remove(tmp_path)
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp_path, dest)
+        return True
+
+    def put_stream(self, stream, limit=MAX_UPLOAD_BYTES):
+        """Store everything read from stream; returns (digest, size, newly_stored)."""
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self._incoming)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                size = _copy(stream, out, sha, limit)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        digest = sha.hexdigest()
+        return digest, size, self._commit(tmp_path, digest)
+
+    # --- Upload sessions ---
+
+    def _partial(self, upload_id):
+        return os.path.join(self._sessions, upload_id)
+
+    def begin(self, upload_id):
+        open(self._partial(upload_id), 'wb').close()
+        with self._lock:
+            self._hashers[upload_id] = (0, hashlib.sha256())
+
+    def received(self, upload_id):
+        """Bytes held for a session, or None if it has no partial file."""
+        try:
+            return os.path.getsize(self._partial(upload_id))
+        except FileNotFoundError:
+            return None
+
+    def write_chunk(self, upload_id, offset, stream, size):
+        """Write stream at offset into a session of `size` bytes; returns bytes now held.
+
+        Re-sending bytes the server already has is allowed (the client may not
+        know its last request landed); skipping ahead is not.
+        """
+        received = self.received(upload_id)
+        if received is None:
+            raise FileNotFoundError(upload_id)
+        if offset > received:
+            raise OffsetMismatch(received)
+        with self._lock:
+            offset_hashed, sha = self._hashers.pop(upload_id, (None, None))
+        if offset_hashed != offset:
+            sha = None
+        with open(self._partial(upload_id), 'r+b') as out:
+            out.seek(offset)
+            written = _copy(stream, out, sha, size - offset)
+        if sha is not None:
+            with self._lock:
+                self._hashers[upload_id] = (offset + written, sha)
+        return max(received, offset + written)
+
+    def finish(self, upload_id, expected=None):
+        """Hash (if needed) and store a complete session upload; returns (digest, size, newly_stored).
+
+        With `expected`, a different digest discards the upload and raises DigestMismatch.
+        """
+        partial = self._partial(upload_id)
+        size = os.path.getsize(partial)
+        with self._lock:
+            offset_hashed, sha = self._hashers.pop(upload_id, (None, None))
+        if offset_hashed != size:
+            # Chunks arrived out of order, overlapped, or in another process.
+            sha = hashlib.sha256()
+            with open(partial, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    sha.update(chunk)
+        digest = sha.hexdigest()
+        if expected is not None and digest != expected:
+            self.discard(upload_id)
+            raise DigestMismatch(digest)
+        return digest, size, self._commit(partial, digest)
+
+    def discard(self, upload_id):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        try:
+            os.remove(self._partial(upload_id))
+        except FileNotFoundError:
+            pass
+
+
+store = BlobStore()
+
+
+def import_legacy_files(conn, static_root):
+    """Copy report files saved under the static folder into the store and repoint their rows.
+
+    The originals are left in place (the app no longer serves that path);
+    rows whose file is missing keep their old path. Returns (imported, missing).
+    """
+    imported = missing = 0
+    rows = conn.execute('SELECT id, file_path FROM reports WHERE file_path LIKE ?  -- full scan',
+                        (LEGACY_PREFIX + '%',)).fetchall()
+    for report_id, file_path in rows:
+        try:
+            with open(os.path.join(static_root, file_path), 'rb') as f:
+                digest, size, _ = store.put_stream(f, limit=float('inf'))
+        except FileNotFoundError:
+            missing += 1
+            continue
+        conn.execute('UPDATE reports SET file_path = ?, file_size = ?, file_sha256 = ? WHERE id = ?',
+                     (store.relative_path(digest), size, digest, report_id))
+        imported += 1
+    return imported, missing
+
+
+def purge_stale_uploads(conn, ttl_hours=UPLOAD_SESSION_TTL_HOURS):
+    """Drop upload sessions older than the TTL and their partial files; returns how many."""
+    # upload_sessions.created is written by CURRENT_TIMESTAMP, i.e. UTC.
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=ttl_hours)).strftime('%Y-%m-%d %H:%M:%S')
+    stale = [row[0] for row in conn.execute('DELETE FROM upload_sessions WHERE created < ? RETURNING id', (cutoff,)).fetchall()]
+    conn.commit()
+    for upload_id in stale:
+        store.discard(upload_id)
+    return len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Purge abandoned report upload sessions.')
+    parser.add_argument('--ttl-hours', type=float, default=UPLOAD_SESSION_TTL_HOURS)
+    args = parser.parse_args()
+
+    conn = connect()
+    purged = purge_stale_uploads(conn, args.ttl_hours)
+    conn.close()
+    print(f"Purged {purged} stale upload sessions.")
+
+
+if __name__ == '__main__':
+    main()
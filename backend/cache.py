@@ -0,0 +1,214 @@
+"""Bounded read-through cache for per-hospital read endpoints.
+
+Entries are keyed by hospital id and the hospital's data version (see
+versions.py), so a write made anywhere (another worker, the expiry cron) is
+a miss on the next read. Handlers that change a hospital's beds or doctors
+also drop its entries to free the space, with a TTL as a safety net. Two
+backends are available:
+
+* `memory` (default): an in-process LRU. Fastest, but each worker process
+  has its own copy; other workers refill theirs when the version moves.
+* `sqlite`: a small shared cache file that all worker processes on the host
+  read and invalidate together.
+
+Set HOSPITRACK_CACHE=off (or POST /api/admin/cache) to bypass it.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.environ.get('HOSPITRACK_CACHE', 'memory')
+CACHE_TTL = float(os.environ.get('HOSPITRACK_CACHE_TTL', 60))
+CACHE_MAX_ENTRIES = int(os.environ.get('HOSPITRACK_CACHE_MAX_ENTRIES', 2048))
+CACHE_PATH = os.environ.get('HOSPITRACK_CACHE_PATH', os.path.join(os.path.dirname(__file__), '../database/cache.db'))
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """Cache shared by every worker process through one WAL-mode file."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.evictions = 0
+        self.expirations = 0
+        self._conn().execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        self._conn().execute('CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('PRAGMA busy_timeout = 2000')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        row = self._conn().execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        if row[1] < now:
+            self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+            self.expirations += 1
+            return _MISSING
+        self._conn().execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                     (key, json.dumps(value), now + ttl, now))
+        excess = self.size() - self.max_entries
+        if excess > 0:
+            conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)', (excess,))
+            self.evictions += excess
+
+    def delete(self, keys):
+        self._conn().executemany('DELETE FROM cache WHERE key = ?', [(k,) for k in keys])
+
+    def delete_prefix(self, prefix):
+        self._conn().execute('DELETE FROM cache WHERE key >= ? AND key < ?', (prefix, prefix + '\uffff'))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache')
+
+    def size(self):
+        return self._conn().execute('SELECT count(*) FROM cache').fetchone()[0]
+
+
+class ReadThroughCache:
+    def __init__(self, backend, ttl=CACHE_TTL, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() to fill a miss."""
+        if not self.enabled:
+            return loader()
+        value = self.backend.get(key)
+        hit = value is not _MISSING
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not hit:
+            value = loader()
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, *keys):
+        self.backend.delete(keys)
+
+    def invalidate_prefix(self, prefix):
+        self.backend.delete_prefix(prefix)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "max_entries": self.backend.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.backend.evictions,
+            "expirations": self.backend.expirations,
+        }
+
+
+def _build():
+    if CACHE_BACKEND == 'sqlite':
+        return ReadThroughCache(SQLiteBackend())
+    return ReadThroughCache(MemoryBackend(), enabled=CACHE_BACKEND != 'off')
+
+
+cache = _build()
+
+
+def details_key(hospital_id, version):
+    return f'hospital:{hospital_id}:details:{version}'
+
+
+def doctors_key(hospital_id, version):
+    return f'hospital:{hospital_id}:doctors:{version}'
+
+
+def invalidate_hospital(hospital_id):
+    """Drop everything cached for a hospital, at any version, after its beds or doctors change."""
+    if hospital_id is not None:
+        cache.invalidate_prefix(f'hospital:{hospital_id}:')
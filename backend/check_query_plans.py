@@ -0,0 +1,156 @@
+"""Regression check: every filtered query in the backend must use an index.
+
+Collects the literal SQL passed to execute()/executemany() in the backend
+modules, runs EXPLAIN QUERY PLAN against a freshly migrated in-memory
+database and fails if a statement with a WHERE clause scans a table, or if
+any query scans the inner table of a join. Queries without a filter are full
+listings by design and may scan their outer table. A statement containing a
+`-- full scan` comment (index rebuilds and other batch jobs) is exempt.
+Dynamically assembled SQL (f-strings, concatenation) is not collected here;
+tests/test_query_plans.py plans it through the query builders instead.
+Statements on tables kept outside the main database (the cache file,
+occupancy.db) are reported as skipped.
+
+    python backend/check_query_plans.py [-v]
+"""
+import argparse
+import ast
+import glob
+import os
+import re
+import sqlite3
+import sys
+
+import migrations
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SQL_START = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT|WITH)\b', re.IGNORECASE)
+FILTERED = re.compile(r'\bWHERE\b', re.IGNORECASE)
+FULL_SCAN_OK = re.compile(r'--\s*full scan\b', re.IGNORECASE)
+# Virtual tables (FTS5, R*Tree) report the constraints they consume after the
+# index number, e.g. "VIRTUAL TABLE INDEX 0:M4"; an empty list is a full scan,
+# except R*Tree's index 1, which is a direct lookup by id. json_each() walks
+# the bound parameter list (`id IN (SELECT value FROM json_each(?))`), not a table.
+SCAN = re.compile(r'^SCAN (?!json_each\b)(\w+)\b(?!.*\bUSING\b.*\bINDEX\b)(?! VIRTUAL TABLE INDEX \d+:\S)(?! VIRTUAL TABLE INDEX 1:$)')
+SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)$')
+
+
+# Position of the SQL among the arguments of each call that runs a query.
+SQL_ARGUMENT = {'execute': 0, 'executemany': 0, 'stream': 1}
+
+
+class QueryCollector(ast.NodeVisitor):
+    """Finds SQL passed to execute() or streaming.stream() as a literal or a name bound to one.
+
+    Names are resolved in the function that uses them, in source order; a
+    name built up with += or assigned anything but a string literal is
+    dynamic and its queries are left to the builders' tests.
+    """
+
+    def __init__(self):
+        self.scopes = [{}]
+        self.queries = []
+
+    def visit_FunctionDef(self, node):
+        self.scopes.append({})
+        self.generic_visit(node)
+        self.scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        literal = node.value.value if isinstance(node.value, ast.Constant) and isinstance(node.value.value, str) else None
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.scopes[-1][target.id] = literal
+
+    def visit_AugAssign(self, node):
+        self.generic_visit(node)
+        if isinstance(node.target, ast.Name):
+            self.scopes[-1][node.target.id] = None
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not (isinstance(node.func, ast.Attribute) and node.func.attr in SQL_ARGUMENT
+                and len(node.args) > SQL_ARGUMENT[node.func.attr]):
+            return
+        arg = node.args[SQL_ARGUMENT[node.func.attr]]
+        sql = None
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            sql = arg.value
+        elif isinstance(arg, ast.Name):
+            scope = next((scope for scope in reversed(self.scopes) if arg.id in scope), {})
+            sql = scope.get(arg.id)
+        if sql is not None and SQL_START.match(sql):
+            self.queries.append((node.lineno, sql))
+
+
+def collect_queries(paths):
+    """Yield (path, lineno, sql) for the literal SQL each backend module runs."""
+    for path in paths:
+        collector = QueryCollector()
+        collector.visit(ast.parse(open(path).read(), path))
+        for lineno, sql in sorted(collector.queries):
+            yield path, lineno, sql
+
+
+def migrated_database():
+    """An in-memory database with the current schema, to plan queries against."""
+    conn = sqlite3.connect(':memory:')
+    migrations.migrate(conn)
+    return conn
+
+
+def full_scans(conn, sql, parameters=None):
+    """The plan lines of sql that scan a table when they should use an index (see module docstring)."""
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters or [None] * sql.count('?')).fetchall()
+    filtered = FILTERED.search(sql) and not FULL_SCAN_OK.search(sql)
+    # Reading back a named subquery's rows ("CO-ROUTINE e" ... "SCAN e") is not a table scan.
+    subqueries = {SUBQUERY.match(row[3]).group(1) for row in plan if SUBQUERY.match(row[3])}
+    return [row[3] for row in plan if SCAN.match(row[3]) and SCAN.match(row[3]).group(1) not in subqueries
+            and (filtered or not is_outer_loop(plan, row))], plan
+
+
+def is_outer_loop(plan, row):
+    """True if row is the first table loop under its parent node (the outer side of a join)."""
+    id_, parent = row[0], row[1]
+    loops = [r[0] for r in plan if r[1] == parent and re.match(r'(SCAN|SEARCH) ', r[3])]
+    return bool(loops) and loops[0] == id_
+
+
+def check(paths, verbose=False):
+    conn = migrated_database()
+
+    failures = skipped = checked = 0
+    for path, lineno, sql in collect_queries(paths):
+        where = f'{os.path.relpath(path, BACKEND_DIR)}:{lineno}'
+        try:
+            scans, plan = full_scans(conn, sql)
+        except sqlite3.Error as e:
+            skipped += 1
+            if verbose:
+                print(f'SKIP {where}: {e}')
+            continue
+        checked += 1
+        if scans:
+            failures += 1
+            print(f'FAIL {where}: {"; ".join(scans)}\n    {" ".join(sql.split())}')
+        elif verbose:
+            print(f'ok   {where}: {"; ".join(row[3] for row in plan)}')
+
+    print(f'{checked} queries checked, {failures} full scans on filtered queries, {skipped} skipped')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assert that backend queries use indexes.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('paths', nargs='*', help='modules to scan (default: backend/*.py)')
+    args = parser.parse_args()
+    paths = args.paths or sorted(glob.glob(os.path.join(BACKEND_DIR, '*.py')))
+    return 1 if check(paths, args.verbose) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
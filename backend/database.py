@@ -1,83 +1,234 @@
 import sqlite3
 import os
+import queue
+import random
+import threading
+import time
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '../database/hospitrack.db')
+import metrics
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+DB_PATH = os.environ.get('HOSPITRACK_DB', os.path.join(os.path.dirname(__file__), '../database/hospitrack.db'))
+
+# Connection tuning. WAL lets readers proceed while a writer holds the lock,
+# and NORMAL sync is durable across application crashes in WAL mode.
+POOL_SIZE = int(os.environ.get('HOSPITRACK_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('HOSPITRACK_DB_POOL_TIMEOUT', 10))
+BUSY_RETRIES = int(os.environ.get('HOSPITRACK_DB_BUSY_RETRIES', 5))
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),        # 16 MB page cache per connection
+    ('mmap_size', 268435456),      # 256 MB memory-mapped I/O
+    ('busy_timeout', 5000),
+    ('temp_store', 'MEMORY'),
+)
+
+_connect_hooks = []
+
+def on_connect(hook):
+    """Call hook(conn) on every connection connect() opens from now on (e.g. to ATTACH a database)."""
+    _connect_hooks.append(hook)
+
+def connect(path=None, hooks=True):
+    """Open a tuned, unpooled connection (used by scripts and the pool)."""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    if hooks:
+        for hook in _connect_hooks:
+            hook(conn)
     return conn
 
+
+class PooledConnection:
+    """Proxy handed out by the pool; close() returns the connection instead of closing it."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def _live(self):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a connection returned to the pool.')
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._live(), name)
+
+    # Statements run through the pool are timed for /metrics.
+    def execute(self, sql, parameters=()):
+        return metrics.execute(self._live(), sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return metrics.executemany(self._live(), sql, seq_of_parameters)
+
+    def __setattr__(self, name, value):
+        if name in ('_pool', '_conn'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived connections, recreated after a fork."""
+
+    def __init__(self, path=None, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path or DB_PATH
+        self.size = size
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+        self._checkout_time = 0.0
+        self._checkout_max = 0.0
+
+    def connect(self):
+        """Check a connection out, opening a new one while under the size limit."""
+        if self._pid != os.getpid():
+            # Connections must never cross a fork; start over in the child.
+            self._reset()
+
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_or_wait()
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._checkout_time += elapsed
+            self._checkout_max = max(self._checkout_max, elapsed)
+        return PooledConnection(self, conn)
+
+    def _open_or_wait(self):
+        with self._lock:
+            can_open = self._created < self.size
+            if can_open:
+                self._created += 1
+        if can_open:
+            try:
+                return connect(self.path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        wait_start = time.perf_counter()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+        finally:
+            with self._lock:
+                self._waits += 1
+                self._wait_time += time.perf_counter() - wait_start
+
+    def release(self, conn):
+        """Return a connection, discarding any uncommitted work."""
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+                self._in_use -= 1
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": self._created - self._in_use,
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": round(self._wait_time, 6),
+                "checkout_ms_avg": round(self._checkout_time / checkouts * 1000, 4) if checkouts else 0.0,
+                "checkout_ms_max": round(self._checkout_max * 1000, 4),
+            }
+
+
+pool = ConnectionPool()
+
+def is_busy_error(error):
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+def run_in_transaction(conn, work, retries=BUSY_RETRIES):
+    """Run work(conn) inside BEGIN IMMEDIATE, retrying with backoff on SQLITE_BUSY.
+
+    IMMEDIATE takes the write lock up front, so reads done by `work` cannot be
+    invalidated by another writer before its own writes land.
+    """
+    delay = 0.005
+    for attempt in range(retries + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            result = work(conn)
+            conn.commit()
+            return result
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if attempt == retries or not is_busy_error(e):
+                raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+def get_db_connection():
+    return pool.connect()
+
 def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-
-    # Users Table (Split Login)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('patient', 'hospital_staff', 'lab_tech', 'admin')),
-            full_name TEXT
-        )
-    ''')
-
-    # Hospitals Table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS hospitals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            location TEXT NOT NULL,
-            contact TEXT,
-            icu_beds_total INTEGER DEFAULT 0,
-            icu_beds_available INTEGER DEFAULT 0,
-            general_beds_total INTEGER DEFAULT 0,
-            general_beds_available INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Doctors Table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS doctors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hospital_id INTEGER,
-            name TEXT NOT NULL,
-            specialization TEXT,
-            schedule TEXT,
-            FOREIGN KEY (hospital_id) REFERENCES hospitals (id)
-        )
-    ''')
-    
-    # Appointments Table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS appointments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            doctor_id INTEGER,
-            hospital_id INTEGER,
-            appointment_date TEXT NOT NULL,
-            status TEXT DEFAULT 'Pending',
-            FOREIGN KEY (patient_id) REFERENCES users (id),
-            FOREIGN KEY (doctor_id) REFERENCES doctors (id),
-            FOREIGN KEY (hospital_id) REFERENCES hospitals (id)
-        )
-    ''')
-
-    # Reports Table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            lab_tech_id INTEGER,
-            file_name TEXT NOT NULL,
-            upload_date TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (patient_id) REFERENCES users (id),
-            FOREIGN KEY (lab_tech_id) REFERENCES users (id)
-        )
-    ''')
-
-    conn.commit()
+    """Create or upgrade the schema; the canonical layout lives in migrations.py."""
+    import migrations
+
+    conn = connect()
+    migrations.migrate(conn)
     conn.close()
     print("Database initialized successfully at:", DB_PATH)
 
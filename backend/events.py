@@ -0,0 +1,110 @@
+"""In-process publish/subscribe bus for live dashboard updates.
+
+Write handlers publish small change events to topics such as `hospital:3`
+or `patient:12` after they commit; the SSE endpoints deliver them to
+subscribed dashboards. Subscribers are plain callbacks, so a listener can
+push into a queue (one streaming request) or hand off to an event loop that
+serves many connections (see sse.py).
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+HEARTBEAT_SECONDS = 15
+
+
+def hospital_topic(hospital_id):
+    return f'hospital:{hospital_id}'
+
+
+def patient_topic(patient_id):
+    return f'patient:{patient_id}'
+
+
+def format_sse(event):
+    """Encode an event dict as one text/event-stream frame."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = defaultdict(dict)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.delivered = 0
+        # relay(topics, event) also hands each local publish to other processes (see serve.py).
+        self.relay = None
+
+    def subscribe(self, topic, callback):
+        """Register callback(event) for a topic; returns a token for unsubscribe()."""
+        token = next(self._ids)
+        with self._lock:
+            self._subscribers[topic][token] = callback
+        return topic, token
+
+    def unsubscribe(self, subscription):
+        topic, token = subscription
+        with self._lock:
+            callbacks = self._subscribers.get(topic)
+            if callbacks is not None:
+                callbacks.pop(token, None)
+                if not callbacks:
+                    del self._subscribers[topic]
+
+    def publish(self, topics, event_type, **data):
+        """Send an event to every subscriber of the given topic(s)."""
+        if isinstance(topics, str):
+            topics = (topics,)
+        event = {"id": next(self._ids), "type": event_type, "ts": time.time(), **data}
+        self.deliver(topics, event)
+        if self.relay is not None:
+            self.relay(list(topics), event)
+
+    def deliver(self, topics, event):
+        """Hand an already-built event to this process's subscribers (relayed events arrive here)."""
+        for topic in topics:
+            with self._lock:
+                callbacks = list(self._subscribers.get(topic, {}).values())
+                self.delivered += len(callbacks)
+            for callback in callbacks:
+                callback(dict(event, topic=topic))
+        with self._lock:
+            self.published += 1
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(callbacks) for callbacks in self._subscribers.values())
+
+    def stats(self):
+        return {"subscribers": self.subscriber_count(), "published": self.published, "delivered": self.delivered}
+
+
+bus = EventBus()
+
+# Set while a worker process shuts down: open streams end at their next
+# heartbeat, and EventSource reconnects to a worker that is still serving.
+closing = threading.Event()
+
+
+def stream(topics, heartbeat=HEARTBEAT_SECONDS):
+    """Generator of SSE frames for a single (WSGI) client.
+
+    Under a threaded WSGI server this holds one worker thread per open
+    stream; sse.py serves the same protocol from a single event loop.
+    """
+    inbox = queue.SimpleQueue()
+    subscriptions = [bus.subscribe(topic, inbox.put) for topic in topics]
+    try:
+        yield 'retry: 3000\n\n'
+        while not closing.is_set():
+            try:
+                yield format_sse(inbox.get(timeout=heartbeat))
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+    finally:
+        for subscription in subscriptions:
+            bus.unsubscribe(subscription)
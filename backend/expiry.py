@@ -0,0 +1,146 @@
+"""Release beds held by reservations nobody confirmed in time.
+
+A reservation still in `Reserved` status after the TTL is flipped to
+`Expired` and its bed is handed back, in batches so the write lock is never
+held for long. The app runs this on a background thread, which also purges
+abandoned report upload sessions (see blobs.py), prunes occupancy
+samples past their retention (see occupancy.py) and forgets revoked
+session tokens that have expired anyway (see auth.py); for cron:
+
+    python backend/expiry.py [--ttl 30] [--batch-size 500]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import auth
+import blobs
+import cache
+import occupancy
+from database import connect, pool, run_in_transaction
+
+RESERVATION_TTL_MINUTES = int(os.environ.get('HOSPITRACK_RESERVATION_TTL_MINUTES', 30))
+SWEEP_INTERVAL_SECONDS = float(os.environ.get('HOSPITRACK_EXPIRY_INTERVAL', 60))
+BATCH_SIZE = 500
+
+log = logging.getLogger(__name__)
+
+
+def _expire_batch(conn, cutoff, batch_size, touched):
+    rows = conn.execute('''
+        SELECT id, hospital_id, bed_type FROM bed_reservations
+        WHERE status = 'Reserved' AND timestamp < ?
+        ORDER BY timestamp LIMIT ?
+    ''', (cutoff, batch_size)).fetchall()
+    if not rows:
+        return 0
+
+    conn.executemany("UPDATE bed_reservations SET status = 'Expired' WHERE id = ?", [(r['id'],) for r in rows])
+    refunds = Counter((r['hospital_id'], r['bed_type']) for r in rows)
+    touched.update(hospital_id for hospital_id, _ in refunds)
+    conn.executemany('UPDATE beds SET available_count = available_count + ? WHERE hospital_id = ? AND bed_type = ?',
+                     [(n, hospital_id, bed_type) for (hospital_id, bed_type), n in refunds.items()])
+    return len(rows)
+
+
+def sweep(conn, ttl_minutes=RESERVATION_TTL_MINUTES, batch_size=BATCH_SIZE):
+    """Expire stale reservations; returns (beds released, seconds taken)."""
+    start = time.perf_counter()
+    # bed_reservations.timestamp is written by CURRENT_TIMESTAMP, i.e. UTC.
+    cutoff = (datetime.now(timezone.utc) - timedelta(minutes=ttl_minutes)).strftime('%Y-%m-%d %H:%M:%S')
+    released = 0
+    while True:
+        touched = set()
+        n = run_in_transaction(conn, lambda c: _expire_batch(c, cutoff, batch_size, touched))
+        for hospital_id in touched:
+            cache.invalidate_hospital(hospital_id)
+        released += n
+        if n < batch_size:
+            break
+    return released, time.perf_counter() - start
+
+
+class ExpiryScheduler(threading.Thread):
+    """Daemon thread that sweeps every `interval` seconds until stopped."""
+
+    def __init__(self, interval=SWEEP_INTERVAL_SECONDS, ttl_minutes=RESERVATION_TTL_MINUTES):
+        super().__init__(name='reservation-expiry', daemon=True)
+        self.interval = interval
+        self.ttl_minutes = ttl_minutes
+        self._stop_event = threading.Event()
+        self.runs = 0
+        self.released_total = 0
+        self.last_released = 0
+        self.last_duration = 0.0
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        conn = pool.connect()
+        try:
+            released, elapsed = sweep(conn, self.ttl_minutes)
+            blobs.purge_stale_uploads(conn)
+            auth.prune_revocations(conn)
+            conn.commit()
+            store = occupancy.connect_store()
+            try:
+                occupancy.prune(store)
+            finally:
+                store.close()
+        except Exception:
+            log.exception("Reservation expiry sweep failed")
+            return
+        finally:
+            conn.close()
+        self.runs += 1
+        self.released_total += released
+        self.last_released = released
+        self.last_duration = elapsed
+        if released:
+            log.info("Expired %d reservations in %.1f ms", released, elapsed * 1000)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            "ttl_minutes": self.ttl_minutes,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "released_total": self.released_total,
+            "last_released": self.last_released,
+            "last_duration_ms": round(self.last_duration * 1000, 3),
+        }
+
+
+scheduler = None
+
+def start_scheduler():
+    """Start the process-wide sweeper once; later calls return the running one."""
+    global scheduler
+    if scheduler is None:
+        scheduler = ExpiryScheduler()
+        scheduler.start()
+    return scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expire unconfirmed bed reservations once.')
+    parser.add_argument('--ttl', type=int, default=RESERVATION_TTL_MINUTES, help='minutes a reservation is held')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    conn = connect()
+    released, elapsed = sweep(conn, args.ttl, args.batch_size)
+    conn.close()
+    print(f"Released {released} beds in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
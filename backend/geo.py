@@ -0,0 +1,130 @@
+"""Nearest-hospital lookups backed by an R*Tree over hospital coordinates.
+
+`hospital_geo` holds one point box per hospital that has a latitude and
+longitude, kept in sync by the triggers below. `nearest()` answers k-nearest
+queries by searching a bounding box around the caller, widening it until k
+matches lie inside the search radius, and computing great-circle distances
+only for the hospitals the box returns.
+
+Run as a script to rebuild the index from `hospitals`:
+
+    python backend/geo.py
+"""
+import math
+import sys
+
+from database import connect
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# No two points on Earth are further apart than this along the surface.
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+# Start small: in a dense city a wide first box returns hundreds of hospitals
+# that all need a distance computed; widening a small box costs little.
+INITIAL_RADIUS_KM = 1.0
+
+SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS hospital_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+
+CREATE TRIGGER IF NOT EXISTS hospitals_geo_insert AFTER INSERT ON hospitals
+WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+BEGIN
+    INSERT INTO hospital_geo VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS hospitals_geo_update AFTER UPDATE OF id, latitude, longitude ON hospitals
+BEGIN
+    DELETE FROM hospital_geo WHERE id = OLD.id;
+    INSERT INTO hospital_geo SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+    WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS hospitals_geo_delete AFTER DELETE ON hospitals
+BEGIN
+    DELETE FROM hospital_geo WHERE id = OLD.id;
+END;
+'''
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) containing every point within radius_km."""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle contains a pole, so it spans every longitude.
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    dlon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    if lon - dlon < -180 or lon + dlon > 180:
+        # Crossing the antimeridian; searching all longitudes is simpler than two boxes.
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+def parse_point(args):
+    """Read `lat`/`lon` query values; None if absent, ValueError if malformed."""
+    lat, lon = args.get('lat'), args.get('lon')
+    if lat is None and lon is None:
+        return None
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('coordinates out of range')
+    return lat, lon
+
+
+def nearest(conn, lat, lon, k, condition=None, params=()):
+    """Return up to k (distance_km, hospital_id) pairs closest to (lat, lon).
+
+    `condition` is an optional SQL predicate on the R*Tree alias `g` (e.g.
+    an EXISTS over beds for `g.id`) restricting which hospitals qualify.
+    """
+    query = '''
+        SELECT g.id, (g.min_lat + g.max_lat) / 2, (g.min_lon + g.max_lon) / 2 FROM hospital_geo g
+        WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+    '''
+    if condition:
+        query += f' AND {condition}'
+    cur = conn.cursor()
+    cur.row_factory = None
+
+    radius = INITIAL_RADIUS_KM
+    while True:
+        rows = cur.execute(query, (*bounding_box(lat, lon, radius), *params)).fetchall()
+        found = sorted((haversine_km(lat, lon, h_lat, h_lon), hospital_id) for hospital_id, h_lat, h_lon in rows)
+        # Only matches inside the radius are guaranteed to beat anything outside the box.
+        if radius >= MAX_RADIUS_KM or (len(found) >= k and found[k - 1][0] <= radius):
+            return found[:k]
+        if len(found) >= k:
+            radius = found[k - 1][0]
+        else:
+            radius = min(radius * 2, MAX_RADIUS_KM)
+
+
+def rebuild(conn):
+    """Reload the R*Tree from `hospitals` in the current transaction."""
+    conn.execute('DELETE FROM hospital_geo')
+    conn.execute('''
+        INSERT INTO hospital_geo (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT id, latitude, latitude, longitude, longitude FROM hospitals  -- full scan
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+
+
+def main():
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    rebuild(conn)
+    count = conn.execute('SELECT count(*) FROM hospital_geo').fetchone()[0]
+    conn.commit()
+    conn.close()
+    print(f"Rebuilt geo index for {count} hospitals.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Lab orders and report ingestion in bulk.
+
+A lab working through a shift's panels sends hundreds of orders, or a zip of
+finished reports, at once. Each batch is validated with a handful of set
+queries (json_each over the batch's ids), written with executemany in one
+write transaction, and answered with a result per item, so one bad row does
+not sink the rest.
+"""
+import json
+import uuid
+from datetime import datetime
+
+import blobs
+from database import run_in_transaction
+
+MAX_BULK_ORDERS = 10000
+MAX_BATCH_FILES = 1000
+
+
+def new_order_id():
+    return "LAB-" + str(uuid.uuid4().hex[:8]).upper()
+
+
+def _matching(conn, query, ids):
+    """Rows of `query` for the given ids, passed as one JSON array parameter."""
+    return conn.execute(query, (json.dumps(sorted(ids)),)).fetchall()
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _unused_order_ids(conn, count):
+    """`count` fresh lab order ids, unique in the batch and in `reports`."""
+    ids = set()
+    while len(ids) < count:
+        fresh = {new_order_id() for _ in range(count - len(ids))} - ids
+        # Eight hex digits collide now and then across 10k orders.
+        fresh -= {row[0] for row in _matching(conn, 'SELECT lab_order_id FROM reports WHERE lab_order_id IN (SELECT value FROM json_each(?))', fresh)}
+        ids |= fresh
+    return list(ids)
+
+
+def create_orders(conn, orders):
+    """Insert pending lab orders; returns one result dict per input order, in order."""
+    def work(conn):
+        patient_ids = [_as_id(o.get('patient_id')) if isinstance(o, dict) else None for o in orders]
+        patients = {row[0] for row in _matching(conn, '''
+            SELECT id FROM users WHERE id IN (SELECT value FROM json_each(?)) AND role = 'patient'
+        ''', {p for p in patient_ids if p is not None})}
+
+        results, accepted = [], []
+        for i, (order, patient_id) in enumerate(zip(orders, patient_ids)):
+            if patient_id is None:
+                results.append({"index": i, "error": "Patient ID required"})
+            elif patient_id not in patients:
+                results.append({"index": i, "error": "Unknown patient"})
+            else:
+                results.append({"index": i})
+                accepted.append((results[-1], order, patient_id))
+
+        date_now = datetime.now().strftime("%Y-%m-%d")
+        rows = []
+        for (result, order, patient_id), lab_order_id in zip(accepted, _unused_order_ids(conn, len(accepted))):
+            result["lab_order_id"] = lab_order_id
+            rows.append((patient_id, order.get('hospital_id'), order.get('doctor_name'), order.get('report_type'),
+                         order.get('lab_name', 'Central Lab'), date_now, lab_order_id))
+        conn.executemany('''
+            INSERT INTO reports (patient_id, hospital_id, doctor_name, report_name, lab_name, date_uploaded, status, lab_order_id, file_name, ordered_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'Pending', ?, 'Pending Upload', CURRENT_TIMESTAMP)
+        ''', rows)
+        return results
+
+    return run_in_transaction(conn, work)
+
+
+def attach_reports(conn, items):
+    """File already-stored report blobs against their orders or appointments.
+
+    Each item is a dict with `file_name`, `sha256`, `size`, and `lab_order_id`
+    and/or `appointment_no` (plus optional `report_type`/`lab_name` for
+    reports filed against an appointment), or `file_name` and `error` for a
+    file that could not be stored. Returns one result per item.
+    """
+    def work(conn):
+        orders = {row[0]: row[1] for row in _matching(conn, '''
+            SELECT lab_order_id, patient_id FROM reports WHERE lab_order_id IN (SELECT value FROM json_each(?))
+        ''', {item['lab_order_id'] for item in items if item.get('lab_order_id')})}
+        appointments = {row[0]: row[1] for row in _matching(conn, '''
+            SELECT appointment_no, patient_id FROM appointments WHERE appointment_no IN (SELECT value FROM json_each(?))
+        ''', {item['appointment_no'] for item in items if item.get('appointment_no')})}
+
+        date_now = datetime.now().strftime("%Y-%m-%d")
+        results, updates, inserts, seen = [], [], [], set()
+        for i, item in enumerate(items):
+            result = {"index": i, "file_name": item['file_name']}
+            results.append(result)
+            lab_order_id, appointment_no = item.get('lab_order_id'), item.get('appointment_no')
+            key = ('order', lab_order_id) if lab_order_id else ('appointment', appointment_no)
+            if item.get('error'):
+                # Could not be stored (e.g. too large); reported as is.
+                result["error"] = item['error']
+            elif key in seen:
+                result["error"] = f"{lab_order_id or appointment_no} appears more than once in the batch"
+            elif lab_order_id and lab_order_id not in orders:
+                result["error"] = f"Unknown lab order {lab_order_id}"
+            elif not lab_order_id and appointment_no not in appointments:
+                result["error"] = f"Unknown appointment {appointment_no}" if appointment_no else "lab_order_id or appointment_no is required"
+            else:
+                seen.add(key)
+                path = blobs.store.relative_path(item['sha256'])
+                if lab_order_id:
+                    updates.append((item['file_name'], path, item['size'], item['sha256'], date_now, appointment_no, lab_order_id))
+                    result["lab_order_id"] = lab_order_id
+                else:
+                    inserts.append((appointments[appointment_no], item['file_name'], item.get('report_type'),
+                                    item.get('lab_name', 'Central Lab'), date_now, path, item['size'], item['sha256'], appointment_no))
+                    result["appointment_no"] = appointment_no
+                result["sha256"] = item['sha256']
+
+        conn.executemany('''
+            UPDATE reports SET file_name = ?, file_path = ?, file_size = ?, file_sha256 = ?, status = 'Completed',
+                date_uploaded = ?, appointment_no = COALESCE(?, appointment_no), completed_at = COALESCE(completed_at, CURRENT_TIMESTAMP)
+            WHERE lab_order_id = ?
+        ''', updates)
+        conn.executemany('''
+            INSERT INTO reports (patient_id, file_name, report_name, lab_name, date_uploaded, file_path, file_size, file_sha256, appointment_no, status, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'Completed', CURRENT_TIMESTAMP)
+        ''', inserts)
+        return results
+
+    return run_in_transaction(conn, work)
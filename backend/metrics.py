@@ -0,0 +1,320 @@
+"""Request and SQL instrumentation, exported at /metrics in Prometheus text format.
+
+The app times every request and counts the SQL statements it runs. Pooled
+connections (see database.PooledConnection) time each statement from
+execute() until its cursor is released, so fetching the rows is included.
+Statements are labelled by a short hash of their normalized SQL;
+`hospitrack_sql_statement_info` maps each hash back to the text.
+
+A statement slower than HOSPITRACK_SLOW_QUERY_MS is written to the
+`hospitrack.slow_query` log as one JSON line with the route and its query
+plan. The plan is only queried while the caller still holds the connection:
+in execute() when that alone was slow, or once the rows are exhausted or
+the cursor closed. A cursor left to the garbage collector is logged with
+"plan": null, since its connection may be back in the pool by then.
+HOSPITRACK_SLOW_QUERY_LOG also appends those lines to a file (e.g.
+backend.log). HOSPITRACK_PROFILE_SAMPLE=0.01 runs cProfile on that fraction
+of requests and writes each profile to HOSPITRACK_PROFILE_DIR as
+<time>-<route>-<ms>.prof, for `python -m pstats` or snakeviz.
+
+Metrics are kept per process.
+"""
+import bisect
+import cProfile
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+ENABLED = os.environ.get('HOSPITRACK_METRICS', '1') not in ('', '0')
+SLOW_QUERY_SECONDS = float(os.environ.get('HOSPITRACK_SLOW_QUERY_MS', 100)) / 1000
+SLOW_QUERY_LOG = os.environ.get('HOSPITRACK_SLOW_QUERY_LOG')
+# A slow statement's plan is captured at most this often; later entries omit it.
+PLAN_INTERVAL_SECONDS = 60
+PROFILE_SAMPLE = float(os.environ.get('HOSPITRACK_PROFILE_SAMPLE', 0))
+PROFILE_DIR = os.environ.get('HOSPITRACK_PROFILE_DIR', os.path.join(os.path.dirname(__file__), '../database/profiles'))
+# Distinct statements beyond this share the label "other" (dynamic SQL such as IN lists).
+MAX_STATEMENTS = 500
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+slow_log = logging.getLogger('hospitrack.slow_query')
+if SLOW_QUERY_LOG:
+    slow_log.addHandler(logging.FileHandler(SLOW_QUERY_LOG))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram with one series per label combination."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (made cumulative on export), then the sum.
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((values, list(series)) for values, series in self._series.items())
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labels, values)} {value}' for values, value in snapshot)
+        return lines
+
+
+REQUEST_LATENCY = Histogram('hospitrack_http_request_duration_seconds', 'Time to produce a response, by route.',
+                            ('method', 'route', 'status'), LATENCY_BUCKETS)
+REQUEST_STATEMENTS = Histogram('hospitrack_http_request_sql_statements', 'SQL statements executed per request, by route.',
+                               ('route',), COUNT_BUCKETS)
+SQL_LATENCY = Histogram('hospitrack_sql_statement_duration_seconds', 'Statement time from execute() until its cursor is released.',
+                        ('statement',), SQL_BUCKETS)
+SLOW_QUERIES = Counter('hospitrack_sql_slow_queries_total', 'Statements slower than the slow query threshold.', ('statement',))
+PROFILES = Counter('hospitrack_profiles_written_total', 'Sampled request profiles written to disk.', ('route',))
+
+# sql text -> (statement label, normalized sql)
+_statements = {}
+_statements_lock = threading.Lock()
+_plans_captured = {}
+_plans_lock = threading.Lock()
+_local = threading.local()
+_EXPLAINABLE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', re.IGNORECASE)
+
+
+def _statement(sql):
+    known = _statements.get(sql)
+    if known is not None:
+        return known
+    normalized = ' '.join(sql.split())
+    with _statements_lock:
+        if len(_statements) >= MAX_STATEMENTS:
+            return 'other', normalized
+        known = _statements[sql] = hashlib.sha1(normalized.encode()).hexdigest()[:10], normalized
+    return known
+
+
+def begin_request(route):
+    _local.route = route
+    _local.statements = 0
+
+
+def end_request(method, route, status, elapsed):
+    REQUEST_LATENCY.observe(elapsed, method, route, str(status))
+    REQUEST_STATEMENTS.observe(getattr(_local, 'statements', 0), route)
+    _local.route = None
+
+
+class TimedCursor:
+    """Cursor proxy that adds fetch time to its statement's and records it once released."""
+
+    __slots__ = ('_cursor', '_conn', '_sql', '_parameters', '_elapsed', '_route', '_plan')
+
+    def __init__(self, cursor, conn, sql, parameters, elapsed, route, plan=None):
+        self._cursor = cursor
+        self._conn = conn
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = elapsed
+        self._route = route
+        self._plan = plan
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            row = self._cursor.fetchone()
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        try:
+            rows = self._cursor.fetchmany(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return self._cursor.fetchall()
+        finally:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __del__(self):
+        # Possibly on another thread, after the connection went back to the pool.
+        self._finish(owned=False)
+
+    def _finish(self, owned=True):
+        sql, self._sql = self._sql, None
+        if sql is not None:
+            _record(self._conn if owned else None, sql, self._parameters, self._elapsed, self._route, self._plan)
+
+
+def execute(conn, sql, parameters=()):
+    """conn.execute(), timed when metrics are enabled."""
+    if not ENABLED:
+        return conn.execute(sql, parameters)
+    return _timed(conn, conn.execute, sql, parameters, parameters)
+
+
+def executemany(conn, sql, seq_of_parameters):
+    if not ENABLED:
+        return conn.executemany(sql, seq_of_parameters)
+    # The parameter sets may be a generator, so no plan can be captured for these.
+    return _timed(conn, conn.executemany, sql, seq_of_parameters, None)
+
+
+def _timed(conn, method, sql, parameters, plan_parameters):
+    route = getattr(_local, 'route', None)
+    if route is not None:
+        _local.statements += 1
+    start = time.perf_counter()
+    cursor = method(sql, parameters)
+    elapsed = time.perf_counter() - start
+    # Sorts and aggregates run inside execute(), so a statement already slow here has its plan taken now.
+    plan = _plan(conn, _statement(sql)[0], sql, plan_parameters) if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS else None
+    return TimedCursor(cursor, conn, sql, plan_parameters, elapsed, route, plan)
+
+
+def _record(conn, sql, parameters, elapsed, route, plan=None):
+    """Observe a finished statement; conn is None when the caller may no longer hold it."""
+    statement, normalized = _statement(sql)
+    SQL_LATENCY.observe(elapsed, statement)
+    if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc(statement)
+        if plan is None and conn is not None:
+            plan = _plan(conn, statement, sql, parameters)
+        slow_log.warning(json.dumps({
+            "at": time.strftime('%Y-%m-%dT%H:%M:%S'), "ms": round(elapsed * 1000, 2), "route": route,
+            "statement": statement, "sql": normalized, "plan": plan,
+        }))
+
+
+def _plan(conn, statement, sql, parameters):
+    """EXPLAIN QUERY PLAN lines for a slow statement, or None if captured recently or not explainable."""
+    if parameters is None or not _EXPLAINABLE.match(sql):
+        return None
+    now = time.monotonic()
+    with _plans_lock:
+        if now - _plans_captured.get(statement, float('-inf')) < PLAN_INTERVAL_SECONDS:
+            return None
+        _plans_captured[statement] = now
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # the app may have set dict rows on the connection
+        return [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+    except (sqlite3.Error, ValueError):
+        return None
+
+
+def start_profile():
+    """A running cProfile.Profile for a sampled request, else None."""
+    if PROFILE_SAMPLE <= 0 or random.random() >= PROFILE_SAMPLE:
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None  # another profiler is already active in this thread
+    return profile
+
+
+def dump_profile(profile, route, elapsed):
+    profile.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof")
+    profile.dump_stats(path)
+    PROFILES.inc(route)
+    return path
+
+
+def render(snapshots=()):
+    """Every metric in Prometheus text format; `snapshots` adds (name, type, help, value) from elsewhere."""
+    lines = []
+    for name, kind, help, value in snapshots:
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}']
+    for metric in (REQUEST_LATENCY, REQUEST_STATEMENTS, SQL_LATENCY, SLOW_QUERIES, PROFILES):
+        lines += metric.expose()
+    lines += ['# HELP hospitrack_sql_statement_info Normalized SQL of each statement label.',
+              '# TYPE hospitrack_sql_statement_info gauge']
+    with _statements_lock:
+        known = sorted(set(_statements.values()))
+    lines += [f'hospitrack_sql_statement_info{{statement="{label}",sql="{_escape(sql[:500])}"}} 1' for label, sql in known]
+    return '\n'.join(lines) + '\n'
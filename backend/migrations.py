@@ -0,0 +1,302 @@
+"""Numbered schema migrations for hospitrack.db.
+
+The applied version is stored in `PRAGMA user_version`. Each migration runs
+in its own transaction, and every statement is idempotent so databases
+created by older versions of init_db.py/database.py (which had diverging
+schemas) converge on the same canonical layout.
+
+    python backend/migrations.py            # apply pending migrations
+    python backend/migrations.py --status   # show current/latest version
+"""
+import argparse
+import os
+import sqlite3
+
+import analytics
+import auth
+import bed_summary
+import blobs
+import geo
+import schedule
+import search
+import timeline
+import versions
+from database import connect
+
+# Canonical columns per table. Migration 1 creates missing tables with this
+# layout; migration 2 adds whatever an older database is missing.
+SCHEMA = {
+    'users': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('username', 'TEXT UNIQUE NOT NULL'),
+        ('password', 'TEXT NOT NULL'),
+        ('role', 'TEXT NOT NULL'),
+        ('full_name', 'TEXT'),
+        ('hospital_id', 'INTEGER'),
+        ('hospitrack_id', 'TEXT'),
+    ],
+    'hospitals': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('name', 'TEXT NOT NULL'),
+        ('location', 'TEXT'),
+        ('contact', 'TEXT'),
+        ('latitude', 'REAL'),
+        ('longitude', 'REAL'),
+    ],
+    'beds': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('hospital_id', 'INTEGER REFERENCES hospitals (id)'),
+        ('bed_type', 'TEXT NOT NULL'),
+        ('total_count', 'INTEGER DEFAULT 0'),
+        ('available_count', 'INTEGER DEFAULT 0'),
+        ('price', 'REAL'),
+    ],
+    'doctors': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('hospital_id', 'INTEGER REFERENCES hospitals (id)'),
+        ('name', 'TEXT NOT NULL'),
+        ('specialization', 'TEXT'),
+        ('is_visiting', 'BOOLEAN DEFAULT 0'),
+        ('availability', 'TEXT'),
+        ('image', 'TEXT'),
+        ('days', 'TEXT'),
+        ('hours', 'TEXT'),
+        ('is_available', 'INTEGER DEFAULT 1'),
+        ('current_status', "TEXT DEFAULT 'Available'"),
+        ('slot_minutes', 'INTEGER DEFAULT 30'),
+    ],
+    'appointments': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('patient_id', 'INTEGER REFERENCES users (id)'),
+        ('hospital_id', 'INTEGER REFERENCES hospitals (id)'),
+        ('doctor_id', 'INTEGER REFERENCES doctors (id)'),
+        ('doctor_name', 'TEXT'),
+        ('date', 'TEXT'),
+        ('appointment_date', 'TEXT'),
+        ('status', "TEXT DEFAULT 'Pending'"),
+        ('appointment_no', 'TEXT'),
+        ('created_at', 'TEXT'),
+        ('slot_start', 'TEXT'),
+    ],
+    'reports': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('patient_id', 'INTEGER REFERENCES users (id)'),
+        ('hospital_id', 'INTEGER'),
+        ('doctor_name', 'TEXT'),
+        ('report_name', 'TEXT'),
+        ('lab_name', 'TEXT'),
+        ('date_uploaded', 'TEXT'),
+        ('file_name', 'TEXT'),
+        ('file_path', 'TEXT'),
+        ('status', "TEXT DEFAULT 'Pending'"),
+        ('lab_order_id', 'TEXT'),
+        ('appointment_no', 'TEXT'),
+        ('file_size', 'INTEGER'),
+        ('file_sha256', 'TEXT'),
+        ('ordered_at', 'TEXT'),
+        ('completed_at', 'TEXT'),
+    ],
+    'bed_reservations': [
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('patient_id', 'INTEGER REFERENCES users (id)'),
+        ('hospital_id', 'INTEGER REFERENCES hospitals (id)'),
+        ('bed_type', 'TEXT'),
+        ('timestamp', 'DATETIME DEFAULT CURRENT_TIMESTAMP'),
+        ('status', "TEXT DEFAULT 'Reserved'"),
+        ('address', 'TEXT'),
+        ('urgency', 'TEXT'),
+    ],
+}
+
+
+def _create_tables(conn):
+    for table, columns in SCHEMA.items():
+        body = ',\n    '.join(f'{name} {decl}' for name, decl in columns)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (\n    {body}\n)')
+
+
+def _add_missing_columns(conn):
+    for table, columns in SCHEMA.items():
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for name, decl in columns:
+            if name not in existing:
+                # ALTER TABLE cannot add UNIQUE/PRIMARY KEY columns; none of the
+                # columns older databases lack are declared that way.
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+
+_INDEXES = '''
+CREATE INDEX IF NOT EXISTS idx_beds_hospital_type ON beds (hospital_id, bed_type);
+CREATE INDEX IF NOT EXISTS idx_doctors_hospital ON doctors (hospital_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_date ON appointments (patient_id, date);
+CREATE INDEX IF NOT EXISTS idx_appointments_hospital_date ON appointments (hospital_id, date);
+CREATE INDEX IF NOT EXISTS idx_appointments_no ON appointments (appointment_no);
+CREATE INDEX IF NOT EXISTS idx_reservations_hospital_time ON bed_reservations (hospital_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_reservations_patient_time ON bed_reservations (patient_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_reports_patient_date ON reports (patient_id, date_uploaded);
+CREATE INDEX IF NOT EXISTS idx_reports_lab_order ON reports (lab_order_id);
+CREATE INDEX IF NOT EXISTS idx_reports_appointment_no ON reports (appointment_no);
+CREATE INDEX IF NOT EXISTS idx_users_hospitrack_id ON users (hospitrack_id);
+'''
+
+# Each index is also ordered by rowid (reports.id), so a filtered queue page
+# walks one index backwards from the cursor and stops after `limit` rows.
+_LAB_QUEUE_INDEXES = '''
+CREATE INDEX IF NOT EXISTS idx_reports_status ON reports (status);
+CREATE INDEX IF NOT EXISTS idx_reports_lab_name ON reports (lab_name);
+CREATE INDEX IF NOT EXISTS idx_reports_hospital ON reports (hospital_id);
+CREATE INDEX IF NOT EXISTS idx_reports_date ON reports (date_uploaded);
+'''
+
+# Early clients stored appointment dates as MM/DD/YYYY, which sorts wrongly
+# against ISO dates in the patient timeline.
+_ISO_APPOINTMENT_DATES = '''
+UPDATE appointments SET date = substr(date, 7, 4) || '-' || substr(date, 1, 2) || '-' || substr(date, 4, 2)
+WHERE date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]';  -- full scan
+UPDATE appointments SET appointment_date = substr(appointment_date, 7, 4) || '-' || substr(appointment_date, 1, 2) || '-' || substr(appointment_date, 4, 2)
+WHERE appointment_date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]';  -- full scan
+'''
+
+_BED_SUMMARY = '''
+CREATE TABLE IF NOT EXISTS bed_summary (
+    hospital_id INTEGER PRIMARY KEY,
+    total_count INTEGER NOT NULL DEFAULT 0,
+    available_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bed_type_summary (
+    hospital_id INTEGER NOT NULL,
+    bed_type TEXT NOT NULL,
+    total_count INTEGER NOT NULL DEFAULT 0,
+    available_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hospital_id, bed_type)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_bed_type_summary_type ON bed_type_summary (bed_type, available_count);
+''' + bed_summary.TRIGGERS
+
+
+def _bed_summaries(conn):
+    run_script(conn, _BED_SUMMARY)
+    bed_summary.rebuild(conn)
+
+
+def _search_index(conn):
+    run_script(conn, search.SCHEMA + search.TRIGGERS)
+    search.rebuild(conn)
+
+
+def _geo_index(conn):
+    _add_missing_columns(conn)
+    run_script(conn, geo.SCHEMA)
+    geo.rebuild(conn)
+
+
+def _report_blobs(conn):
+    _add_missing_columns(conn)
+    run_script(conn, blobs.SCHEMA)
+
+
+def _move_report_files(conn):
+    blobs.import_legacy_files(conn, os.path.join(os.path.dirname(__file__), '../frontend'))
+
+
+def _analytics_rollups(conn):
+    _add_missing_columns(conn)
+    run_script(conn, analytics.SCHEMA + analytics.TRIGGERS)
+    analytics.rebuild(conn)
+
+
+def _doctor_schedules(conn):
+    _add_missing_columns(conn)
+    run_script(conn, schedule.SCHEMA)
+    schedule.rebuild(conn)
+
+
+def _upload_session_digests(conn):
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(upload_sessions)')}
+    if 'sha256' not in existing:
+        conn.execute('ALTER TABLE upload_sessions ADD COLUMN sha256 TEXT')
+
+
+MIGRATIONS = [
+    (1, 'create base tables', _create_tables),
+    (2, 'add columns used by the API to older databases', _add_missing_columns),
+    (3, 'secondary indexes for hot filters', _INDEXES),
+    (4, 'bed availability summaries', _bed_summaries),
+    (5, 'index for expiring stale reservations',
+     'CREATE INDEX IF NOT EXISTS idx_reservations_status_time ON bed_reservations (status, timestamp);'),
+    (6, 'data version counters for ETags', versions.SCHEMA),
+    (7, 'full-text hospital search index', _search_index),
+    (8, 'hospital coordinates and R*Tree index', _geo_index),
+    (9, 'report file hashes and resumable upload sessions', _report_blobs),
+    (10, 'move report files out of the static folder', _move_report_files),
+    (11, 'indexes for the lab order queue filters', _LAB_QUEUE_INDEXES),
+    (12, 'hourly and daily analytics rollups', _analytics_rollups),
+    (13, 'ISO appointment dates for the patient timeline', _ISO_APPOINTMENT_DATES),
+    (14, 'structured doctor schedules and unique appointment slots', _doctor_schedules),
+    (15, 'revoked session tokens', auth.SCHEMA),
+    (16, 'normalized event time indexes for the patient timeline', timeline.SCHEMA),
+    (17, 'announced SHA-256 for resumable uploads', _upload_session_digests),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def run_script(conn, script):
+    """Execute a multi-statement script without executescript()'s implicit COMMIT."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        raise ValueError(f'Incomplete SQL statement: {statement.strip()[:60]}')
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations in order and return the versions applied."""
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-check under the write lock in case another process migrated first.
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                run_script(conn, step)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply HospiTech schema migrations.')
+    parser.add_argument('--status', action='store_true', help='print the schema version and exit')
+    parser.add_argument('--target', type=int, help='stop after this version')
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.status:
+        print(f"Schema version {current_version(conn)} (latest {LATEST_VERSION})")
+    else:
+        for version, description in migrate(conn, args.target):
+            print(f"Applied migration {version}: {description}")
+        print(f"Schema is at version {current_version(conn)}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
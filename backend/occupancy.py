@@ -0,0 +1,327 @@
+"""Bed occupancy history in its own database, with a short-horizon forecast.
+
+Every change to a `beds` row's available/total count is sampled into
+`occupancy.db` (next to hospitrack.db), so years of history never touch the
+main tables or their backups. Each connection attaches the store and adds
+TEMP triggers on `beds` (see database.on_connect), which catches every
+writer: the bed editor, reservations, dispatch and the expiry sweeper.
+
+Each (hospital, bed type) series is kept round-robin style at three
+resolutions: a sample updates its minute, hour and day row (min/max/last
+available and the total), so a read touches at most one row per point.
+Retention is plain deletion: minute rows go after MINUTE_RETENTION_DAYS,
+hour rows after HOUR_RETENTION_DAYS, and day rows are kept. The expiry
+sweeper prunes; for cron:
+
+    python backend/occupancy.py [--now 2026-01-01T00:00:00]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import database
+from database import DB_PATH, run_in_transaction
+from migrations import run_script
+
+OCCUPANCY_DB = os.environ.get('HOSPITRACK_OCCUPANCY_DB', os.path.join(os.path.dirname(DB_PATH), 'occupancy.db'))
+MINUTE_RETENTION_DAYS = int(os.environ.get('HOSPITRACK_OCCUPANCY_MINUTE_DAYS', 14))
+HOUR_RETENTION_DAYS = int(os.environ.get('HOSPITRACK_OCCUPANCY_HOUR_DAYS', 730))
+PRUNE_CHUNK_SECONDS = 6 * 3600
+
+# Tier name -> seconds per slot. A row's `slot` is its unix time // step.
+TIERS = {'minute': 60, 'hour': 3600, 'day': 86400}
+RETENTION_DAYS = {'minute': MINUTE_RETENTION_DAYS, 'hour': HOUR_RETENTION_DAYS, 'day': None}
+MAX_POINTS = 2000
+DEFAULT_WINDOW_HOURS = 7 * 24
+DEFAULT_HORIZON = 24
+MAX_HORIZON = 500
+
+_TIER_TABLE = '''
+CREATE TABLE IF NOT EXISTS occupancy.occupancy_{tier} (
+    series_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    available_min INTEGER NOT NULL,
+    available_max INTEGER NOT NULL,
+    available_last INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (series_id, slot)
+) WITHOUT ROWID;
+'''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS occupancy.occupancy_series (
+    id INTEGER PRIMARY KEY,
+    hospital_id INTEGER NOT NULL,
+    bed_type TEXT NOT NULL,
+    UNIQUE (hospital_id, bed_type)
+);
+''' + ''.join(_TIER_TABLE.format(tier=tier) for tier in TIERS)
+
+_UPSERT = '''
+    INSERT INTO occupancy_{tier} (series_id, slot, available_min, available_max, available_last, total)
+    SELECT {{series}}, CAST(strftime('%s', 'now') AS INTEGER) / {step}, {{available}}, {{available}}, {{available}}, {{total}}
+    {{source}}
+    ON CONFLICT (series_id, slot) DO {{action}};'''
+
+_MERGE = '''UPDATE SET
+        available_min = MIN(available_min, excluded.available_min),
+        available_max = MAX(available_max, excluded.available_max),
+        available_last = excluded.available_last,
+        total = excluded.total'''
+
+_UPSERTS = ''.join(_UPSERT.format(tier=tier, step=step) for tier, step in TIERS.items())
+
+# TEMP triggers may write to attached databases; tables are named without
+# a schema and resolve to the attached store.
+_SAMPLE = '''
+    INSERT INTO occupancy_series (hospital_id, bed_type) SELECT {r}.hospital_id, {r}.bed_type
+    WHERE {r}.hospital_id IS NOT NULL
+    ON CONFLICT (hospital_id, bed_type) DO NOTHING;''' + _UPSERTS.format(
+    series='id', available='{available}', total='{total}', action=_MERGE,
+    source='FROM occupancy_series WHERE hospital_id = {r}.hospital_id AND bed_type = {r}.bed_type')
+
+TRIGGERS = f'''
+CREATE TEMP TRIGGER IF NOT EXISTS beds_occupancy_insert AFTER INSERT ON main.beds
+BEGIN {_SAMPLE.format(r='NEW', available='COALESCE(NEW.available_count, 0)', total='COALESCE(NEW.total_count, 0)')} END;
+
+CREATE TEMP TRIGGER IF NOT EXISTS beds_occupancy_update AFTER UPDATE OF available_count, total_count ON main.beds
+WHEN OLD.available_count IS NOT NEW.available_count OR OLD.total_count IS NOT NEW.total_count
+BEGIN {_SAMPLE.format(r='NEW', available='COALESCE(NEW.available_count, 0)', total='COALESCE(NEW.total_count, 0)')} END;
+
+CREATE TEMP TRIGGER IF NOT EXISTS beds_occupancy_delete AFTER DELETE ON main.beds
+BEGIN {_SAMPLE.format(r='OLD', available='0', total='0')} END;
+'''
+
+# The first connection to an empty store records every bed type's current
+# level, so hospital totals are complete before each type has changed.
+_SEED = _UPSERTS.format(
+    series='s.id', available='COALESCE(b.available_count, 0)', total='COALESCE(b.total_count, 0)', action='NOTHING',
+    source='FROM beds b JOIN occupancy_series s ON s.hospital_id = b.hospital_id AND s.bed_type = b.bed_type WHERE true')
+
+
+def _attach_store(conn):
+    conn.execute('ATTACH DATABASE ? AS occupancy', (OCCUPANCY_DB,))
+    # journal_mode set at connect time covers only the databases open then.
+    conn.execute('PRAGMA occupancy.journal_mode = WAL')
+    conn.execute('PRAGMA occupancy.synchronous = NORMAL')
+    run_script(conn, SCHEMA)
+
+
+def attach(conn):
+    """Attach the occupancy store to `conn` and start sampling `beds` changes."""
+    _attach_store(conn)
+    if not conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'beds'  -- full scan").fetchone():
+        # Fresh database: connections opened after the migrations get the triggers.
+        return
+    run_script(conn, TRIGGERS)
+    if conn.execute('SELECT 1 FROM occupancy_series LIMIT 1').fetchone() is None:
+        with conn:
+            conn.execute('''
+                INSERT INTO occupancy_series (hospital_id, bed_type)
+                SELECT DISTINCT hospital_id, bed_type FROM beds WHERE hospital_id IS NOT NULL  -- full scan
+                ON CONFLICT (hospital_id, bed_type) DO NOTHING
+            ''')
+            for statement in _SEED.split(';')[:-1]:
+                conn.execute(statement)
+
+
+database.on_connect(attach)
+
+
+def connect_store():
+    """A connection to the occupancy store alone; pruning never needs the main database."""
+    conn = database.connect(':memory:', hooks=False)
+    _attach_store(conn)
+    return conn
+
+
+def _retained_from(tier, now):
+    """Unix time before which `tier` may already be pruned, or None if it is kept forever."""
+    days = RETENTION_DAYS[tier]
+    return None if days is None else now - days * 86400
+
+
+def prune(conn, now=None):
+    """Delete minute and hour rows past their retention; returns the number removed.
+
+    Works forward from the oldest row, PRUNE_CHUNK_SECONDS of history per
+    transaction, so writers are never held up for long.
+    """
+    now = time.time() if now is None else now
+    removed = 0
+    for tier, step in TIERS.items():
+        retained_from = _retained_from(tier, now)
+        if retained_from is None:
+            continue
+        cutoff = int(retained_from) // step
+        while True:
+            # The oldest row, found with one primary-key seek per series; gaps are skipped.
+            oldest = conn.execute(f'''
+                SELECT MIN((SELECT slot FROM occupancy_{tier} WHERE series_id = s.id ORDER BY slot LIMIT 1))
+                FROM occupancy_series s
+            ''').fetchone()[0]
+            if oldest is None or oldest >= cutoff:
+                break
+            end = min(oldest + max(PRUNE_CHUNK_SECONDS // step, 1), cutoff)
+            removed += run_in_transaction(conn, lambda c: c.execute(f'''
+                DELETE FROM occupancy_{tier} WHERE series_id IN (SELECT id FROM occupancy_series) AND slot < ?
+            ''', (end,)).rowcount)
+    return removed
+
+
+def _series_ids(conn, hospital_id, bed_type):
+    if bed_type:
+        rows = conn.execute('SELECT id FROM occupancy_series WHERE hospital_id = ? AND bed_type = ?', (hospital_id, bed_type))
+    else:
+        rows = conn.execute('SELECT id FROM occupancy_series WHERE hospital_id = ?', (hospital_id,))
+    return [row[0] for row in rows]
+
+
+def _samples(conn, series_ids, start, end, resolution, now):
+    """(series index, sample time, available, total) arrays over [start, end), plus each series' level before `start`.
+
+    Rows come from the `resolution` tier, and from coarser tiers for whatever
+    older part of the window it no longer holds. A row's sample time is the
+    last second of its slot, when `available_last` held.
+    """
+    tiers = list(TIERS)[list(TIERS).index(resolution):]
+    chunks = []
+    for index, series_id in enumerate(series_ids):
+        upper, before = end, None
+        for tier in tiers:
+            step = TIERS[tier]
+            # A coarser tier only fills in whole slots before the finer tier's data begins.
+            last_slot = -(-upper // step) if tier == resolution else upper // step
+            rows = np.array(conn.execute(f'''
+                SELECT slot, available_last, total FROM occupancy_{tier}
+                WHERE series_id = ? AND slot >= ? AND slot < ?
+            ''', (series_id, start // step, last_slot)).fetchall(), dtype=np.int64).reshape(-1, 3)
+            if len(rows):
+                chunks.append(np.column_stack((np.full(len(rows), index), (rows[:, 0] + 1) * step - 1, rows[:, 1], rows[:, 2])))
+            if before is None:
+                before = conn.execute(f'''
+                    SELECT available_last, total FROM occupancy_{tier}
+                    WHERE series_id = ? AND slot < ? ORDER BY slot DESC LIMIT 1
+                ''', (series_id, start // step)).fetchone()
+            retained_from = _retained_from(tier, now)
+            if retained_from is None or retained_from <= start:
+                break
+            upper = min(upper, int(retained_from))
+        if before:
+            chunks.append(np.array([[index, start - 1, before[0], before[1]]], dtype=np.int64))
+    samples = np.concatenate(chunks) if chunks else np.zeros((0, 4), dtype=np.int64)
+    return samples.T
+
+def resample(series, times, available, totals, count, start, step):
+    """Forward-fill each series' last level onto `count` cells of `step` seconds; returns (occupied, total) per cell.
+
+    Cells before a series' first sample count as NaN for the hospital.
+    """
+    cell_ends = start + step * np.arange(1, count + 1) - 1
+    if not len(series):
+        return np.full(count, np.nan), np.full(count, np.nan)
+    occupied = np.zeros(count)
+    total = np.zeros(count)
+    order = np.lexsort((times, series))
+    series, times, available, totals = series[order], times[order], available[order], totals[order]
+    bounds = np.searchsorted(series, np.arange(series.max() + 2))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if lo == hi:
+            continue
+        last = np.searchsorted(times[lo:hi], cell_ends, side='right') - 1
+        known = last >= 0
+        picked = lo + np.maximum(last, 0)
+        occupied += np.where(known, totals[picked] - available[picked], np.nan)
+        total += np.where(known, totals[picked], np.nan)
+    return occupied, total
+
+
+def forecast(times, occupied, capacity, horizon, step):
+    """Least-squares trend plus hour-of-day (day-of-week for daily steps) seasonality.
+
+    Fitted in one vectorized solve over the known history; returns
+    (times, predicted, lower, upper) for the next `horizon` cells, clipped
+    to [0, capacity], with an 80% band from the residual spread.
+    """
+    known = ~np.isnan(occupied)
+    t, y = times[known], occupied[known]
+    future = times[-1] + step * np.arange(1, horizon + 1)
+    if len(y) < 2:
+        level = np.full(horizon, y[-1] if len(y) else np.nan)
+        return future, level, level, level
+
+    period, seasons = (86400 * 7, 7) if step >= 86400 else (86400, 24)
+
+    def design(ts):
+        season = (ts % period) * seasons // period
+        x = np.zeros((len(ts), seasons + 1))
+        x[:, 0] = (ts - t[0]) / 86400
+        x[np.arange(len(ts)), 1 + season] = 1
+        return x
+
+    coef, *_ = np.linalg.lstsq(design(t), y, rcond=None)
+    spread = 1.2816 * np.std(y - design(t) @ coef)
+    predicted = np.clip(design(future) @ coef, 0, capacity)
+    return future, predicted, np.clip(predicted - spread, 0, capacity), np.clip(predicted + spread, 0, capacity)
+
+
+def _iso(seconds):
+    return [f'{stamp}Z' for stamp in np.datetime_as_string(np.asarray(seconds, dtype='datetime64[s]'))]
+
+
+def _rounded(values):
+    values = np.round(values, 2)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def hospital_series(conn, hospital_id, hours=DEFAULT_WINDOW_HOURS, resolution=None, bed_type=None,
+                    horizon=DEFAULT_HORIZON, now=None):
+    """Occupied/total beds over the last `hours` hours and a forecast for the next `horizon` cells."""
+    now = int(time.time() if now is None else now)
+    if resolution is None:
+        # The finest tier that fits the window in MAX_POINTS and still holds its start.
+        resolution = next((tier for tier, step in TIERS.items() if hours * 3600 // step <= MAX_POINTS
+                           and (RETENTION_DAYS[tier] is None or hours <= RETENTION_DAYS[tier] * 24)), 'day')
+    step = TIERS[resolution]
+    end = (now // step + 1) * step
+    count = min(max(hours * 3600 // step, 1), MAX_POINTS)
+    start = end - count * step
+
+    result = {"hospital_id": hospital_id, "bed_type": bed_type, "resolution": resolution, "step_seconds": step}
+    series_ids = _series_ids(conn, hospital_id, bed_type)
+    if not series_ids:
+        return {**result, "time": [], "occupied": [], "total": [], "forecast": None}
+
+    series, times, available, totals = _samples(conn, series_ids, start, end, resolution, now)
+    cells = start + step * np.arange(count)
+    occupied, total = resample(series, times, available, totals, count, start, step)
+    capacity = np.nanmax(total) if np.any(~np.isnan(total)) else 0
+    future, predicted, lower, upper = forecast(cells, occupied, capacity, horizon, step)
+    return {
+        **result,
+        "time": _iso(cells),
+        "occupied": _rounded(occupied),
+        "total": _rounded(total),
+        "forecast": {"time": _iso(future), "occupied": _rounded(predicted),
+                     "lower": _rounded(lower), "upper": _rounded(upper)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete occupancy samples past their retention.')
+    parser.add_argument('--now', help='pretend it is this UTC time (ISO 8601), for testing retention')
+    args = parser.parse_args()
+
+    now = datetime.fromisoformat(args.now).replace(tzinfo=timezone.utc).timestamp() if args.now else None
+    conn = connect_store()
+    start = time.perf_counter()
+    removed = prune(conn, now)
+    conn.close()
+    print(f"Pruned {removed} occupancy rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
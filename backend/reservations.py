@@ -0,0 +1,62 @@
+"""Bed reservation and refund as atomic, lock-holding transactions."""
+from database import run_in_transaction
+
+# Statuses whose bed has been handed back to the hospital's available pool.
+RELEASED_STATUSES = ('Cancelled', 'Rejected', 'Expired')
+
+
+class BedUnavailable(Exception):
+    """No bed of the requested type is free at the hospital."""
+
+
+class ReservationClosed(Exception):
+    """The reservation was already released, so its bed is no longer held for it."""
+
+
+def reserve(conn, patient_id, hospital_id, bed_type, address='Not Provided', urgency='Normal'):
+    """Take one bed and log the reservation; returns the reservation id.
+
+    The decrement is a single conditional UPDATE, so two patients racing for
+    the last bed cannot both succeed and the count never goes negative.
+    """
+    def work(conn):
+        taken = conn.execute('''
+            UPDATE beds SET available_count = available_count - 1
+            WHERE id = (SELECT id FROM beds WHERE hospital_id = ? AND bed_type = ? AND available_count > 0 LIMIT 1)
+              AND available_count > 0
+        ''', (hospital_id, bed_type)).rowcount
+        if not taken:
+            raise BedUnavailable(bed_type)
+        cur = conn.execute('INSERT INTO bed_reservations (patient_id, hospital_id, bed_type, address, urgency) VALUES (?, ?, ?, ?, ?)',
+                           (patient_id, hospital_id, bed_type, address, urgency))
+        return cur.lastrowid
+
+    return run_in_transaction(conn, work)
+
+
+def update_status(conn, res_id, status):
+    """Change a reservation's status, refunding the bed on its release.
+
+    A released reservation is final: moving it to any other status raises
+    ReservationClosed, since its bed may already have gone to someone else.
+    Returns the reservation row as it was before the change, or None if it
+    does not exist.
+    """
+    def work(conn):
+        res = conn.execute('SELECT patient_id, hospital_id, bed_type, status FROM bed_reservations WHERE id = ?', (res_id,)).fetchone()
+        if not res:
+            return None
+
+        placeholders = ', '.join('?' * len(RELEASED_STATUSES))
+        changed = conn.execute(
+            f'UPDATE bed_reservations SET status = ? WHERE id = ? AND status NOT IN ({placeholders})',
+            (status, res_id, *RELEASED_STATUSES)).rowcount
+        if not changed:
+            if status != res['status']:
+                raise ReservationClosed(res['status'])
+        elif status in RELEASED_STATUSES:
+            conn.execute('UPDATE beds SET available_count = available_count + 1 WHERE hospital_id = ? AND bed_type = ?',
+                         (res['hospital_id'], res['bed_type']))
+        return res
+
+    return run_in_transaction(conn, work)
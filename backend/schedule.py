@@ -0,0 +1,266 @@
+"""Doctor schedules as structured weekly hours, bookable slots and atomic slot claims.
+
+A doctor's free-text `days`/`hours` (or the older combined `availability`,
+e.g. 'Mon-Fri 9AM-5PM') are parsed into `doctor_schedules` rows, one per
+weekday and shift, whenever the doctor is saved. The weekly rows are the
+precomputed template: a day's slots are its shifts cut into the doctor's
+`slot_minutes`, less the slots already held by appointments.
+
+Booking is a claim on (doctor_id, slot_start), which a partial unique index
+on appointments enforces, so two patients racing for the same slot cannot
+both get it. Slot times are the hospital's local wall-clock time.
+
+Run as a script to re-parse every doctor's hours:
+
+    python backend/schedule.py [--dry-run]
+"""
+import argparse
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+from database import connect, run_in_transaction
+
+DEFAULT_SLOT_MINUTES = 30
+MAX_DAYS = 62
+SLOT_FORMAT = '%Y-%m-%d %H:%M'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS doctor_schedules (
+    doctor_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,          -- 0 = Monday
+    start_minute INTEGER NOT NULL,     -- minutes after local midnight
+    end_minute INTEGER NOT NULL,
+    PRIMARY KEY (doctor_id, weekday, start_minute)
+) WITHOUT ROWID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_doctor_slot ON appointments (doctor_id, slot_start)
+WHERE slot_start IS NOT NULL AND status IS NOT 'Cancelled';
+
+CREATE TRIGGER IF NOT EXISTS doctors_schedule_delete AFTER DELETE ON doctors
+BEGIN DELETE FROM doctor_schedules WHERE doctor_id = OLD.id; END;
+'''
+
+
+class SlotUnavailable(Exception):
+    """The slot is not in the doctor's schedule, is in the past, or is already booked."""
+
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+_DAY_WORDS = {
+    'daily': range(7), 'everyday': range(7), 'all': range(7),
+    'weekdays': range(5), 'weekday': range(5),
+    'weekends': (5, 6), 'weekend': (5, 6),
+}
+_DAY_TOKEN = re.compile(r'([a-z]+)(?:\s*-\s*([a-z]+))?')
+_TIME = r'(?:(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.|noon|midnight)?|(noon|midnight))'
+_SHIFT = re.compile(rf'{_TIME}\s*-\s*{_TIME}')
+
+
+def _weekday(word):
+    for index, name in enumerate(WEEKDAYS):
+        if word.startswith(name):
+            return index
+    raise ValueError(f'unknown day {word!r}')
+
+
+def parse_days(text):
+    """Weekday numbers (0 = Monday) from text like 'Mon-Fri', 'Tue, Thu' or 'Daily'."""
+    text = text.lower().replace(' to ', '-').replace('–', '-')
+    days = set()
+    for first, last in _DAY_TOKEN.findall(text):
+        if first in ('and', 'days', 'week') and not last:
+            continue
+        if first in _DAY_WORDS and not last:
+            days.update(_DAY_WORDS[first])
+            continue
+        start = _weekday(first)
+        end = _weekday(last) if last else start
+        days.update((start + i) % 7 for i in range((end - start) % 7 + 1))
+    if not days:
+        raise ValueError(f'no days in {text!r}')
+    return sorted(days)
+
+
+def _minutes(hour, minute, meridiem, word):
+    """(minutes after midnight, meridiem or None) for one side of a shift."""
+    meridiem = (meridiem or word or '').replace('.', '') or None
+    if meridiem in ('noon', 'midnight'):
+        hour = int(hour or 12)
+        if hour != 12:
+            raise ValueError(f'{hour} {meridiem}')
+        return (12 * 60 if meridiem == 'noon' else 0), meridiem
+    hour, minute = int(hour), int(minute or 0)
+    if hour > (12 if meridiem else 24) or minute > 59:
+        raise ValueError(f'bad time {hour}:{minute:02}')
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem == 'pm' else 0)
+    return hour * 60 + minute, meridiem
+
+
+def parse_hours(text):
+    """(start_minute, end_minute) shifts from text like '9AM - 5PM', '9 Am-12 Noon' or '09:00-13:00, 14:00-18:00'."""
+    text = text.lower().replace(' to ', '-').replace('–', '-')
+    shifts = []
+    for match in _SHIFT.finditer(text):
+        start, start_meridiem = _minutes(*match.groups()[:4])
+        end, end_meridiem = _minutes(*match.groups()[4:])
+        if end_meridiem == 'midnight':
+            end = 24 * 60
+        elif end_meridiem in ('am', 'pm') and not start_meridiem and start + 12 * 60 < end:
+            # '2-6PM': the start shares the end's afternoon.
+            start += 12 * 60
+        elif not end_meridiem and end <= start and end < 12 * 60:
+            # '9-5' on a twelve-hour clock.
+            end += 12 * 60
+        if end <= start:
+            raise ValueError(f'shift {match.group(0)!r} ends before it starts (overnight shifts are not supported)')
+        shifts.append((start, end))
+    if not shifts:
+        raise ValueError(f'no hours in {text!r}')
+    return shifts
+
+
+def parse_schedule(days=None, hours=None, availability=None):
+    """Weekly (weekday, start_minute, end_minute) rows for a doctor; raises ValueError if unparseable."""
+    if not (days and hours) and availability:
+        # 'Mon-Fri 9AM-5PM': the days end where the first time begins.
+        split = re.search(r'\d|noon|midnight', availability.lower())
+        if not split:
+            raise ValueError(f'no hours in {availability!r}')
+        days, hours = availability[:split.start()], availability[split.start():]
+    if not (days and hours):
+        return []
+    return sorted({(day, start, end) for day in parse_days(days) for start, end in parse_hours(hours)})
+
+
+def save(conn, doctor_id, rows):
+    """Replace a doctor's weekly schedule rows."""
+    conn.execute('DELETE FROM doctor_schedules WHERE doctor_id = ?', (doctor_id,))
+    conn.executemany('INSERT OR IGNORE INTO doctor_schedules (doctor_id, weekday, start_minute, end_minute) VALUES (?, ?, ?, ?)',
+                     ((doctor_id, *row) for row in rows))
+
+
+def _slot_labels(shifts, slot_minutes):
+    """'HH:MM' start of every slot in a day's shifts, in order."""
+    return [f'{minute // 60:02}:{minute % 60:02}'
+            for start, end in shifts for minute in range(start, end - slot_minutes + 1, slot_minutes)]
+
+
+def doctor_slots(conn, doctor_ids, first_day, days=1, now=None):
+    """{doctor_id: [{date, available, booked}]} for `days` days from `first_day`.
+
+    `available` and `booked` are 'HH:MM' slot start times; slots that have
+    already started are left out. Two queries cover any number of doctors:
+    their weekly rows and the appointments holding slots in the range.
+    """
+    today, now_label = (now or datetime.now()).strftime(SLOT_FORMAT).split(' ')
+    ids = json.dumps(list(doctor_ids))
+    weekly, slot_minutes = {}, {}
+    for doctor_id, minutes, weekday, start, end in conn.execute('''
+        SELECT d.id, d.slot_minutes, s.weekday, s.start_minute, s.end_minute
+        FROM doctors d JOIN doctor_schedules s ON s.doctor_id = d.id
+        WHERE d.id IN (SELECT value FROM json_each(?))
+    ''', (ids,)):
+        slot_minutes[doctor_id] = minutes or DEFAULT_SLOT_MINUTES
+        weekly.setdefault(doctor_id, {}).setdefault(weekday, []).append((start, end))
+    # Labels are formatted once per doctor and weekday, not once per slot.
+    template = {doctor_id: {weekday: _slot_labels(sorted(shifts), slot_minutes[doctor_id])
+                            for weekday, shifts in by_day.items()}
+                for doctor_id, by_day in weekly.items()}
+
+    dates = [(day.isoformat(), day.weekday()) for day in (first_day + timedelta(days=i) for i in range(days))]
+    booked = {}
+    for doctor_id, slot_start in conn.execute('''
+        SELECT doctor_id, slot_start FROM appointments
+        WHERE doctor_id IN (SELECT value FROM json_each(?)) AND slot_start >= ? AND slot_start < ?
+          AND slot_start IS NOT NULL AND status IS NOT 'Cancelled'
+    ''', (ids, first_day.isoformat(), (first_day + timedelta(days=days)).isoformat())):
+        booked.setdefault(doctor_id, {}).setdefault(slot_start[:10], set()).add(slot_start[11:])
+
+    result = {}
+    for doctor_id in doctor_ids:
+        by_weekday, held_by_date, calendar = template.get(doctor_id, {}), booked.get(doctor_id, {}), []
+        for date, weekday in dates:
+            labels = by_weekday.get(weekday, ()) if date >= today else ()
+            if date == today:
+                labels = [label for label in labels if label >= now_label]
+            taken = held_by_date.get(date)
+            if taken:
+                available = [label for label in labels if label not in taken]
+                held = [label for label in labels if label in taken]
+            else:
+                available, held = list(labels), []
+            calendar.append({"date": date, "available": available, "booked": held})
+        result[doctor_id] = calendar
+    return result
+
+
+def book(conn, doctor_id, slot_start, patient_id, appointment_no, now=None):
+    """Claim one of a doctor's slots for a patient; returns the new appointment row.
+
+    `slot_start` is a datetime on the slot boundary. The unique index on
+    (doctor_id, slot_start) makes the claim atomic; a slot outside the
+    schedule, in the past or already taken raises SlotUnavailable.
+    """
+    stamp = slot_start.strftime(SLOT_FORMAT)
+    if stamp < (now or datetime.now()).strftime(SLOT_FORMAT):
+        raise SlotUnavailable('slot is in the past')
+    minute = slot_start.hour * 60 + slot_start.minute
+
+    def work(conn):
+        doctor = conn.execute('SELECT hospital_id, name, slot_minutes FROM doctors WHERE id = ?', (doctor_id,)).fetchone()
+        if not doctor:
+            raise SlotUnavailable('doctor not found')
+        slot_minutes = doctor['slot_minutes'] or DEFAULT_SLOT_MINUTES
+        shift = conn.execute('''
+            SELECT start_minute FROM doctor_schedules
+            WHERE doctor_id = ? AND weekday = ? AND start_minute <= ? AND end_minute >= ?
+        ''', (doctor_id, slot_start.weekday(), minute, minute + slot_minutes)).fetchone()
+        if not shift or (minute - shift['start_minute']) % slot_minutes:
+            raise SlotUnavailable('not a slot in the doctor\'s schedule')
+        try:
+            return conn.execute('''
+                INSERT INTO appointments (patient_id, hospital_id, doctor_id, doctor_name, appointment_date, date,
+                                          slot_start, appointment_no, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                RETURNING id, hospital_id, doctor_name, slot_start, appointment_no
+            ''', (patient_id, doctor['hospital_id'], doctor_id, doctor['name'], slot_start.date().isoformat(),
+                  slot_start.date().isoformat(), stamp, appointment_no)).fetchone()
+        except sqlite3.IntegrityError:
+            raise SlotUnavailable('slot already booked') from None
+
+    return run_in_transaction(conn, work)
+
+
+def rebuild(conn, dry_run=False):
+    """Re-parse every doctor's hours; returns (doctors scheduled, [(doctor id, name, error)])."""
+    scheduled, failures = 0, []
+    for doctor in conn.execute('SELECT id, name, days, hours, availability FROM doctors  -- full scan').fetchall():
+        try:
+            rows = parse_schedule(doctor['days'], doctor['hours'], doctor['availability'])
+        except ValueError as e:
+            failures.append((doctor['id'], doctor['name'], str(e)))
+            continue
+        if not dry_run:
+            save(conn, doctor['id'], rows)
+        scheduled += bool(rows)
+    return scheduled, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse doctors\' free-text hours into weekly schedules.')
+    parser.add_argument('--dry-run', action='store_true', help='only report doctors whose hours cannot be parsed')
+    args = parser.parse_args()
+
+    conn = connect()
+    scheduled, failures = run_in_transaction(conn, lambda c: rebuild(c, args.dry_run))
+    conn.close()
+    for doctor_id, name, error in failures:
+        print(f"Doctor {doctor_id} ({name}): {error}")
+    print(f"{scheduled} doctors {'would be ' if args.dry_run else ''}scheduled, {len(failures)} unparseable")
+
+
+if __name__ == '__main__':
+    main()
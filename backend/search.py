@@ -0,0 +1,101 @@
+"""FTS5 search index over hospitals for the search box and bed search.
+
+One `hospital_search` row per hospital (rowid = hospital id) holds its name,
+location, the bed types it offers and its doctors' specializations. The
+triggers below rebuild a hospital's row whenever one of those inputs
+changes; bed count updates (reservations, refunds) do not touch it.
+
+Run as a script to rebuild the index from the base tables:
+
+    python backend/search.py
+"""
+import re
+import sys
+
+from database import connect
+
+SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS hospital_search USING fts5(
+    name, location, bed_types, specializations,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+'''
+
+_REFRESH = '''
+    DELETE FROM hospital_search WHERE rowid = {id};
+    INSERT INTO hospital_search (rowid, name, location, bed_types, specializations)
+    SELECT h.id, h.name, h.location,
+           (SELECT group_concat(DISTINCT b.bed_type) FROM beds b WHERE b.hospital_id = h.id),
+           (SELECT group_concat(DISTINCT d.specialization) FROM doctors d WHERE d.hospital_id = h.id)
+    FROM hospitals h WHERE h.id = {id};
+'''
+
+
+def _triggers():
+    statements = [f'''
+CREATE TRIGGER IF NOT EXISTS hospitals_search_insert AFTER INSERT ON hospitals
+BEGIN {_REFRESH.format(id='NEW.id')} END;
+CREATE TRIGGER IF NOT EXISTS hospitals_search_update AFTER UPDATE OF id, name, location ON hospitals
+BEGIN DELETE FROM hospital_search WHERE rowid = OLD.id; {_REFRESH.format(id='NEW.id')} END;
+CREATE TRIGGER IF NOT EXISTS hospitals_search_delete AFTER DELETE ON hospitals
+BEGIN DELETE FROM hospital_search WHERE rowid = OLD.id; END;''']
+    for table, column in (('beds', 'bed_type'), ('doctors', 'specialization')):
+        statements.append(f'''
+CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table}
+BEGIN {_REFRESH.format(id='NEW.hospital_id')} END;
+CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF hospital_id, {column} ON {table}
+BEGIN {_REFRESH.format(id='OLD.hospital_id')} {_REFRESH.format(id='NEW.hospital_id')} END;
+CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}
+BEGIN {_REFRESH.format(id='OLD.hospital_id')} END;''')
+    return '\n'.join(statements) + '\n'
+
+
+TRIGGERS = _triggers()
+
+_WORD = re.compile(r'\w+')
+
+
+def match_expression(text, columns=None):
+    """FTS5 query for free text: every word must match as a prefix.
+
+    Words are quoted, so operators and punctuation in user input are inert.
+    Returns None when the text contains no searchable words.
+    """
+    terms = [f'"{word}"*' for word in _WORD.findall(text)]
+    if not terms:
+        return None
+    expression = ' '.join(terms)
+    if columns:
+        expression = f"{{{' '.join(columns)}}} : ({expression})"
+    return expression
+
+
+def rebuild(conn):
+    """Recompute every index row from the base tables in the current transaction."""
+    conn.execute('DELETE FROM hospital_search')
+    conn.execute('''
+        INSERT INTO hospital_search (rowid, name, location, bed_types, specializations)
+        SELECT h.id, h.name, h.location, b.bed_types, d.specializations
+        FROM hospitals h
+        LEFT JOIN (SELECT hospital_id, group_concat(DISTINCT bed_type) AS bed_types
+                   FROM beds GROUP BY hospital_id) b ON b.hospital_id = h.id
+        LEFT JOIN (SELECT hospital_id, group_concat(DISTINCT specialization) AS specializations
+                   FROM doctors GROUP BY hospital_id) d ON d.hospital_id = h.id
+    ''')
+    conn.execute("INSERT INTO hospital_search (hospital_search) VALUES ('optimize')")
+
+
+def main():
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    rebuild(conn)
+    count = conn.execute('SELECT count(*) FROM hospital_search').fetchone()[0]
+    conn.commit()
+    conn.close()
+    print(f"Rebuilt search index for {count} hospitals.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
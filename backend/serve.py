@@ -0,0 +1,394 @@
+"""Production server: pre-forked worker processes sharing one listening socket.
+
+    python backend/serve.py [--host 127.0.0.1] [--port 9000] [--workers 4]
+
+The master binds the socket, applies migrations in a short-lived child and
+preloads the third-party libraries, then forks the workers. Each worker
+imports the app, warms its connection pool and routes, and accepts
+connections once ready; the kernel spreads connections across them. A
+worker that dies is replaced.
+
+SIGHUP reloads without refusing a connection: migrations run again, a new
+generation of workers is forked (importing the code afresh, since the
+master never imports the app itself) and, once all of it is serving, the
+old workers stop accepting and finish their requests. Open event streams
+end within a heartbeat and EventSource reconnects to a new worker. If the
+new code fails to migrate or start, the old workers keep serving.
+SIGTERM/SIGINT drain the workers the same way and exit.
+
+Each worker has its own event bus, so the master relays published events
+between workers and a dashboard sees changes made through any of them.
+The first worker of each generation also runs the asyncio SSE server
+(sse.py) that every worker redirects `/api/stream` to.
+With several workers the read-through cache defaults to the shared sqlite
+backend. /metrics reports the worker that answers the scrape.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+STARTED = time.perf_counter()
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Loaded once in the master and shared copy-on-write; the app's own modules
+# are imported by each worker so a reload picks up changed code.
+PRELOAD = ('flask', 'flask_cors', 'numpy', 'sqlite3', 'zipfile', 'cProfile')
+GRACEFUL_TIMEOUT = float(os.environ.get('HOSPITRACK_GRACEFUL_TIMEOUT', 30))
+READY_TIMEOUT = float(os.environ.get('HOSPITRACK_READY_TIMEOUT', 60))
+RELAY_MAX_BYTES = 256 * 1024
+
+log = logging.getLogger('hospitrack.serve')
+
+
+class _Handler(WSGIRequestHandler):
+    """Request handler that counts the connections being served, so a stopping worker can wait for them."""
+
+    open = 0
+    _lock = threading.Lock()
+
+    def handle(self):
+        with _Handler._lock:
+            _Handler.open += 1
+        try:
+            super().handle()
+        finally:
+            with _Handler._lock:
+                _Handler.open -= 1
+
+
+def _warm(application):
+    """Open a pooled connection and serve one request so the first real one pays nothing extra."""
+    import auth
+    from database import pool
+
+    auth.secret_key()
+    conn = pool.connect()
+    application.hospital_columns(conn)
+    conn.close()
+    application.app.test_client().get('/api/hospitals')
+
+
+def _relay_events(bus, relay):
+    """Send this worker's events to the master, and deliver the ones it forwards."""
+    def send(topics, event):
+        try:
+            relay.send(json.dumps({"topics": topics, "event": event}).encode(), socket.MSG_DONTWAIT)
+        except OSError:
+            pass  # the master is busy or gone; live updates are best effort
+
+    def receive():
+        while True:
+            try:
+                message = json.loads(relay.recv(RELAY_MAX_BYTES))
+            except OSError:
+                return
+            bus.deliver(message['topics'], message['event'])
+
+    bus.relay = send
+    threading.Thread(target=receive, name='event-relay', daemon=True).start()
+
+
+def run_worker(listener, ready_fd, relay, host, port, background):
+    """Body of a forked worker; returns its exit status."""
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    for signum in (signal.SIGHUP, signal.SIGINT):
+        signal.signal(signum, signal.SIG_IGN)
+    start = time.perf_counter()
+
+    import app as application
+    import events
+    import expiry
+    import sse
+
+    _warm(application)
+    _relay_events(events.bus, relay)
+    server = make_server(host, port, application.app, threaded=True, request_handler=_Handler, fd=listener.fileno())
+    if background:
+        # One worker per generation runs the sweeper and the asyncio SSE server.
+        expiry.start_scheduler()
+        if sse.SSE_PORT:
+            sse.SSEServer(host=host).start_in_thread()
+    threading.Thread(target=server.serve_forever, name='http', daemon=True).start()
+    os.write(ready_fd, f'{(time.perf_counter() - start) * 1000:.0f}\n'.encode())
+    os.close(ready_fd)
+
+    stopping.wait()
+    server.shutdown()
+    events.closing.set()
+    deadline = time.monotonic() + GRACEFUL_TIMEOUT
+    while _Handler.open and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if _Handler.open:
+        log.warning("Worker %d exiting with %d connections still open", os.getpid(), _Handler.open)
+    return 0
+
+
+def run_migrations():
+    import init_db
+    init_db.init_db()
+    return 0
+
+
+class Worker:
+    def __init__(self, pid, generation, index, relay, ready_fd):
+        self.pid = pid
+        self.generation = generation
+        self.index = index
+        self.relay = relay
+        self.ready_fd = ready_fd
+        self.ready_ms = None
+        self.retiring = False
+
+
+class Master:
+    def __init__(self, host, port, workers, backlog=1024):
+        self.host = host
+        self.port = port
+        self.size = workers
+        self.listener = socket.create_server((host, port), backlog=backlog)
+        self.listener.set_inheritable(True)
+        self.workers = {}
+        self.generation = 0
+        self.selector = selectors.DefaultSelector()
+        self._signals = []
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+
+    # --- child processes ---
+
+    def _fork(self, target, *args):
+        pid = os.fork()
+        if pid:
+            return pid
+        status = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            self.selector.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            for worker in self.workers.values():
+                worker.relay.close()
+                if worker.ready_fd is not None:
+                    os.close(worker.ready_fd)
+            status = target(*args)
+        except BaseException:
+            log.exception("Process %d failed", os.getpid())
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def migrate(self):
+        """Apply migrations in a child, so the master never imports the app's modules."""
+        pid = self._fork(run_migrations)
+        while True:
+            try:
+                _, status = os.waitpid(pid, 0)
+                return os.waitstatus_to_exitcode(status) == 0
+            except InterruptedError:
+                continue
+
+    def spawn(self, index):
+        master_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        ready_r, ready_w = os.pipe()
+        pid = self._fork(self._start_worker, master_end, worker_end, ready_r, ready_w, index == 0)
+        worker_end.close()
+        os.close(ready_w)
+        master_end.setblocking(False)
+        worker = self.workers[pid] = Worker(pid, self.generation, index, master_end, ready_r)
+        self.selector.register(master_end, selectors.EVENT_READ, worker)
+        self.selector.register(ready_r, selectors.EVENT_READ, ('ready', worker))
+        return worker
+
+    def _start_worker(self, master_end, worker_end, ready_r, ready_w, background):
+        master_end.close()
+        os.close(ready_r)
+        return run_worker(self.listener, ready_w, worker_end, self.host, self.port, background)
+
+    def retire(self, worker):
+        worker.retiring = True
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    # --- event loop ---
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def poll(self, timeout):
+        for key, _ in self.selector.select(timeout):
+            data = key.data
+            if data == 'wake':
+                try:
+                    while os.read(self._wake_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+            elif isinstance(data, tuple):
+                self._on_ready(data[1])
+            else:
+                self._forward(data)
+        self._reap()
+
+    def _on_ready(self, worker):
+        line = os.read(worker.ready_fd, 64)
+        self.selector.unregister(worker.ready_fd)
+        os.close(worker.ready_fd)
+        worker.ready_fd = None
+        if line:
+            worker.ready_ms = float(line)
+
+    def _forward(self, source):
+        try:
+            message = source.relay.recv(RELAY_MAX_BYTES)
+        except OSError:
+            return
+        for worker in self.workers.values():
+            if worker is not source:
+                try:
+                    worker.relay.send(message)
+                except OSError:
+                    pass  # that worker's queue is full; it misses this live update
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            self.selector.unregister(worker.relay)
+            worker.relay.close()
+            if worker.ready_fd is not None:
+                self.selector.unregister(worker.ready_fd)
+                os.close(worker.ready_fd)
+            if not worker.retiring and worker.generation == self.generation and worker.ready_ms is not None:
+                log.warning("Worker %d exited (status %d); starting a replacement", pid, os.waitstatus_to_exitcode(status))
+                self.spawn(worker.index)
+
+    def wait_ready(self, workers):
+        """True once every worker reported ready; False if one died or READY_TIMEOUT passed."""
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            self.poll(0.1)
+            if any(w.pid not in self.workers for w in workers):
+                return False
+            if all(w.ready_ms is not None for w in workers):
+                return True
+        return False
+
+    def start_generation(self):
+        self.generation += 1
+        started = time.perf_counter()
+        workers = [self.spawn(index) for index in range(self.size)]
+        if self.wait_ready(workers):
+            return workers, (time.perf_counter() - started) * 1000
+        for worker in workers:
+            if worker.pid in self.workers:
+                self.retire(worker)
+        self.generation -= 1
+        return None, None
+
+    def reload(self):
+        started = time.perf_counter()
+        log.info("Reloading: applying migrations")
+        if not self.migrate():
+            log.error("Migrations failed; the current workers keep serving")
+            return
+        old = [w for w in self.workers.values() if w.generation == self.generation]
+        workers, _ = self.start_generation()
+        if workers is None:
+            log.error("New workers failed to start; the current workers keep serving")
+            return
+        for worker in old:
+            self.retire(worker)
+        log.info("Reloaded in %.0f ms: generation %d serving, %d old workers draining",
+                 (time.perf_counter() - started) * 1000, self.generation, len(old))
+
+    def shutdown(self):
+        log.info("Shutting down %d workers", len(self.workers))
+        for worker in list(self.workers.values()):
+            self.retire(worker)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while self.workers and time.monotonic() < deadline:
+            self.poll(0.1)
+        for worker in self.workers.values():
+            os.kill(worker.pid, signal.SIGKILL)
+        self.listener.close()
+
+    def run(self):
+        signal.set_wakeup_fd(self._wake_w)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, self._on_signal)
+
+        preload_started = time.perf_counter()
+        for name in PRELOAD:
+            importlib.import_module(name)
+        preload_ms = (time.perf_counter() - preload_started) * 1000
+        migrate_started = time.perf_counter()
+        if not self.migrate():
+            log.error("Migrations failed; not starting")
+            return 1
+        migrate_ms = (time.perf_counter() - migrate_started) * 1000
+        workers, ready_ms = self.start_generation()
+        if workers is None:
+            log.error("Workers failed to start")
+            self.shutdown()
+            return 1
+        log.info("Serving on http://%s:%d with %d workers in %.0f ms (preload %.0f ms, migrations %.0f ms, "
+                 "workers ready %.0f ms; slowest import and warm-up %.0f ms)",
+                 self.host, self.port, len(workers), (time.perf_counter() - STARTED) * 1000, preload_ms, migrate_ms,
+                 ready_ms, max(w.ready_ms for w in workers))
+
+        while True:
+            self.poll(1.0)
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                elif signum in (signal.SIGTERM, signal.SIGINT):
+                    self.shutdown()
+                    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve HospiTech with pre-forked worker processes.')
+    parser.add_argument('--host', default=os.environ.get('HOSPITRACK_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('HOSPITRACK_PORT', 9000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('HOSPITRACK_WORKERS', os.cpu_count() or 2)))
+    parser.add_argument('--access-log', action='store_true', help='log every request (off by default; see /metrics)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(message)s')
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    if args.workers > 1:
+        # In-process caches would miss other workers' invalidations.
+        os.environ.setdefault('HOSPITRACK_CACHE', 'sqlite')
+    sys.exit(Master(args.host, args.port, max(args.workers, 1)).run())
+
+
+if __name__ == '__main__':
+    main()
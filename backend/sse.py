@@ -0,0 +1,165 @@
+"""Single-threaded Server-Sent Events server for large numbers of idle dashboards.
+
+Serves the same `/api/stream?hospital_id=..&patient_id=..` protocol as the
+Flask endpoint, but every client is a coroutine on one asyncio loop rather
+than a blocked WSGI thread. app.py and serve.py start it on SSE_PORT, the
+dashboards connect to it directly and the Flask endpoint redirects here;
+HOSPITRACK_SSE_PORT=0 turns it off and Flask streams by itself again. The loop subscribes to each topic on the event
+bus once and fans events out to its connections itself, so a publish costs
+one cross-thread hop regardless of how many dashboards are watching.
+Session tokens and patient ownership are checked as on the Flask endpoint.
+"""
+import asyncio
+import os
+import socket
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs, urlsplit
+
+import auth
+import events
+
+SSE_PORT = int(os.environ.get('HOSPITRACK_SSE_PORT', 9001))
+# Clients whose socket buffer grows past this are too slow to keep up.
+MAX_BUFFER_BYTES = 256 * 1024
+
+_HEADERS = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/event-stream\r\n'
+    'Cache-Control: no-cache\r\n'
+    'Connection: keep-alive\r\n'
+    'Access-Control-Allow-Origin: *\r\n'
+    '\r\n'
+    'retry: 3000\n\n'
+).encode()
+
+
+def topics_from_query(args):
+    """Map ?hospital_id= / ?patient_id= query values to bus topics."""
+    topics = [events.hospital_topic(h) for h in args.get('hospital_id', []) if h.isdigit()]
+    topics += [events.patient_topic(p) for p in args.get('patient_id', []) if p.isdigit()]
+    return topics
+
+
+def check_access(args, headers):
+    """None if the caller may stream the topics args names, else the HTTP status line to refuse with.
+
+    Applies the Flask app's rules: a bad token is refused, a missing one
+    unless HOSPITRACK_REQUIRE_SESSIONS=0, and a patient may only follow
+    their own patient_id.
+    """
+    authorization = headers.get('authorization', '')
+    token = authorization[7:] if authorization.startswith('Bearer ') else (args.get('access_token') or [None])[0]
+    if not token:
+        return '401 Unauthorized' if auth.REQUIRE_SESSIONS else None
+    session = auth.verify_session(token)
+    if session is None:
+        return '401 Unauthorized'
+    if not auth.owns(session, [{key: value} for key, values in args.items() for value in values]):
+        return '403 Forbidden'
+    return None
+
+
+class SSEServer:
+    def __init__(self, bus=events.bus, host='127.0.0.1', port=SSE_PORT, heartbeat=events.HEARTBEAT_SECONDS):
+        self.bus = bus
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.loop = None
+        self._clients = defaultdict(set)
+        self._subscriptions = {}
+        self._ready = threading.Event()
+        self.connections = 0
+
+    def _on_event(self, event):
+        # Called on the publishing thread; hop onto the loop once per event.
+        self.loop.call_soon_threadsafe(self._fanout, event['topic'], events.format_sse(event).encode())
+
+    def _fanout(self, topic, frame):
+        for writer in list(self._clients.get(topic, ())):
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER_BYTES:
+                writer.close()
+                continue
+            writer.write(frame)
+
+    def _add(self, topic, writer):
+        if topic not in self._subscriptions:
+            self._subscriptions[topic] = self.bus.subscribe(topic, self._on_event)
+        self._clients[topic].add(writer)
+
+    def _remove(self, topic, writer):
+        clients = self._clients.get(topic)
+        if clients is None:
+            return
+        clients.discard(writer)
+        if not clients:
+            del self._clients[topic]
+            self.bus.unsubscribe(self._subscriptions.pop(topic))
+
+    async def _handle(self, reader, writer):
+        topics = []
+        streaming = False
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            parts = request_line.decode('latin-1').split()
+            url = urlsplit(parts[1]) if len(parts) >= 2 else None
+            if url is None or parts[0] != 'GET' or url.path != '/api/stream':
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+                return
+            args = parse_qs(url.query)
+            topics = topics_from_query(args)
+            if not topics:
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+                return
+            refused = check_access(args, headers)
+            if refused:
+                writer.write(f'HTTP/1.1 {refused}\r\nContent-Length: 0\r\nAccess-Control-Allow-Origin: *\r\n\r\n'.encode())
+                return
+
+            writer.write(_HEADERS)
+            streaming = True
+            self.connections += 1
+            for topic in topics:
+                self._add(topic, writer)
+            # Idle until the client goes away; events are written by _fanout.
+            while await reader.read(1024):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if streaming:
+                self.connections -= 1
+            for topic in topics:
+                self._remove(topic, writer)
+            writer.close()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            writers = {w for clients in self._clients.values() for w in clients}
+            for writer in writers:
+                writer.write(b': keep-alive\n\n')
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        # reuse_port lets a reloading serve.py start the next generation's
+        # server before the old one has let go of the port.
+        server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096,
+                                            reuse_port=hasattr(socket, 'SO_REUSEPORT'))
+        self.port = server.sockets[0].getsockname()[1]
+        self.loop.create_task(self._heartbeat())
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self):
+        """Run the server on a daemon thread; returns once it is listening."""
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name='sse-server', daemon=True)
+        thread.start()
+        self._ready.wait()
+        return thread
@@ -0,0 +1,87 @@
+"""Incremental JSON for list endpoints that can return a whole table.
+
+dict_factory + fetchall() + jsonify holds every row several times over
+(tuples, dicts, the encoded body) before the first byte goes out. stream()
+reads plain tuples from the cursor CHUNK_ROWS at a time, builds dicts from
+column names looked up once per statement, and encodes each chunk as it is
+sent, so memory stays flat however many rows match.
+
+Clients that send `Accept: application/x-ndjson` or `?format=ndjson` get
+one object per line instead of a JSON array.
+"""
+import json
+import os
+
+from flask import Response
+
+CHUNK_ROWS = int(os.environ.get('HOSPITRACK_STREAM_CHUNK_ROWS', 500))
+NDJSON = 'application/x-ndjson'
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+# (cursor.description, names) of the last statement seen. sqlite3 keeps one
+# description tuple per statement, and holding it here keeps its identity
+# from being reused; threads racing on it at worst recompute the names.
+_columns = (None, ())
+
+
+def column_names(cursor):
+    """Column names of the cursor's current result, computed once per statement."""
+    global _columns
+    description, names = _columns
+    if cursor.description is not description:
+        description = cursor.description
+        names = tuple(column[0] for column in description)
+        _columns = description, names
+    return names
+
+
+def wants_ndjson(request):
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best_match(('application/json', NDJSON)) == NDJSON)
+
+
+def chunks(cursor, size=CHUNK_ROWS):
+    """Lists of up to `size` row dicts until the cursor is exhausted."""
+    names = column_names(cursor)
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield [dict(zip(names, row)) for row in rows]
+
+
+def json_array(row_chunks):
+    opening = '['
+    for chunk in row_chunks:
+        yield opening + _encode(chunk)[1:-1]
+        opening = ','
+    yield '[]' if opening == '[' else ']'
+
+
+def json_lines(row_chunks):
+    for chunk in row_chunks:
+        yield ''.join(_encode(row) + '\n' for row in chunk)
+
+
+def stream(conn, sql, parameters=(), ndjson=False):
+    """Run sql on conn and return a Response that sends the rows as they are read.
+
+    Takes ownership of conn: it is closed (returned to the pool) once the
+    response has been sent or abandoned, which is after the request's app
+    context has been torn down.
+    """
+    conn.row_factory = None
+    try:
+        cursor = conn.execute(sql, parameters)
+    except BaseException:
+        conn.close()
+        raise
+
+    def close():
+        cursor.close()
+        conn.close()
+
+    body = (json_lines if ndjson else json_array)(chunks(cursor))
+    response = Response(body, mimetype=NDJSON if ndjson else 'application/json')
+    response.call_on_close(close)
+    return response
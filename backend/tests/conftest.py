@@ -0,0 +1,82 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Importing the app must never open the real database/hospitrack.db or write
+# next to it (secret key, report store, cache and occupancy files).
+_TMP = tempfile.mkdtemp(prefix='hospitrack-tests-')
+os.environ.setdefault('HOSPITRACK_DB', os.path.join(_TMP, 'test.db'))
+os.environ.setdefault('HOSPITRACK_SECRET_KEY', 'test-secret')
+os.environ.setdefault('HOSPITRACK_REPORT_DIR', os.path.join(_TMP, 'reports'))
+os.environ.setdefault('HOSPITRACK_CACHE_PATH', os.path.join(_TMP, 'cache.db'))
+os.environ.setdefault('HOSPITRACK_OCCUPANCY_DB', os.path.join(_TMP, 'occupancy.db'))
+os.environ.setdefault('HOSPITRACK_PBKDF2_ITERATIONS', '1000')
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The Flask app on a freshly migrated test database."""
+    import migrations
+    from database import connect
+    conn = connect()
+    migrations.migrate(conn)
+    conn.close()
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from database import connect
+    conn = connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def bearer(user_id, role, hospital_id=None):
+    """Authorization header for a session of the given user."""
+    import auth
+    token, _ = auth.issue_session({'id': user_id, 'role': role, 'hospital_id': hospital_id})
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def make_hospital(db):
+    """make_hospital(beds={'ICU': (total, available)}, lat=, lon=) -> new hospital id."""
+    def make(beds=(), lat=None, lon=None, name='Test Hospital'):
+        hospital_id = db.execute('INSERT INTO hospitals (name, location, contact, latitude, longitude) VALUES (?, ?, ?, ?, ?)',
+                                 (name, 'Test District', '555-0100', lat, lon)).lastrowid
+        for bed_type, (total, available) in dict(beds).items():
+            db.execute('INSERT INTO beds (hospital_id, bed_type, total_count, available_count, price) VALUES (?, ?, ?, ?, ?)',
+                       (hospital_id, bed_type, total, available, 1000))
+        db.commit()
+        return hospital_id
+    return make
+
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture
+def make_user(db):
+    """make_user(role, hospital_id=None) -> new user id."""
+    def make(role='patient', hospital_id=None):
+        username = f'{role}-{next(_user_numbers)}'
+        user_id = db.execute('INSERT INTO users (username, password, role, full_name, hospitrack_id, hospital_id) VALUES (?, ?, ?, ?, ?, ?)',
+                             (username, 'x', role, username.title(), f'HT-{username}', hospital_id)).lastrowid
+        db.commit()
+        return user_id
+    return make
@@ -0,0 +1,86 @@
+"""Session tokens and what a session may touch."""
+import time
+
+import pytest
+
+import auth
+from conftest import bearer
+
+
+def token_of(headers):
+    return headers['Authorization'][len('Bearer '):]
+
+
+def appointments(client, patient, headers=None):
+    return client.get(f'/api/patient/appointments?patient_id={patient}', headers=headers)
+
+
+def test_anonymous_api_calls_need_a_session(client, make_user):
+    assert appointments(client, make_user('patient')).status_code == 401
+    assert client.get('/api/hospitals').status_code == 200
+
+
+def test_forged_token_is_refused(client, make_user):
+    patient = make_user('patient')
+    payload, _, _ = token_of(bearer(patient, 'patient')).partition('.')
+    forged = {'Authorization': f'Bearer {payload}.{"0" * 64}'}
+    assert appointments(client, patient, forged).status_code == 401
+
+
+def test_expired_token_is_refused(client, make_user):
+    patient = make_user('patient')
+    token, expires = auth.issue_session({'id': patient, 'role': 'patient'}, now=time.time() - 2 * auth.SESSION_TTL_SECONDS)
+    assert expires < time.time()
+    assert appointments(client, patient, {'Authorization': f'Bearer {token}'}).status_code == 401
+
+
+def test_logout_revokes_the_token(client, make_user):
+    patient = make_user('patient')
+    headers = bearer(patient, 'patient')
+    assert appointments(client, patient, headers).status_code == 200
+    assert client.post('/api/logout', headers=headers).status_code == 200
+    assert appointments(client, patient, headers).status_code == 401
+
+
+def test_revocation_reaches_other_workers(client, make_user):
+    patient = make_user('patient')
+    headers = bearer(patient, 'patient')
+    session = auth.verify_session(token_of(headers))
+    # Another process logs the session out through the shared table.
+    auth.RevocationList().revoke(session['session_id'], session['expires'])
+    auth.revocations.sync()
+    assert auth.verify_session(token_of(headers)) is None
+    assert appointments(client, patient, headers).status_code == 401
+
+
+def test_patient_cannot_read_another_patients_data(client, make_user):
+    patient, other = make_user('patient'), make_user('patient')
+    headers = bearer(patient, 'patient')
+    assert appointments(client, patient, headers).status_code == 200
+    assert appointments(client, other, headers).status_code == 403
+    assert client.get(f'/api/patient/{other}/timeline', headers=headers).status_code == 403
+    # Naming yourself first does not let a second value through.
+    assert client.get(f'/api/patient/appointments?patient_id={patient}&patient_id={other}', headers=headers).status_code == 403
+
+
+def test_staff_cannot_write_to_another_hospital(client, db, make_hospital):
+    own, other = make_hospital(), make_hospital()
+    staff = bearer(900, 'hospital_staff', own)
+    bed = {'bed_type': 'General', 'total_count': 4, 'available_count': 4, 'price': 500}
+    assert client.post('/api/hospital/beds', headers=staff, json={'hospital_id': own, **bed}).status_code == 200
+    assert client.post('/api/hospital/beds', headers=staff, json={'hospital_id': other, **bed}).status_code == 403
+    assert db.execute("SELECT COUNT(*) FROM beds WHERE hospital_id = ? AND bed_type = 'General'", (other,)).fetchone()[0] == 0
+
+
+@pytest.fixture
+def legacy_sessions(monkeypatch):
+    monkeypatch.setattr(auth, 'REQUIRE_SESSIONS', False)
+
+
+def test_legacy_mode_still_refuses_anonymous_writes_naming_an_account(client, make_hospital, make_user, legacy_sessions):
+    patient = make_user('patient')
+    assert appointments(client, patient).status_code == 200
+    reserve = client.post('/api/patient/reserve_bed', json={'patient_id': patient, 'hospital_id': make_hospital(), 'bed_type': 'ICU'})
+    assert reserve.status_code == 401
+    beds = client.post('/api/hospital/beds', json={'hospital_id': make_hospital(), 'bed_type': 'General', 'total_count': 1, 'available_count': 1})
+    assert beds.status_code == 401
@@ -0,0 +1,72 @@
+"""ETags from the data version counters, and the version-keyed cache behind hospital reads."""
+import pytest
+
+import cache
+import versions
+from conftest import bearer
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    monkeypatch.setattr(cache.cache, 'enabled', True)
+    cache.cache.clear()
+    return cache.cache
+
+
+def details(client, hospital_id, etag=None):
+    return client.get(f'/api/hospital/{hospital_id}/details', headers={'If-None-Match': etag} if etag else {})
+
+
+def set_icu_through_the_api(client, db, hospital_id, available):
+    response = client.post('/api/hospital/beds', headers=bearer(900, 'hospital_staff', hospital_id), json={
+        'hospital_id': hospital_id, 'bed_type': 'ICU', 'total_count': 4, 'available_count': available, 'price': 1000})
+    assert response.status_code == 200
+
+
+def set_icu_from_another_worker(client, db, hospital_id, available):
+    # Only the trigger's version bump; this process's cache is not told.
+    db.execute("UPDATE beds SET available_count = ? WHERE hospital_id = ? AND bed_type = 'ICU'", (available, hospital_id))
+    db.commit()
+
+
+def test_matching_etag_is_answered_with_304(client, make_hospital):
+    hospital_id = make_hospital()
+    first = details(client, hospital_id)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag
+    again = details(client, hospital_id, etag)
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == etag
+    assert details(client, hospital_id, '"something-else"').status_code == 200
+
+
+@pytest.mark.parametrize('write', [set_icu_through_the_api, set_icu_from_another_worker])
+def test_write_to_the_hospital_invalidates_etag_and_cached_body(client, db, make_hospital, cached, write):
+    hospital_id = make_hospital({'ICU': (4, 4)})
+    etag = details(client, hospital_id).headers['ETag']
+    version = versions.current(db, [hospital_id])[0]
+    assert details(client, hospital_id, etag).status_code == 304
+
+    write(client, db, hospital_id, 1)
+    assert versions.current(db, [hospital_id])[0] > version
+    misses = cached.misses
+    after = details(client, hospital_id, etag)
+    assert after.status_code == 200 and after.headers['ETag'] != etag
+    assert [bed['available_count'] for bed in after.get_json()['beds']] == [1]
+    assert cached.misses == misses + 1
+
+
+@pytest.mark.parametrize('write', [set_icu_through_the_api, set_icu_from_another_worker])
+def test_write_to_another_hospital_invalidates_neither(client, db, make_hospital, cached, write):
+    hospital_id, other = make_hospital({'ICU': (4, 4)}), make_hospital({'ICU': (4, 4)})
+    etag = details(client, hospital_id).headers['ETag']
+    version = versions.current(db, [hospital_id])[0]
+
+    write(client, db, other, 1)
+    assert versions.current(db, [hospital_id])[0] == version
+    assert details(client, hospital_id, etag).status_code == 304
+    hits, misses = cached.hits, cached.misses
+    body = details(client, hospital_id)
+    assert body.status_code == 200 and body.headers['ETag'] == etag
+    assert [bed['available_count'] for bed in body.get_json()['beds']] == [4]
+    assert (cached.hits, cached.misses) == (hits + 1, misses)
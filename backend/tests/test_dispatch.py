@@ -0,0 +1,32 @@
+"""Emergency dispatch holds and how the hospital sees them."""
+import app as hospitrack
+from conftest import bearer
+
+
+def test_unregistered_dispatch_shows_in_hospital_lists(client, make_hospital):
+    hospital_id = make_hospital({'Dispatch Test Bay': (2, 2)}, lat=12.0, lon=77.0)
+    staff = bearer(900, 'hospital_staff', hospital_id)
+
+    response = client.post('/api/emergency/dispatch', headers=staff, json={'requests': [
+        {'urgency': 'Critical', 'bed_type': 'Dispatch Test Bay', 'lat': 12.001, 'lon': 77.001, 'address': 'Roadside'}]})
+    assert response.status_code == 200, response.get_json()
+    [hold] = response.get_json()['assigned']
+    assert hold['hospital_id'] == hospital_id and hold['patient_id'] is None
+
+    listed = {r['id']: r for r in client.get(f'/api/hospital/{hospital_id}/reservations', headers=staff).get_json()}
+    assert hold['reservation_id'] in listed
+    row = listed[hold['reservation_id']]
+    assert row['patient_name'] == hospitrack.UNREGISTERED_PATIENT
+    assert (row['patient_id'], row['status'], row['address']) == (None, 'Reserved', 'Roadside')
+
+    confirm = client.patch(f"/api/hospital/reservations/{hold['reservation_id']}", headers=staff, json={'status': 'Admitted'})
+    assert confirm.status_code == 200, confirm.get_json()
+
+
+def test_appointment_without_registered_patient_is_listed(client, db, make_hospital):
+    hospital_id = make_hospital()
+    db.execute("INSERT INTO appointments (hospital_id, doctor_name, date, appointment_date, appointment_no) "
+               "VALUES (?, 'Dr Walk-in', '2026-01-05', '2026-01-05', 'WALKIN-1')", (hospital_id,))
+    db.commit()
+    listed = client.get(f'/api/hospital/{hospital_id}/appointments', headers=bearer(900, 'hospital_staff', hospital_id)).get_json()
+    assert [a['patient_name'] for a in listed] == [hospitrack.UNREGISTERED_PATIENT]
@@ -0,0 +1,71 @@
+"""Doctor schedules: saving a doctor, its slot length, and booking with and without slots."""
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import bearer
+
+NEXT_MONDAY = (date.today() + timedelta(days=7 - date.today().weekday())).isoformat()
+
+
+@pytest.fixture
+def hospital(make_hospital):
+    hospital_id = make_hospital()
+    return hospital_id, bearer(900, 'hospital_staff', hospital_id)
+
+
+def save_doctor(client, hospital, **fields):
+    hospital_id, staff = hospital
+    body = {'hospital_id': hospital_id, 'name': 'Dr Test', 'specialization': 'General', 'days': 'Mon-Fri', 'hours': '9AM-5PM', **fields}
+    return client.post('/api/hospital/doctors', headers=staff, json=body)
+
+
+def doctor_id(db, hospital_id, name='Dr Test'):
+    return db.execute('SELECT id FROM doctors WHERE hospital_id = ? AND name = ?', (hospital_id, name)).fetchone()[0]
+
+
+def test_update_without_slot_minutes_keeps_the_stored_length(client, db, hospital):
+    assert save_doctor(client, hospital, slot_minutes=20).status_code == 200
+    doc = doctor_id(db, hospital[0])
+    assert save_doctor(client, hospital, id=doc, specialization='Cardiology').status_code == 200
+    assert tuple(db.execute('SELECT slot_minutes, specialization FROM doctors WHERE id = ?', (doc,)).fetchone()) == (20, 'Cardiology')
+    assert save_doctor(client, hospital, id=doc, slot_minutes=45).status_code == 200
+    assert db.execute('SELECT slot_minutes FROM doctors WHERE id = ?', (doc,)).fetchone()[0] == 45
+
+
+@pytest.mark.parametrize('fields', [{'hours': 'whenever'}, {'slot_minutes': 0}, {'slot_minutes': '30'}])
+def test_unreadable_schedule_is_refused_with_a_reason(client, hospital, fields):
+    response = save_doctor(client, hospital, **fields)
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+
+def test_unscheduled_doctor_is_booked_by_day(client, db, hospital, make_user):
+    hospital_id, _ = hospital
+    assert save_doctor(client, hospital, name='Dr Walk-in', days='', hours='').status_code == 200
+    doc = doctor_id(db, hospital_id, 'Dr Walk-in')
+    patient = make_user('patient')
+    headers = bearer(patient, 'patient')
+    slots = client.get(f'/api/hospital/{hospital_id}/doctors/{doc}/slots?date={NEXT_MONDAY}', headers=headers).get_json()
+    assert slots['scheduled'] is False and slots['days'][0]['available'] == []
+
+    response = client.post('/api/patient/appointments', headers=headers, json={
+        'patient_id': patient, 'hospital_id': hospital_id, 'doctor_name': 'Dr Walk-in', 'date': NEXT_MONDAY})
+    assert response.status_code == 200, response.get_json()
+
+
+def test_scheduled_doctor_is_booked_by_slot_only(client, db, hospital, make_user):
+    hospital_id, _ = hospital
+    assert save_doctor(client, hospital, name='Dr Slots').status_code == 200
+    doc = doctor_id(db, hospital_id, 'Dr Slots')
+    patient = make_user('patient')
+    headers = bearer(patient, 'patient')
+    slots = client.get(f'/api/hospital/{hospital_id}/doctors/{doc}/slots?date={NEXT_MONDAY}', headers=headers).get_json()
+    assert slots['scheduled'] is True and slots['days'][0]['available'][0] == '09:00'
+
+    by_day = client.post('/api/patient/appointments', headers=headers, json={
+        'patient_id': patient, 'hospital_id': hospital_id, 'doctor_name': 'Dr Slots', 'date': NEXT_MONDAY})
+    assert by_day.status_code == 400
+    by_slot = client.post('/api/patient/appointments', headers=headers, json={
+        'patient_id': patient, 'doctor_id': doc, 'slot': f'{NEXT_MONDAY}T09:00'})
+    assert by_slot.status_code == 200, by_slot.get_json()
@@ -0,0 +1,89 @@
+"""Slow statement logging: query plans are only taken while the caller holds the connection."""
+import json
+import logging
+import sqlite3
+import threading
+
+import pytest
+
+import metrics
+
+SQL = 'SELECT value FROM numbers WHERE value > ? ORDER BY value'
+
+
+class Watched:
+    """A connection that counts the cursors metrics opens on it to take plans."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.plans_taken = 0
+
+    def cursor(self):
+        self.plans_taken += 1
+        return self._conn.cursor()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute('CREATE TABLE numbers (value INTEGER)')
+    conn.executemany('INSERT INTO numbers VALUES (?)', ((i,) for i in range(50)))
+    yield Watched(conn)
+    conn.close()
+
+
+@pytest.fixture
+def slow_log(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    monkeypatch.setattr(metrics, '_plans_captured', {})
+    caplog.set_level(logging.WARNING, logger='hospitrack.slow_query')
+    return lambda: [json.loads(r.getMessage()) for r in caplog.records if r.name == 'hospitrack.slow_query']
+
+
+def test_plan_is_taken_in_execute_when_it_is_already_slow(conn, slow_log, monkeypatch):
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_SECONDS', 1e-9)
+    cursor = metrics.execute(conn, SQL, (10,))
+    assert conn.plans_taken == 1
+    assert len(cursor.fetchall()) == 39
+    [entry] = slow_log()
+    assert entry['plan'] and 'numbers' in entry['plan'][0]
+    assert conn.plans_taken == 1
+
+
+def test_plan_is_taken_when_the_rows_run_out(conn, slow_log, monkeypatch):
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_SECONDS', 3600)
+    cursor = metrics.execute(conn, SQL, (10,))
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_SECONDS', 1e-9)  # only the fetching counts as slow
+    assert sum(1 for _ in cursor) == 39
+    [entry] = slow_log()
+    assert entry['plan'] and conn.plans_taken == 1
+
+
+def test_released_cursor_does_not_touch_the_connection(conn, slow_log, monkeypatch):
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_SECONDS', 3600)
+    cursor = metrics.execute(conn, SQL, (10,))
+    cursor.fetchone()
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_SECONDS', 1e-9)
+    del cursor  # as the garbage collector would, with conn possibly back in the pool
+    [entry] = slow_log()
+    assert entry['plan'] is None and conn.plans_taken == 0
+
+
+def test_one_plan_per_statement_across_threads(conn):
+    metrics._plans_captured.pop('racing', None)
+    start = threading.Barrier(16)
+    plans = []
+
+    def capture():
+        start.wait()
+        plans.append(metrics._plan(conn, 'racing', SQL, (10,)))
+
+    threads = [threading.Thread(target=capture) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(plan is not None for plan in plans) == 1
@@ -0,0 +1,70 @@
+"""EXPLAIN QUERY PLAN regression tests for the backend's queries.
+
+Literal SQL is collected from the modules by check_query_plans.py; the
+queries app.py assembles at request time are planned here through their
+builders, with every combination of filters the endpoints can produce.
+"""
+import glob
+import os
+
+import pytest
+
+import check_query_plans
+import timeline
+from app import bed_search_query, hospital_list_query
+
+# Tables an indexed lookup should reach by key, never by walking them.
+INDEXED_TABLES = ('hospitals', 'h', 'beds', 'b')
+
+
+@pytest.fixture(scope='module')
+def conn():
+    conn = check_query_plans.migrated_database()
+    yield conn
+    conn.close()
+
+
+def assert_indexed(conn, sql, params):
+    scans, plan = check_query_plans.full_scans(conn, sql, params)
+    details = [row[3] for row in plan]
+    assert not scans, details
+    assert not [d for d in details if d.split(' ')[:2] in (['SCAN', t] for t in INDEXED_TABLES)], details
+
+
+def test_literal_queries_use_indexes():
+    paths = sorted(glob.glob(os.path.join(check_query_plans.BACKEND_DIR, '*.py')))
+    assert check_query_plans.check(paths) == 0
+
+
+@pytest.mark.parametrize('cursor, limit', [(10, 50), (10, None), (None, 50)])
+def test_hospital_pages_seek_by_id(conn, cursor, limit):
+    sql, params = hospital_list_query(['h.*', 'COALESCE(s.available_count, 0) AS available_beds'], cursor, limit)
+    scans, plan = check_query_plans.full_scans(conn, sql, params)
+    assert not scans, plan
+    if cursor is not None:
+        assert any(row[3].startswith('SEARCH h USING INTEGER PRIMARY KEY') for row in plan), plan
+
+
+def test_nearest_hospitals_are_fetched_by_id(conn):
+    assert_indexed(conn, *hospital_list_query(['h.id', 'h.name'], ids=[3, 1, 2]))
+
+
+@pytest.mark.parametrize('location_match', [None, '"city"*'])
+@pytest.mark.parametrize('bed_type', [None, 'ICU'])
+@pytest.mark.parametrize('hospital_ids', [None, [4, 8, 15]])
+@pytest.mark.parametrize('price_filter', [None, 'low', 'high'])
+def test_bed_search_uses_indexes(conn, location_match, bed_type, hospital_ids, price_filter):
+    assert_indexed(conn, *bed_search_query(location_match, bed_type, hospital_ids, price_filter))
+
+
+@pytest.mark.parametrize('types', [None, ['report']])
+@pytest.mark.parametrize('after', [None, ('2024-01-01 00:00:00', 'reservation', 10)])
+def test_timeline_branches_walk_the_event_time_indexes(conn, types, after):
+    sql, params = timeline.events_query(1, types, after)
+    scans, plan = check_query_plans.full_scans(conn, sql, params)
+    details = [row[3] for row in plan]
+    assert not scans, details
+    # Only the merge of the branches sorts; each branch reads its index in order.
+    assert details.count('USE TEMP B-TREE FOR ORDER BY') == 1, details
+    for index in ('idx_appointments_patient_at', 'idx_reservations_patient_at', 'idx_reports_patient_at'):
+        assert any(index in d for d in details) == (types is None or index.endswith('reports_patient_at')), details
@@ -0,0 +1,88 @@
+"""Bed reservations: no overselling under concurrency, and exact refunds on release."""
+import threading
+
+import pytest
+
+import reservations
+from conftest import bearer
+from database import connect
+
+BEDS = 5
+CALLERS = 40
+
+
+def available(db, hospital_id, bed_type='ICU'):
+    return db.execute('SELECT SUM(available_count) FROM beds WHERE hospital_id = ? AND bed_type = ?',
+                      (hospital_id, bed_type)).fetchone()[0]
+
+
+def test_concurrent_reservations_take_exactly_the_free_beds(db, make_hospital, make_user):
+    hospital_id = make_hospital({'ICU': (BEDS, BEDS)})
+    patient = make_user('patient')
+    start = threading.Barrier(CALLERS)
+    outcomes, errors = [], []
+
+    def caller():
+        conn = connect()
+        # Any statement that takes a bed below zero fails its transaction loudly.
+        conn.execute('''CREATE TEMP TRIGGER no_oversell AFTER UPDATE OF available_count ON main.beds
+                        WHEN NEW.available_count < 0 BEGIN SELECT RAISE(ABORT, 'bed count went negative'); END''')
+        try:
+            start.wait()
+            reservations.reserve(conn, patient, hospital_id, 'ICU')
+            outcomes.append('reserved')
+        except reservations.BedUnavailable:
+            outcomes.append('unavailable')
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors, errors
+    assert outcomes.count('reserved') == BEDS
+    assert outcomes.count('unavailable') == CALLERS - BEDS
+    assert available(db, hospital_id) == 0
+    assert db.execute('SELECT COUNT(*) FROM bed_reservations WHERE hospital_id = ?', (hospital_id,)).fetchone()[0] == BEDS
+
+
+def reserve(client, hospital_id, patient):
+    response = client.post('/api/patient/reserve_bed', headers=bearer(patient, 'patient'),
+                           json={'patient_id': patient, 'hospital_id': hospital_id, 'bed_type': 'ICU'})
+    assert response.status_code == 200, response.get_json()
+    return response
+
+
+@pytest.mark.parametrize('release', reservations.RELEASED_STATUSES)
+def test_release_refunds_one_bed_once(client, db, make_hospital, make_user, release):
+    hospital_id = make_hospital({'ICU': (2, 2)})
+    staff = bearer(900, 'hospital_staff', hospital_id)
+    patient = make_user('patient')
+    reserve(client, hospital_id, patient)
+    reserve(client, hospital_id, patient)
+    admitted, released = [row[0] for row in db.execute(
+        'SELECT id FROM bed_reservations WHERE hospital_id = ? ORDER BY id', (hospital_id,))]
+    assert available(db, hospital_id) == 0
+
+    # Confirming keeps the bed taken.
+    assert client.patch(f'/api/hospital/reservations/{admitted}', headers=staff, json={'status': 'Admitted'}).status_code == 200
+    assert available(db, hospital_id) == 0
+
+    assert client.patch(f'/api/hospital/reservations/{released}', headers=staff, json={'status': release}).status_code == 200
+    assert available(db, hospital_id) == 1
+    # Repeating the release, or trying to reopen it, hands back nothing more.
+    assert client.patch(f'/api/hospital/reservations/{released}', headers=staff, json={'status': release}).status_code == 200
+    assert client.patch(f'/api/hospital/reservations/{released}', headers=staff, json={'status': 'Admitted'}).status_code == 409
+    assert available(db, hospital_id) == 1
+
+    # The refunded bed can be booked again, and then the hospital is full.
+    reserve(client, hospital_id, patient)
+    assert available(db, hospital_id) == 0
+    full = client.post('/api/patient/reserve_bed', headers=bearer(patient, 'patient'),
+                       json={'patient_id': patient, 'hospital_id': hospital_id, 'bed_type': 'ICU'})
+    assert full.status_code == 409
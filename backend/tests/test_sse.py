@@ -0,0 +1,71 @@
+"""Live update streams: the Flask endpoint hands clients to the asyncio SSE server."""
+import socket
+import time
+
+import pytest
+
+import events
+import sse
+from conftest import bearer
+
+
+def test_stream_redirects_to_the_sse_server(client, monkeypatch):
+    monkeypatch.setattr(sse, 'SSE_PORT', 9001)
+    response = client.get('/api/stream?hospital_id=1', headers=bearer(900, 'hospital_staff', 1))
+    assert response.status_code == 307
+    assert response.headers['Location'] == 'http://localhost:9001/api/stream?hospital_id=1'
+
+
+def test_stream_is_served_by_flask_when_the_sse_server_is_off(client, monkeypatch):
+    monkeypatch.setattr(sse, 'SSE_PORT', 0)
+    response = client.get('/api/stream?hospital_id=1', headers=bearer(900, 'hospital_staff', 1), buffered=False)
+    try:
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+    finally:
+        response.close()
+
+
+@pytest.fixture
+def sse_server():
+    server = sse.SSEServer(port=0, heartbeat=3600)
+    server.start_in_thread()
+    return server
+
+
+def open_stream(server, query):
+    conn = socket.create_connection((server.host, server.port), timeout=5)
+    conn.sendall(f'GET /api/stream?{query} HTTP/1.1\r\nHost: test\r\n\r\n'.encode())
+    return conn
+
+
+def read_until(conn, marker):
+    data = b''
+    while marker not in data:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def test_sse_server_delivers_published_events(sse_server):
+    headers = bearer(900, 'hospital_staff', 4242)
+    token = headers['Authorization'][len('Bearer '):]
+    with open_stream(sse_server, f'hospital_id=4242&access_token={token}') as conn:
+        assert read_until(conn, b'retry: 3000\n\n').startswith(b'HTTP/1.1 200 OK')
+        deadline = time.monotonic() + 5
+        while not sse_server._clients.get(events.hospital_topic(4242)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        events.bus.publish([events.hospital_topic(4242)], 'beds', bed_type='ICU')
+        assert b'event: beds' in read_until(conn, b'\n\n')
+
+
+def test_sse_server_refuses_a_forged_token(sse_server):
+    with open_stream(sse_server, 'hospital_id=1&access_token=forged.token') as conn:
+        assert read_until(conn, b'\r\n\r\n').startswith(b'HTTP/1.1 401')
+
+
+def test_sse_server_refuses_anonymous_streams(sse_server):
+    with open_stream(sse_server, 'hospital_id=1') as conn:
+        assert read_until(conn, b'\r\n\r\n').startswith(b'HTTP/1.1 401')
@@ -0,0 +1,35 @@
+"""The patient timeline endpoint and its type filter."""
+import pytest
+
+from conftest import bearer
+
+
+@pytest.fixture
+def history(db, make_hospital, make_user):
+    """A patient with one appointment and one bed reservation; returns (patient_id, headers)."""
+    hospital_id, patient = make_hospital(), make_user('patient')
+    db.execute("INSERT INTO appointments (patient_id, hospital_id, doctor_name, date, appointment_date, appointment_no, status) "
+               "VALUES (?, ?, 'Dr Timeline', '2026-03-02', '2026-03-02', 'TL-1', 'Pending')", (patient, hospital_id))
+    db.execute("INSERT INTO bed_reservations (patient_id, hospital_id, bed_type, timestamp, status) "
+               "VALUES (?, ?, 'ICU', '2026-03-01 08:30:00', 'Arrived')", (patient, hospital_id))
+    db.commit()
+    return patient, bearer(patient, 'patient')
+
+
+def events(client, history, query):
+    patient, headers = history
+    response = client.get(f'/api/patient/{patient}/timeline?{query}', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return [(event['type'], event['id']) for event in response.get_json()]
+
+
+def test_repeated_types_return_each_event_once(client, history):
+    everything = events(client, history, '')
+    assert [kind for kind, _ in everything] == ['appointment', 'reservation']
+    assert events(client, history, 'type=appointment,reservation,appointment,reservation') == everything
+    assert events(client, history, 'type=appointment,appointment') == everything[:1]
+
+
+def test_unknown_type_is_refused(client, history):
+    patient, headers = history
+    assert client.get(f'/api/patient/{patient}/timeline?type=appointment,surgery', headers=headers).status_code == 400
@@ -0,0 +1,124 @@
+"""Resumable report uploads and the content-addressed blob store behind them."""
+import hashlib
+import os
+
+import pytest
+
+import blobs
+from conftest import bearer
+
+LAB = bearer(901, 'lab_tech')
+
+
+@pytest.fixture
+def patient(make_user):
+    return make_user('patient')
+
+
+def start(client, patient, content, **fields):
+    response = client.post('/api/lab/uploads', headers=LAB, json={
+        'patient_id': patient, 'file_name': 'scan.pdf', 'size': len(content), 'report_type': 'MRI', **fields})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['upload_id']
+
+
+def send(client, upload_id, offset, chunk):
+    return client.patch(f'/api/lab/uploads/{upload_id}', headers={**LAB, 'Upload-Offset': str(offset)}, data=chunk)
+
+
+def held(client, upload_id):
+    return client.get(f'/api/lab/uploads/{upload_id}', headers=LAB)
+
+
+def test_upload_resumes_from_the_offset_the_server_holds(client, db, patient):
+    content = os.urandom(3000)
+    upload_id = start(client, patient, content)
+    assert send(client, upload_id, 0, content[:1000]).get_json()['received'] == 1000
+
+    # The connection drops; the client asks where to carry on.
+    progress = held(client, upload_id)
+    assert progress.status_code == 200 and progress.headers['Upload-Offset'] == '1000'
+
+    done = send(client, upload_id, 1000, content[1000:])
+    assert done.status_code == 201
+    digest = hashlib.sha256(content).hexdigest()
+    assert done.get_json()['sha256'] == digest
+    with open(blobs.store.path(digest), 'rb') as f:
+        assert f.read() == content
+    row = db.execute('SELECT patient_id, file_size, file_sha256 FROM reports WHERE id = ?', (done.get_json()['report_id'],)).fetchone()
+    assert tuple(row) == (patient, len(content), digest)
+    assert held(client, upload_id).status_code == 404
+
+
+def test_gaps_are_refused_and_repeated_chunks_are_harmless(client, patient):
+    content = os.urandom(3000)
+    upload_id = start(client, patient, content)
+    assert send(client, upload_id, 0, content[:1000]).status_code == 200
+
+    gap = send(client, upload_id, 2000, content[2000:])
+    assert gap.status_code == 409 and gap.headers['Upload-Offset'] == '1000'
+
+    # The first chunk again (its reply was lost), then one that overlaps it.
+    assert send(client, upload_id, 0, content[:1000]).get_json()['received'] == 1000
+    assert send(client, upload_id, 500, content[500:2000]).get_json()['received'] == 2000
+    done = send(client, upload_id, 2000, content[2000:])
+    assert done.status_code == 201
+    assert done.get_json()['sha256'] == hashlib.sha256(content).hexdigest()
+
+
+def test_chunk_past_the_announced_size_is_refused(client, patient):
+    upload_id = start(client, patient, b'x' * 100)
+    assert send(client, upload_id, 50, b'y' * 51).status_code == 413
+
+
+def test_upload_not_matching_its_sha256_is_discarded(client, db, patient):
+    content = os.urandom(2000)
+    upload_id = start(client, patient, content, sha256=hashlib.sha256(b'something else').hexdigest())
+    assert send(client, upload_id, 0, content[:1000]).status_code == 200
+    rejected = send(client, upload_id, 1000, content[1000:])
+    assert rejected.status_code == 422
+    digest = hashlib.sha256(content).hexdigest()
+    assert rejected.get_json()['sha256'] == digest
+    assert not os.path.exists(blobs.store.path(digest))
+    assert held(client, upload_id).status_code == 404
+    assert db.execute('SELECT COUNT(*) FROM reports WHERE file_sha256 = ?', (digest,)).fetchone()[0] == 0
+
+
+def test_upload_matching_its_sha256_is_stored(client, patient):
+    content = os.urandom(1500)
+    digest = hashlib.sha256(content).hexdigest()
+    upload_id = start(client, patient, content, sha256=digest.upper())
+    assert send(client, upload_id, 0, content).get_json()['sha256'] == digest
+
+
+def test_bad_sha256_is_refused(client, patient):
+    response = client.post('/api/lab/uploads', headers=LAB, json={
+        'patient_id': patient, 'file_name': 'scan.pdf', 'size': 10, 'sha256': 'not-a-digest'})
+    assert response.status_code == 400
+
+
+def test_identical_files_are_stored_once(client, db, patient, make_user):
+    content = os.urandom(2500)
+    first = send(client, start(client, patient, content), 0, content).get_json()
+    second_id = start(client, make_user('patient'), content)
+    second = send(client, second_id, 0, content).get_json()
+    assert (first['deduplicated'], second['deduplicated']) == (False, True)
+    assert first['sha256'] == second['sha256'] and first['report_id'] != second['report_id']
+    # The second copy was dropped rather than kept as a partial upload.
+    assert blobs.store.received(second_id) is None
+    paths = db.execute('SELECT DISTINCT file_path FROM reports WHERE id IN (?, ?)', (first['report_id'], second['report_id'])).fetchall()
+    assert [p[0] for p in paths] == [blobs.store.relative_path(first['sha256'])]
+
+
+def test_cancel_discards_the_partial_upload(client, patient):
+    upload_id = start(client, patient, b'z' * 100)
+    assert send(client, upload_id, 0, b'z' * 40).status_code == 200
+    assert client.delete(f'/api/lab/uploads/{upload_id}', headers=LAB).status_code == 200
+    assert blobs.store.received(upload_id) is None
+    assert held(client, upload_id).status_code == 404
+    assert send(client, upload_id, 40, b'z' * 60).status_code == 404
+
+
+def test_cancel_unknown_session_is_404(client):
+    assert client.delete('/api/lab/uploads/0123456789abcdef0123456789abcdef', headers=LAB).status_code == 404
+    assert client.delete('/api/lab/uploads/not-a-session', headers=LAB).status_code == 404
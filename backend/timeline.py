@@ -0,0 +1,91 @@
+"""A patient's appointments, bed reservations and lab reports as one event stream.
+
+Each source contributes rows of the same shape (type, id, at, hospital_id,
+title, status, detail, reference, report_id, report_sha256), newest first by
+`at`, then type and id descending. `at` is always 'YYYY-MM-DD HH:MM:SS' (a
+date-only value becomes midnight) and rows without a usable time are left
+out, so cursors compare the same way in every source. A page is one UNION
+ALL query whose branches each walk their (patient_id, datetime(<time>))
+index down from the cursor and stop after `limit` rows, so the cost does not
+grow with history.
+"""
+from datetime import datetime
+
+# Event type -> (time expression, id column, SELECT of the common event columns, FROM ... WHERE patient filter).
+# The time expression must be the second column of an index on (patient_id, time) in SCHEMA.
+SOURCES = {
+    'appointment': ('datetime(COALESCE(a.date, a.appointment_date))', 'a.id', '''
+        SELECT 'appointment' AS type, a.id, datetime(COALESCE(a.date, a.appointment_date)) AS at, a.hospital_id,
+            a.doctor_name AS title, a.status, NULL AS detail, a.appointment_no AS reference,
+            rp.id AS report_id, rp.file_sha256 AS report_sha256
+        FROM appointments a
+        LEFT JOIN reports rp ON rp.id = (SELECT id FROM reports WHERE appointment_no = a.appointment_no ORDER BY id DESC LIMIT 1)
+        WHERE a.patient_id = ?'''),
+    'reservation': ('datetime(r.timestamp)', 'r.id', '''
+        SELECT 'reservation' AS type, r.id, datetime(r.timestamp) AS at, r.hospital_id, r.bed_type AS title, r.status,
+            r.urgency AS detail, NULL AS reference, NULL AS report_id, NULL AS report_sha256
+        FROM bed_reservations r
+        WHERE r.patient_id = ?'''),
+    'report': ('datetime(r.date_uploaded)', 'r.id', '''
+        SELECT 'report' AS type, r.id, datetime(r.date_uploaded) AS at, r.hospital_id, r.report_name AS title, r.status,
+            r.lab_name AS detail, r.lab_order_id AS reference, r.id AS report_id, r.file_sha256 AS report_sha256
+        FROM reports r
+        WHERE r.patient_id = ?'''),
+}
+
+SCHEMA = '''
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_at ON appointments (patient_id, datetime(COALESCE(date, appointment_date)));
+CREATE INDEX IF NOT EXISTS idx_reservations_patient_at ON bed_reservations (patient_id, datetime(timestamp));
+CREATE INDEX IF NOT EXISTS idx_reports_patient_at ON reports (patient_id, datetime(date_uploaded));
+'''
+
+
+def parse_cursor(cursor):
+    """(at, type, id) from a cursor made by make_cursor; raises ValueError if malformed."""
+    at, kind, event_id = cursor.rsplit('|', 2)
+    datetime.strptime(at, '%Y-%m-%d %H:%M:%S')
+    if kind not in SOURCES:
+        raise ValueError(f'unknown event type {kind!r}')
+    return at, kind, int(event_id)
+
+
+def make_cursor(event):
+    return f"{event['at']}|{event['type']}|{event['id']}"
+
+
+def _branch(kind, after):
+    """One source's page: its rows strictly after the cursor in (at, type, id) descending order."""
+    column, id_column, select = SOURCES[kind]
+    sql, params = select + f' AND {column} IS NOT NULL', []
+    if after:
+        at, after_kind, after_id = after
+        if kind == after_kind:
+            sql += f' AND ({column}, {id_column}) < (?, ?)'
+            params += [at, after_id]
+        else:
+            # Rows with the cursor's time sort after it only if their type sorts lower.
+            sql += f" AND {column} {'<=' if kind < after_kind else '<'} ?"
+            params.append(at)
+    return f'SELECT * FROM ({sql} ORDER BY {column} DESC, {id_column} DESC LIMIT ?)', params
+
+
+def events_query(patient_id, types=None, after=None, limit=50):
+    """(sql, params) for up to `limit` of a patient's events of the given types, after the `after` cursor tuple."""
+    branches, params = [], []
+    # A type named twice would add a second branch and return its events twice.
+    for kind in dict.fromkeys(types or SOURCES):
+        sql, branch_params = _branch(kind, after)
+        branches.append(sql)
+        params += [patient_id, *branch_params, limit]
+    return f'''
+        SELECT e.*, h.name AS hospital_name
+        FROM ({' UNION ALL '.join(branches)}) e
+        LEFT JOIN hospitals h ON h.id = e.hospital_id
+        ORDER BY e.at DESC, e.type DESC, e.id DESC
+        LIMIT ?
+    ''', [*params, limit]
+
+
+def patient_events(conn, patient_id, types=None, after=None, limit=50):
+    """Up to `limit` of a patient's events of the given types, after the `after` cursor tuple."""
+    return conn.execute(*events_query(patient_id, types, after, limit)).fetchall()
@@ -0,0 +1,97 @@
+"""Data-version counters backing ETags on read endpoints.
+
+Triggers bump a per-hospital counter and the global counter whenever a row
+that feeds a hospital's read endpoints changes, and a separate counter when
+users change (patient names appear in reservation/appointment lists). The
+counters live in the database rather than in process memory so every worker
+process sees the same versions, and checking one is a primary-key lookup on
+a tiny table instead of re-running the endpoint's queries.
+"""
+import threading
+import zlib
+
+GLOBAL = 0
+USERS = -1
+
+# Tables whose rows belong to a hospital, with the column naming it.
+_HOSPITAL_TABLES = (
+    ('hospitals', 'id'),
+    ('beds', 'hospital_id'),
+    ('doctors', 'hospital_id'),
+    ('appointments', 'hospital_id'),
+    ('bed_reservations', 'hospital_id'),
+)
+
+
+def _bump(*scopes):
+    values = ', '.join(f'({scope}, 1)' for scope in scopes)
+    return (f'INSERT INTO data_versions (scope, version) VALUES {values} '
+            f'ON CONFLICT (scope) DO UPDATE SET version = version + 1;')
+
+
+def _schema():
+    statements = ['''
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);''']
+    for table, column in _HOSPITAL_TABLES:
+        new = f'COALESCE(NEW.{column}, {GLOBAL})'
+        old = f'COALESCE(OLD.{column}, {GLOBAL})'
+        statements.append(f'''
+CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table}
+BEGIN {_bump(GLOBAL, new)} END;
+CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE ON {table}
+BEGIN {_bump(GLOBAL, old, new)} END;
+CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table}
+BEGIN {_bump(GLOBAL, old)} END;''')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        statements.append(f'''
+CREATE TRIGGER IF NOT EXISTS users_version_{event.lower()} AFTER {event} ON users
+BEGIN {_bump(USERS)} END;''')
+    return '\n'.join(statements) + '\n'
+
+
+SCHEMA = _schema()
+
+
+def current(conn, scopes):
+    """Return the version for each scope (0 for scopes never written)."""
+    placeholders = ', '.join('?' * len(scopes))
+    cur = conn.cursor()
+    cur.row_factory = None
+    found = dict(cur.execute(f'SELECT scope, version FROM data_versions WHERE scope IN ({placeholders})', scopes).fetchall())
+    return [found.get(scope, 0) for scope in scopes]
+
+
+def make_etag(key, scopes, versions):
+    """Strong ETag naming the resource (path + query) and the data versions it was built from."""
+    resource = zlib.crc32(key.encode())
+    state = '.'.join(f'{s}:{v}' for s, v in zip(scopes, versions))
+    return f'{resource:08x}-{state}'
+
+
+class ConditionalStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "not_modified": self.hits,
+                "full_responses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+stats = ConditionalStats()
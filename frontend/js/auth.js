@@ -1,8 +1,40 @@
 
+// -- Session Token --
+// Every API request carries the token /api/login issued; a 401 means it
+// expired or was revoked, so the user logs in again.
+const nativeFetch = window.fetch.bind(window);
+
+window.fetch = async (input, init = {}) => {
+    const token = localStorage.getItem('session');
+    const url = typeof input === 'string' ? input : input.url;
+    if (token && url.includes('/api/')) {
+        const headers = new Headers(init.headers || (input instanceof Request ? input.headers : undefined));
+        if (!headers.has('Authorization')) headers.set('Authorization', `Bearer ${token}`);
+        init = { ...init, headers };
+    }
+    const response = await nativeFetch(input, init);
+    if (response.status === 401 && url.includes('/api/')) {
+        clearSession();
+        window.location.href = '../login.html';
+    }
+    return response;
+};
+
+// EventSource cannot send headers, so streams pass the token as a query parameter.
+function sessionQuery() {
+    const token = localStorage.getItem('session');
+    return token ? `&access_token=${encodeURIComponent(token)}` : '';
+}
+
+function clearSession() {
+    localStorage.removeItem('user');
+    localStorage.removeItem('session');
+}
+
 // -- Check Authentication --
 function checkAuth(requiredRole) {
     const userStr = localStorage.getItem('user');
-    if (!userStr) {
+    if (!userStr || !localStorage.getItem('session')) {
         window.location.href = '../login.html?role=' + requiredRole;
         return;
     }
@@ -17,8 +49,13 @@ function checkAuth(requiredRole) {
 }
 
 // -- Logout Function --
-function logout() {
-    localStorage.removeItem('user');
+async function logout() {
+    try {
+        await fetch(`${API_URL}/logout`, { method: 'POST' });
+    } catch (e) {
+        // Offline: the token still expires on its own.
+    }
+    clearSession();
     window.location.href = '../index.html';
 }
 
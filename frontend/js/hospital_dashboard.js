@@ -1,4 +1,6 @@
 const API_URL = 'http://127.0.0.1:9000/api';
+// Live updates come from the asyncio SSE server (backend/sse.py), not a Flask worker thread.
+const STREAM_URL = 'http://127.0.0.1:9001/api/stream';
 const user = JSON.parse(localStorage.getItem('user'));
 // Fallback logic for legacy users or dev testing: default to hospital_id=1 if not present
 const hospitalId = user?.hospital_id || 1;
@@ -13,12 +15,28 @@ document.addEventListener('DOMContentLoaded', () => {
         userNameEl.innerText = user.full_name || user.username;
     }
     loadDashboardData();
+    subscribeToUpdates();
 });
 
+// --- Live Updates ---
+// The server pushes bed/doctor/reservation/appointment changes for this hospital;
+// bursts of events are coalesced into a single refresh.
+function subscribeToUpdates() {
+    if (!window.EventSource) return;
+    let pending = null;
+    const source = new EventSource(`${STREAM_URL}?hospital_id=${hospitalId}${sessionQuery()}`);
+    ['beds', 'doctor', 'reservation', 'appointment'].forEach(type => {
+        source.addEventListener(type, () => {
+            clearTimeout(pending);
+            pending = setTimeout(loadDashboardData, 250);
+        });
+    });
+}
+
 // --- Dashboard Data ---
 async function loadDashboardData() {
     try {
-        const response = await fetch(`${API_URL}/hospital/${hospitalId}/details?_t=${Date.now()}`);
+        const response = await fetch(`${API_URL}/hospital/${hospitalId}/details`, { cache: 'no-cache' });
         const data = await response.json();
 
         if (data.hospital) {
@@ -276,6 +294,9 @@ document.getElementById('bed-form')?.addEventListener('submit', async (e) => {
         if (res.ok) {
             alert('Bed Inventory Updated');
             loadDashboardData();
+        } else {
+            const data = await res.json().catch(() => ({}));
+            alert(data.error || 'Failed to update bed');
         }
     } catch (err) { console.error(err); alert('Failed to update bed'); }
 });
@@ -319,6 +340,10 @@ document.getElementById('doctor-form')?.addEventListener('submit', async (e) =>
             if (document.getElementById('doc-existing-image')) document.getElementById('doc-existing-image').value = '';
             if (document.getElementById('doc-image-preview')) document.getElementById('doc-image-preview').style.display = 'none';
             loadDashboardData();
+        } else {
+            // e.g. days/hours the server cannot turn into a schedule
+            const data = await res.json().catch(() => ({}));
+            alert(data.error || 'Failed to save doctor');
         }
     } catch (err) { console.error(err); alert('Failed to add doctor'); }
 });
@@ -352,7 +377,7 @@ function renderMockEmergencies() {
 
 async function loadAnalytics() {
     try {
-        const response = await fetch(`${API_URL}/hospital/${hospitalId}/analytics?_t=${Date.now()}`);
+        const response = await fetch(`${API_URL}/hospital/${hospitalId}/analytics`, { cache: 'no-cache' });
         const data = await response.json();
 
         const patientsStat = document.getElementById('stat-patients-served');
@@ -361,6 +386,7 @@ async function loadAnalytics() {
         // Show actual number of patients from the database
         if (patientsStat) patientsStat.innerText = data.patients_served || 0;
         if (peakStat) peakStat.innerText = data.peak_hours || 'N/A';
+        renderAnalyticsDetail(data);
     } catch (err) {
         console.error("Failed to load analytics", err);
         const patientsStat = document.getElementById('stat-patients-served');
@@ -368,6 +394,40 @@ async function loadAnalytics() {
     }
 }
 
+// Occupancy, lab turnaround, hour-of-day profile and daily trend (analytics page only)
+function renderAnalyticsDetail(data) {
+    const occupancy = document.getElementById('stat-occupancy');
+    if (!occupancy) return;
+
+    const percent = value => value === null || value === undefined ? '--' : `${Math.round(value * 100)}%`;
+    occupancy.innerText = `${data.occupancy.occupied} / ${data.occupancy.total} beds`;
+    document.getElementById('stat-utilization').innerText = `Average utilization: ${percent(data.occupancy.average_utilization)}`;
+    document.getElementById('stat-turnaround').innerText =
+        data.lab_turnaround_hours === null ? '--' : `${data.lab_turnaround_hours} h`;
+
+    const busiest = Math.max(1, ...data.hourly_profile);
+    document.getElementById('hourly-profile').innerHTML = data.hourly_profile.map((count, hour) => `
+        <div title="${hour}:00 - ${count}" style="flex: 1; height: ${Math.max(2, count / busiest * 100)}%; background: var(--primary-color); opacity: ${count ? 1 : 0.3}; border-radius: 3px 3px 0 0;"></div>
+    `).join('');
+
+    const tbody = document.getElementById('daily-trend');
+    if (data.daily.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="7" style="text-align: center; color: var(--text-muted);">No activity recorded yet.</td></tr>';
+        return;
+    }
+    tbody.innerHTML = data.daily.slice().reverse().map(d => `
+        <tr>
+            <td>${d.date}</td>
+            <td>${d.appointments}</td>
+            <td>${d.reservations}</td>
+            <td>${d.lab_orders}</td>
+            <td>${d.lab_reports}</td>
+            <td>${d.lab_turnaround_hours === null ? '--' : d.lab_turnaround_hours + ' h'}</td>
+            <td>${d.occupied_peak === null ? '--' : `${d.occupied_peak} (${percent(d.peak_utilization)})`}</td>
+        </tr>
+    `).join('');
+}
+
 async function loadAppointments() {
     const tbody = document.getElementById('appointment-list');
     if (!tbody) return;
@@ -375,7 +435,7 @@ async function loadAppointments() {
     tbody.innerHTML = '<tr><td colspan="5" style="text-align: center; color: var(--text-muted);">Loading...</td></tr>';
 
     try {
-        const res = await fetch(`${API_URL}/hospital/${hospitalId}/appointments?_t=${Date.now()}`);
+        const res = await fetch(`${API_URL}/hospital/${hospitalId}/appointments`, { cache: 'no-cache' });
         const appointments = await res.json();
 
         tbody.innerHTML = '';
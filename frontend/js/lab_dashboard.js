@@ -159,6 +159,48 @@ window.resetSearch = () => {
     document.getElementById('file-name-display').innerText = '';
 }
 
+// Files above this go through a resumable upload session in pieces.
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+async function uploadInChunks(file, fields) {
+    let res = await fetch(`${API_URL}/lab/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...fields, file_name: file.name, size: file.size })
+    });
+    let data = await res.json();
+    if (!res.ok) return { res, data };
+
+    const uploadId = data.upload_id;
+    const chunkSize = data.chunk_size;
+    let offset = 0;
+    let failures = 0;
+    while (true) {
+        try {
+            res = await fetch(`${API_URL}/lab/uploads/${uploadId}`, {
+                method: 'PATCH',
+                headers: { 'Upload-Offset': String(offset) },
+                body: file.slice(offset, offset + chunkSize)
+            });
+            data = await res.json();
+        } catch (err) {
+            // Connection dropped: ask the server how much it kept, then resume.
+            if (++failures > MAX_CHUNK_RETRIES) throw err;
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            res = await fetch(`${API_URL}/lab/uploads/${uploadId}`);
+            data = await res.json();
+            if (!res.ok) return { res, data };
+            offset = data.received;
+            continue;
+        }
+        if (res.status === 201 || (!res.ok && res.status !== 409)) return { res, data };
+        offset = data.received;
+        document.getElementById('file-name-display').innerText =
+            `Uploading ${file.name}: ${Math.floor(100 * offset / file.size)}%`;
+    }
+}
+
 form.addEventListener('submit', async (e) => {
     e.preventDefault();
     const patientId = document.getElementById('patient-id').value;
@@ -170,19 +212,28 @@ form.addEventListener('submit', async (e) => {
         return;
     }
 
-    const formData = new FormData();
-    formData.append('file', fileInput.files[0]);
-    formData.append('patient_id', patientId);
-    if (appointmentNo) formData.append('appointment_no', appointmentNo);
-    formData.append('report_type', reportType);
-    formData.append('lab_name', user.full_name || 'Lab Tech');
+    const file = fileInput.files[0];
+    const fields = {
+        patient_id: patientId,
+        report_type: reportType,
+        lab_name: user.full_name || 'Lab Tech'
+    };
+    if (appointmentNo) fields.appointment_no = appointmentNo;
 
     try {
-        const res = await fetch(`${API_URL}/lab/upload`, {
-            method: 'POST',
-            body: formData
-        });
-        const data = await res.json();
+        let res, data;
+        if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+            ({ res, data } = await uploadInChunks(file, fields));
+        } else {
+            const formData = new FormData();
+            formData.append('file', file);
+            Object.entries(fields).forEach(([key, value]) => formData.append(key, value));
+            res = await fetch(`${API_URL}/lab/upload`, {
+                method: 'POST',
+                body: formData
+            });
+            data = await res.json();
+        }
 
         if (res.ok) {
             alert("Report uploaded successfully to the patient's Health Vault!");
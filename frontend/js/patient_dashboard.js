@@ -1,4 +1,6 @@
 const API_URL = 'http://127.0.0.1:9000/api';
+// Live updates come from the asyncio SSE server (backend/sse.py), not a Flask worker thread.
+const STREAM_URL = 'http://127.0.0.1:9001/api/stream';
 const user = JSON.parse(localStorage.getItem('user'));
 
 if (!user) {
@@ -10,14 +12,24 @@ document.addEventListener('DOMContentLoaded', () => {
     const hospIdEl = document.getElementById('patient-hosp-id');
     if (hospIdEl) hospIdEl.innerText = user.hospitrack_id || 'HT-PENDING';
 
-    loadAppointments();
-    loadReports();
-    loadReservations();
+    loadTimeline();
     setupModals();
     setupTabs();
     searchBeds(); // Load initial beds
+    subscribeToUpdates();
 });
 
+// --- Live Updates ---
+function subscribeToUpdates() {
+    if (!window.EventSource) return;
+    const source = new EventSource(`${STREAM_URL}?patient_id=${user.id}${sessionQuery()}`);
+    source.addEventListener('reservation', () => {
+        loadReservations();
+        searchBeds();
+    });
+    source.addEventListener('appointment', () => loadAppointments());
+}
+
 // --- Modals ---
 function setupModals() {
     // Profile Modal
@@ -97,36 +109,74 @@ async function loadHospitalOptions() {
                 docSelect.innerHTML = doctors.length ? '<option value="">-- Select a Doctor --</option>' : '<option value="">-- No Doctors Available --</option>';
                 doctors.forEach(d => {
                     const opt = document.createElement('option');
-                    opt.value = d.name; // In a full app, we'd use doctor.id, but name is fine for now
+                    opt.value = d.id;
+                    opt.dataset.name = d.name;
                     opt.innerText = `${d.name} (${d.specialization})`;
                     docSelect.appendChild(opt);
                 });
             } catch (err) {
                 docSelect.innerHTML = '<option value="">Error loading doctors</option>';
             }
+            loadSlotOptions();
         });
+        document.getElementById('apt-doctor').addEventListener('change', loadSlotOptions);
+        document.getElementById('apt-date').addEventListener('change', loadSlotOptions);
     } catch (err) {
         console.error("Failed to load hospitals", err);
     }
 }
 
-async function bookAppointment(e) {
-    e.preventDefault();
+// Open slots for the chosen doctor and date
+async function loadSlotOptions() {
     const hospitalId = document.getElementById('apt-hospital').value;
-    const doctorName = document.getElementById('apt-doctor').value;
+    const doctorId = document.getElementById('apt-doctor').value;
     const date = document.getElementById('apt-date').value;
+    const slotSelect = document.getElementById('apt-slot');
+    if (!hospitalId || !doctorId || !date) {
+        slotSelect.innerHTML = '<option value="">-- Choose a Doctor and Date --</option>';
+        return;
+    }
+    slotSelect.innerHTML = '<option value="">Loading...</option>';
+    try {
+        const res = await fetch(`${API_URL}/hospital/${hospitalId}/doctors/${doctorId}/slots?date=${date}`, { cache: 'no-cache' });
+        const data = await res.json();
+        if (res.ok && !data.scheduled) {
+            // No weekly schedule on file: the doctor is booked for the day, not a time.
+            slotSelect.innerHTML = `<option value="${date}">Any time on ${date}</option>`;
+            return;
+        }
+        const open = res.ok ? data.days[0].available : [];
+        slotSelect.innerHTML = open.length ? '<option value="">-- Select a Time --</option>' : '<option value="">-- No Open Slots --</option>';
+        open.forEach(time => {
+            const opt = document.createElement('option');
+            opt.value = `${date}T${time}`;
+            opt.innerText = time;
+            slotSelect.appendChild(opt);
+        });
+    } catch (err) {
+        slotSelect.innerHTML = '<option value="">Error loading slots</option>';
+    }
+}
+
+async function bookAppointment(e) {
+    e.preventDefault();
+    const doctorSelect = document.getElementById('apt-doctor');
+    const slot = document.getElementById('apt-slot').value;
+    // A bare date (no "T") is a day booking for a doctor without slots.
+    const booking = slot.includes('T')
+        ? { patient_id: user.id, doctor_id: Number(doctorSelect.value), slot: slot }
+        : {
+            patient_id: user.id,
+            hospital_id: Number(document.getElementById('apt-hospital').value),
+            doctor_name: doctorSelect.selectedOptions[0].dataset.name,
+            date: slot
+        };
 
     try {
         const res = await fetch(`${API_URL}/patient/appointments`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                patient_id: user.id,
-                hospital_id: hospitalId,
-                doctor_name: doctorName,
-                appointment_date: date,
-                date: date // Keeping date for backwards compatibility with the GET route parsing if needed
-            })
+            body: JSON.stringify(booking)
         });
 
         if (res.ok) {
@@ -134,124 +184,139 @@ async function bookAppointment(e) {
             closeModal('appointment-modal');
             loadAppointments(); // Refresh list
         } else {
-            alert('Booking failed');
+            const data = await res.json();
+            alert(data.error || 'Booking failed');
+            loadSlotOptions(); // Someone else may have taken the slot
         }
     } catch (err) {
         console.error(err);
     }
 }
 
-async function loadAppointments() {
+// --- Timeline ---
+// One request fills the appointment, reservation and report lists; `types` refreshes only some of them.
+async function loadTimeline(types = ['appointment', 'reservation', 'report']) {
+    const renderers = { appointment: renderAppointments, reservation: renderReservations, report: renderReports };
     try {
-        const res = await fetch(`${API_URL}/patient/appointments?patient_id=${user.id}&_t=${Date.now()}`);
-        const appointments = await res.json();
+        const res = await fetch(`${API_URL}/patient/${user.id}/timeline?type=${types.join(',')}&limit=1000`, { cache: 'no-cache' });
+        const events = await res.json();
+        types.forEach(type => renderers[type](events.filter(ev => ev.type === type)));
+    } catch (err) {
+        console.error("Failed to load timeline", err);
+    }
+}
 
-        const list = document.getElementById('appointment-list');
-        if (appointments.length === 0) {
-            list.innerHTML = '<p class="text-muted" style="text-align: center;">No upcoming appointments.</p>';
-            return;
-        }
+function loadAppointments() {
+    return loadTimeline(['appointment']);
+}
 
-        list.innerHTML = appointments.map(apt => `
-            <div class="appointment-card" style="background: rgba(255,255,255,0.02); border: 1px solid var(--border-color); padding: 1.5rem; border-radius: var(--radius-md); margin-bottom: 1rem; display: flex; justify-content: space-between; align-items: center; flex-wrap: wrap; gap: 1rem;">
-                <div style="display: flex; gap: 1rem; align-items: center;">
-                    <div style="background: rgba(0, 200, 83, 0.1); color: var(--success); padding: 1rem; border-radius: 50%; width: 50px; height: 50px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">
-                        <i class="fa-solid fa-user-doctor"></i>
-                    </div>
-                    <div>
-                        <h4 style="margin: 0; font-size: 1.2rem; color: var(--text-main);">${apt.doctor_name}</h4>
-                        <p style="margin: 0; font-size: 0.95rem; color: var(--text-muted);"><i class="fa-regular fa-hospital"></i> ${apt.hospital_name}</p>
-                    </div>
+function loadReservations() {
+    return loadTimeline(['reservation']);
+}
+
+function loadReports() {
+    return loadTimeline(['report']);
+}
+
+function renderAppointments(appointments) {
+    const list = document.getElementById('appointment-list');
+    if (appointments.length === 0) {
+        list.innerHTML = '<p class="text-muted" style="text-align: center;">No upcoming appointments.</p>';
+        return;
+    }
+
+    list.innerHTML = appointments.map(apt => `
+        <div class="appointment-card" style="background: rgba(255,255,255,0.02); border: 1px solid var(--border-color); padding: 1.5rem; border-radius: var(--radius-md); margin-bottom: 1rem; display: flex; justify-content: space-between; align-items: center; flex-wrap: wrap; gap: 1rem;">
+            <div style="display: flex; gap: 1rem; align-items: center;">
+                <div style="background: rgba(0, 200, 83, 0.1); color: var(--success); padding: 1rem; border-radius: 50%; width: 50px; height: 50px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">
+                    <i class="fa-solid fa-user-doctor"></i>
                 </div>
-                <div style="text-align: right;">
-                    <div style="font-weight: bold; color: var(--text-main); font-size: 1.1rem; margin-bottom: 0.3rem;"><i class="fa-regular fa-calendar"></i> ${new Date(apt.date).toLocaleDateString(undefined, { weekday: 'short', month: 'short', day: 'numeric' })}</div>
-                    <span style="font-size: 0.8rem; padding: 0.3rem 0.8rem; background: rgba(0,229,255,0.1); color: var(--primary-color); border-radius: 20px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.05em;">${apt.status}</span>
+                <div>
+                    <h4 style="margin: 0; font-size: 1.2rem; color: var(--text-main);">${apt.title}</h4>
+                    <p style="margin: 0; font-size: 0.95rem; color: var(--text-muted);"><i class="fa-regular fa-hospital"></i> ${apt.hospital_name}</p>
                 </div>
             </div>
-        `).join('');
-
-    } catch (err) {
-        console.error("Failed to load appointments", err);
-    }
+            <div style="text-align: right;">
+                <div style="font-weight: bold; color: var(--text-main); font-size: 1.1rem; margin-bottom: 0.3rem;"><i class="fa-regular fa-calendar"></i> ${new Date(apt.at).toLocaleDateString(undefined, { weekday: 'short', month: 'short', day: 'numeric' })}</div>
+                <span style="font-size: 0.8rem; padding: 0.3rem 0.8rem; background: rgba(0,229,255,0.1); color: var(--primary-color); border-radius: 20px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.05em;">${apt.status}</span>
+            </div>
+        </div>
+    `).join('');
 }
 
-async function loadReservations() {
-    try {
-        const res = await fetch(`${API_URL}/patient/reservations?patient_id=${user.id}&_t=${Date.now()}`);
-        const reservations = await res.json();
+function renderReservations(reservations) {
+    const list = document.getElementById('reservation-list');
+    if (reservations.length === 0) {
+        list.innerHTML = '<p class="text-muted" style="text-align: center;">No active bed reservations.</p>';
+        return;
+    }
 
-        const list = document.getElementById('reservation-list');
-        if (reservations.length === 0) {
-            list.innerHTML = '<p class="text-muted" style="text-align: center;">No active bed reservations.</p>';
-            return;
+    list.innerHTML = reservations.map(r => {
+        let color = 'var(--primary-color)';
+        let bg = 'rgba(0, 229, 255, 0.1)';
+        if (r.status === 'Arrived') {
+            color = 'var(--success)';
+            bg = 'rgba(0, 200, 83, 0.1)';
+        } else if (r.status === 'Cancelled' || r.status === 'Rejected') {
+            color = 'var(--danger)';
+            bg = 'rgba(255, 82, 82, 0.1)';
         }
-
-        list.innerHTML = reservations.map(r => {
-            let color = 'var(--primary-color)';
-            let bg = 'rgba(0, 229, 255, 0.1)';
-            if (r.status === 'Arrived') {
-                color = 'var(--success)';
-                bg = 'rgba(0, 200, 83, 0.1)';
-            } else if (r.status === 'Cancelled' || r.status === 'Rejected') {
-                color = 'var(--danger)';
-                bg = 'rgba(255, 82, 82, 0.1)';
-            }
-            return `
-            <div class="appointment-card" style="background: rgba(255,255,255,0.02); border: 1px solid ${color}; padding: 1.5rem; border-radius: var(--radius-md); display: flex; justify-content: space-between; align-items: center; flex-wrap: wrap; gap: 1rem; margin-bottom: 1rem;">
-                <div style="display: flex; gap: 1rem; align-items: center;">
-                    <div style="background: ${bg}; color: ${color}; padding: 1rem; border-radius: 50%; width: 50px; height: 50px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">
-                        <i class="fa-solid fa-bed-pulse"></i>
-                    </div>
-                    <div>
-                        <h4 style="margin: 0; font-size: 1.2rem; color: var(--text-main);">${r.bed_type}</h4>
-                        <p style="margin: 0; font-size: 0.95rem; color: var(--text-muted);"><i class="fa-regular fa-hospital"></i> ${r.hospital_name}</p>
-                    </div>
+        return `
+        <div class="appointment-card" style="background: rgba(255,255,255,0.02); border: 1px solid ${color}; padding: 1.5rem; border-radius: var(--radius-md); display: flex; justify-content: space-between; align-items: center; flex-wrap: wrap; gap: 1rem; margin-bottom: 1rem;">
+            <div style="display: flex; gap: 1rem; align-items: center;">
+                <div style="background: ${bg}; color: ${color}; padding: 1rem; border-radius: 50%; width: 50px; height: 50px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">
+                    <i class="fa-solid fa-bed-pulse"></i>
                 </div>
-                <div style="text-align: right;">
-                    <div style="font-weight: bold; color: var(--text-main); font-size: 1.1rem; margin-bottom: 0.3rem;"><i class="fa-solid fa-clock"></i> ${new Date(r.timestamp).toLocaleString(undefined, {
-                month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit'
-            })}</div>
-                    <span style="font-size: 0.8rem; padding: 0.3rem 0.8rem; background: ${bg}; color: ${color}; border-radius: 20px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.05em;">${r.status}</span>
+                <div>
+                    <h4 style="margin: 0; font-size: 1.2rem; color: var(--text-main);">${r.title}</h4>
+                    <p style="margin: 0; font-size: 0.95rem; color: var(--text-muted);"><i class="fa-regular fa-hospital"></i> ${r.hospital_name}</p>
                 </div>
-            </div>`;
-        }).join('');
-    } catch (err) {
-        console.error("Failed to load reservations", err);
-    }
+            </div>
+            <div style="text-align: right;">
+                <div style="font-weight: bold; color: var(--text-main); font-size: 1.1rem; margin-bottom: 0.3rem;"><i class="fa-solid fa-clock"></i> ${new Date(r.at).toLocaleString(undefined, {
+            month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit'
+        })}</div>
+                <span style="font-size: 0.8rem; padding: 0.3rem 0.8rem; background: ${bg}; color: ${color}; border-radius: 20px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.05em;">${r.status}</span>
+            </div>
+        </div>`;
+    }).join('');
 }
 
 // --- Reports ---
-async function loadReports() {
-    // Currently fetching from hardcoded or dummy endpoint if not implemented fully
-    // But we added the endpoint, so let's try to use it
-    try {
-        const res = await fetch(`${API_URL}/patient/reports?patient_id=${user.id}`);
-        const reports = await res.json();
-        const tbody = document.querySelector('#reports-table tbody');
-
-        if (reports.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="4" style="text-align:center; padding: 2rem;">No vault items found.</td></tr>';
-            return;
-        }
+function renderReports(reports) {
+    const tbody = document.querySelector('#reports-table tbody');
 
-        tbody.innerHTML = reports.map(r => `
-             <tr>
-                <td style="font-weight: 600; font-size: 1.05rem; display: flex; align-items: center; gap: 0.8rem;">
-                    <i class="fa-solid fa-file-pdf" style="color: var(--danger); font-size: 1.5rem;"></i>
-                    ${r.report_name}
-                </td>
-                <td style="color: var(--text-muted);">${r.date_uploaded}</td>
-                <td style="color: var(--text-muted);"><span style="background: rgba(255,255,255,0.1); padding: 0.3rem 0.6rem; border-radius: var(--radius-md); font-size: 0.85rem;">${r.lab_name}</span></td>
-                <td style="text-align: right;"><button class="btn-primary" style="padding: 0.5rem 1rem; border-radius: 20px; font-size: 0.85rem;" onclick="window.open('${r.file_path}')"><i class="fa-solid fa-cloud-arrow-down"></i> Download</button></td>
-            </tr>
-        `).join('');
-
-    } catch (err) {
-        console.error("Failed to load reports", err);
+    if (reports.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="4" style="text-align:center; padding: 2rem;">No vault items found.</td></tr>';
+        return;
     }
+
+    tbody.innerHTML = reports.map(r => `
+         <tr>
+            <td style="font-weight: 600; font-size: 1.05rem; display: flex; align-items: center; gap: 0.8rem;">
+                <i class="fa-solid fa-file-pdf" style="color: var(--danger); font-size: 1.5rem;"></i>
+                ${r.title}
+            </td>
+            <td style="color: var(--text-muted);">${r.at}</td>
+            <td style="color: var(--text-muted);"><span style="background: rgba(255,255,255,0.1); padding: 0.3rem 0.6rem; border-radius: var(--radius-md); font-size: 0.85rem;">${r.detail}</span></td>
+            <td style="text-align: right;"><button class="btn-primary" style="padding: 0.5rem 1rem; border-radius: 20px; font-size: 0.85rem;" onclick="window.open('${r.file_url}')" ${r.file_url ? '' : 'disabled'}><i class="fa-solid fa-cloud-arrow-down"></i> Download</button></td>
+        </tr>
+    `).join('');
 }
 
 // --- Bed Search & Reservations ---
+// Resolves to the browser's position, or null if it is unavailable or denied
+function getPosition() {
+    return new Promise(resolve => {
+        if (!navigator.geolocation) return resolve(null);
+        navigator.geolocation.getCurrentPosition(
+            position => resolve(position.coords),
+            () => resolve(null),
+            { maximumAge: 300000, timeout: 5000 }
+        );
+    });
+}
+
 window.searchBeds = async () => {
     const list = document.getElementById('bed-results');
     list.innerHTML = '<p style="color: var(--text-muted); padding: 1rem;">Searching for beds...</p>';
@@ -265,6 +330,12 @@ window.searchBeds = async () => {
         if (loc) query.append('location', loc);
         if (type) query.append('type', type);
         if (price) query.append('price', price);
+        // With a position the server returns the nearest hospitals, closest first
+        const coords = await getPosition();
+        if (coords) {
+            query.append('lat', coords.latitude);
+            query.append('lon', coords.longitude);
+        }
 
         const res = await fetch(`${API_URL}/patient/search_beds?${query.toString()}`);
         const beds = await res.json();
@@ -279,7 +350,7 @@ window.searchBeds = async () => {
                 <div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 1rem;">
                     <div>
                         <h3 style="font-size: 1.3rem; margin-bottom: 0.3rem;">${bed.hospital_name}</h3>
-                        <p style="color: var(--text-muted); font-size: 0.9rem;"><i class="fa-solid fa-location-dot"></i> ${bed.distance} &bull; <i class="fa-solid fa-star" style="color: var(--warning);"></i> ${bed.rating}</p>
+                        <p style="color: var(--text-muted); font-size: 0.9rem;"><i class="fa-solid fa-location-dot"></i> ${bed.distance || bed.hospital_location} &bull; <i class="fa-solid fa-star" style="color: var(--warning);"></i> ${bed.rating}</p>
                     </div>
                     <div style="background: rgba(255, 82, 82, 0.1); color: var(--danger); font-weight: 700; padding: 0.5rem 0.8rem; border-radius: var(--radius-md); text-align: center;">
                         <div style="font-size: 1.5rem; line-height: 1;">${bed.available_count}</div>